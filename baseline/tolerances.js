@@ -73,6 +73,7 @@ const tolerances = [
     id: 'skip-metadata-ops',
     description: 'CapabilityStatement/metadata responses differ by design between implementations',
     kind: 'equiv-autofix',
+    selector: { urlContains: '/metadata' },
     match({ record }) {
       return /\/metadata/.test(record.url) ? 'skip' : null;
     },
@@ -81,6 +82,7 @@ const tolerances = [
     id: 'skip-root-page',
     description: 'Root page (/) differs by design between implementations',
     kind: 'equiv-autofix',
+    selector: { op: 'other' },
     match({ record }) {
       return /^\/r[345]\/$/.test(record.url) ? 'skip' : null;
     },
@@ -89,6 +91,7 @@ const tolerances = [
     id: 'skip-static-assets',
     description: 'Static asset requests like icons differ by design',
     kind: 'equiv-autofix',
+    selector: { urlContains: ['.png', '.ico', '.css', '.js'] },
     match({ record }) {
       return /\.(png|ico|css|js)$/.test(record.url) ? 'skip' : null;
     },
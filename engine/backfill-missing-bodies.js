@@ -6,16 +6,34 @@
  * Finds records where prodBody/devBody are absent, replays the request against
  * both prod and dev servers, and writes a patched copy of the file.
  *
+ * Responses are stored in the on-disk fetch cache shared with
+ * backfill-truncated.py (see fetch-cache.js). If a run dies partway, the
+ * next run replays every response already fetched from the cache and only
+ * goes to the servers for the rest. The rewrite pass is local, so the cache
+ * is all that is needed to resume.
+ *
+ * The file may be a seekable comparison.ndjson.gz (see seekable-gzip.js);
+ * the patched copy is then written compressed the same way.
+ *
  * Usage:
  *   node engine/backfill-missing-bodies.js <comparison.ndjson>
  *   node engine/backfill-missing-bodies.js <comparison.ndjson> --concurrency 4
  *   node engine/backfill-missing-bodies.js <comparison.ndjson> --dry-run
+ *
+ * Options:
+ *   --cache-dir DIR   response cache location (default .cache/fetch)
+ *   --no-cache        neither read nor write the response cache
+ *   --prod-base URL   override the prod server (e.g. a local stub)
+ *   --dev-base URL    override the dev server
  */
 
 const fs = require('fs');
 const readline = require('readline');
 const crypto = require('crypto');
 const path = require('path');
+const { once } = require('events');
+const { FetchCache, DEFAULT_CACHE_DIR } = require('./fetch-cache');
+const { createReadStream, isSeekableGzip, SeekableGzipWriter } = require('./seekable-gzip');
 
 const PROD_BASE = 'https://tx.fhir.org';
 const DEV_BASE = 'https://tx-dev.fhir.org';
@@ -27,7 +45,23 @@ function md5Hex(text) {
   return crypto.createHash('md5').update(text || '', 'utf8').digest('hex');
 }
 
-async function fetchOne(base, record, timeoutMs) {
+function cachedResult(entry) {
+  return {
+    status: entry.status,
+    contentType: entry.contentType,
+    size: Buffer.byteLength(entry.body, 'utf8'),
+    hash: md5Hex(entry.body),
+    body: entry.body,
+    cached: true,
+  };
+}
+
+async function fetchOne(base, record, timeoutMs, cache) {
+  if (cache) {
+    const entry = cache.get(base, record);
+    if (entry) return cachedResult(entry);
+  }
+
   const target = new URL(record.url, base).toString();
   const method = (record.method || 'GET').toUpperCase();
   const headers = { Accept: 'application/fhir+json' };
@@ -46,6 +80,14 @@ async function fetchOne(base, record, timeoutMs) {
     const res = await fetch(target, init);
     const body = await res.text();
     const contentType = res.headers.get('content-type') || '';
+    if (cache) {
+      try {
+        cache.put(base, record, res.status, contentType, body);
+      } catch (err) {
+        // The response is still good; it just won't be replayed on a re-run
+        console.error(`  cache write failed for ${record.url.slice(0, 80)}: ${err.message}`);
+      }
+    }
     return {
       status: res.status,
       contentType,
@@ -67,12 +109,19 @@ function sleep(ms) {
 async function main() {
   const args = process.argv.slice(2);
   const dryRun = args.includes('--dry-run');
-  const concIdx = args.indexOf('--concurrency');
-  const concurrency = concIdx >= 0 ? parseInt(args[concIdx + 1], 10) : DEFAULT_CONCURRENCY;
-  const filePath = args.find(a => !a.startsWith('--') && (concIdx < 0 || a !== args[concIdx + 1]));
+  const valueFlags = ['--concurrency', '--cache-dir', '--prod-base', '--dev-base'];
+  const getArg = (flag, def) => {
+    const i = args.indexOf(flag);
+    return i >= 0 && i + 1 < args.length ? args[i + 1] : def;
+  };
+  const concurrency = parseInt(getArg('--concurrency', DEFAULT_CONCURRENCY), 10);
+  const prodBase = getArg('--prod-base', PROD_BASE);
+  const devBase = getArg('--dev-base', DEV_BASE);
+  const cache = args.includes('--no-cache') ? null : new FetchCache(getArg('--cache-dir', DEFAULT_CACHE_DIR));
+  const filePath = args.find((a, i) => !a.startsWith('--') && !valueFlags.includes(args[i - 1]));
 
   if (!filePath) {
-    console.error('Usage: node engine/backfill-missing-bodies.js <comparison.ndjson> [--concurrency N] [--dry-run]');
+    console.error('Usage: node engine/backfill-missing-bodies.js <comparison.ndjson> [--concurrency N] [--dry-run] [--cache-dir DIR | --no-cache]');
     process.exit(1);
   }
 
@@ -80,7 +129,7 @@ async function main() {
   console.log(`Scanning ${filePath} for records with missing bodies...`);
   const missing = new Map(); // id -> { record, lineNum }
   let lineNum = 0;
-  const rl = readline.createInterface({ input: fs.createReadStream(filePath) });
+  const rl = readline.createInterface({ input: createReadStream(filePath) });
   for await (const line of rl) {
     const hasProdBody = line.includes('"prodBody"');
     const hasDevBody = line.includes('"devBody"');
@@ -118,8 +167,8 @@ async function main() {
       const { record } = entries[idx];
 
       const [prodResult, devResult] = await Promise.all([
-        fetchOne(PROD_BASE, record, DEFAULT_TIMEOUT_MS),
-        fetchOne(DEV_BASE, record, DEFAULT_TIMEOUT_MS),
+        fetchOne(prodBase, record, DEFAULT_TIMEOUT_MS, cache),
+        fetchOne(devBase, record, DEFAULT_TIMEOUT_MS, cache),
       ]);
 
       completed++;
@@ -154,7 +203,8 @@ async function main() {
         console.log(`  Replayed: ${completed}/${entries.length} (${patched} patched, ${failed} failed)`);
       }
 
-      await sleep(DELAY_MS);
+      // Only be polite when we actually hit the servers
+      if (!prodResult.cached || !devResult.cached) await sleep(DELAY_MS);
     }
   }
 
@@ -162,16 +212,18 @@ async function main() {
   await Promise.all(workers);
 
   console.log(`\nReplay done. Patched ${patched}, failed ${failed}.`);
+  if (cache) console.log(`Cache: ${cache.hits} replayed, ${cache.stores} stored (${cache.cacheDir})`);
   if (patched === 0) return;
 
   // Pass 2: stream-read original file, write patched copy, then rename
   const tmpPath = filePath + '.tmp';
   console.log(`Writing patched file to ${tmpPath}...`);
-  const rl2 = readline.createInterface({ input: fs.createReadStream(filePath) });
-  const out = fs.createWriteStream(tmpPath);
+  const rl2 = readline.createInterface({ input: createReadStream(filePath) });
+  const out = isSeekableGzip(filePath) ? new SeekableGzipWriter(tmpPath) : fs.createWriteStream(tmpPath);
   let patchedCount = 0;
 
   for await (const line of rl2) {
+    let text = line;
     // Quick check: does this line's id match any patch?
     const hasProdBody = line.includes('"prodBody"');
     const hasDevBody = line.includes('"devBody"');
@@ -179,12 +231,11 @@ async function main() {
       // Extract id without full parse
       const m = line.match(/"id":"([^"]+)"/);
       if (m && patchMap.has(m[1])) {
-        out.write(patchMap.get(m[1]) + '\n');
+        text = patchMap.get(m[1]);
         patchedCount++;
-        continue;
       }
     }
-    out.write(line + '\n');
+    if (!out.write(text + '\n')) await once(out, 'drain');
   }
 
   await new Promise(resolve => out.end(resolve));
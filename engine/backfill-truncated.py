@@ -6,158 +6,271 @@ Reads an input NDJSON file, identifies records where prodBody or devBody
 are exactly 5,000,000 chars (truncation marker), re-fetches the response
 from the live server, and writes the complete record to the output file.
 
+Re-fetches run concurrently (see tx_fetch.py): prod and dev each get their own
+worker pool, token-bucket rate limit and keep-alive connections, and a record's
+prod and dev requests are issued in parallel. Records are written in input
+order, so the output is identical regardless of concurrency.
+
+The file is processed in a single streaming pass. A JSON string of N chars
+takes at least N bytes on the line, so any line shorter than the truncation
+threshold cannot hold a truncated body: it is copied through verbatim without
+being decoded. Only long lines are parsed, and only records that are actually
+re-fetched are re-serialized.
+
+The input may be a seekable gzip (comparison.ndjson.gz, see seekable_gzip.py);
+an output path ending in .gz is written in the same format. Offsets in the
+checkpoint are then into the uncompressed input and the compressed output.
+
+Re-runs are resumable. Every fetched response is stored in an on-disk cache
+shared with backfill-missing-bodies.js (see fetch_cache.py), and
+<output>.checkpoint records the input/output offsets of the last record
+written. A re-run with the same input picks up from the checkpoint and replays
+cached responses instead of hitting the servers again; the checkpoint is
+removed once the run completes. The checkpoint never moves past a record with
+a failed fetch, and is kept when a run ends with failures, so a re-run
+retries them (and replays the records after them from the cache).
+
 Usage:
   python3 engine/backfill-truncated.py <input.ndjson> <output.ndjson> [--dry-run]
+      [--concurrency N] [--rate R] [--cache-dir DIR | --no-cache] [--restart]
+      [--prod-base URL] [--dev-base URL]
+
+  --concurrency N   max in-flight requests per server (default 4)
+  --rate R          max requests/sec per server, 0 = unlimited (default 2)
+  --cache-dir DIR   response cache location (default .cache/fetch)
+  --no-cache        neither read nor write the response cache
+  --restart         ignore any checkpoint and start from the top
+  --prod-base URL   override the prod server (e.g. a local stub)
+  --dev-base URL    override the dev server
 
 Servers:
   prod: https://tx.fhir.org
   dev:  https://tx-dev.fhir.org
 """
 
+import collections
 import json
+import os
 import sys
-import hashlib
 import time
-import urllib.request
-import urllib.error
+
+from fetch_cache import FetchCache, DEFAULT_CACHE_DIR
+from seekable_gzip import SeekableGzipWriter, iter_lines
+from tx_fetch import Fetcher, PROD_BASE, DEV_BASE
 
 TRUNCATION_THRESHOLD = 5_000_000
-PROD_BASE = "https://tx.fhir.org"
-DEV_BASE = "https://tx-dev.fhir.org"
-TIMEOUT = 60  # seconds per request
-
-def fetch_response(base_url, record):
-    """Re-fetch a response from the given server."""
-    url = base_url + record["url"]
-    method = record["method"]
-    headers = {
-        "Accept": "application/fhir+json",
-    }
-
-    req_body = None
-    if method == "POST":
-        headers["Content-Type"] = "application/fhir+json"
-        rb = record.get("requestBody")
-        if rb:
-            req_body = rb.encode("utf-8")
-        else:
-            return None, "no requestBody stored for POST"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 2.0  # requests/sec per server (was a fixed 0.5s sleep)
+MAX_PENDING = 1000  # records buffered behind a slow fetch before reading blocks
+CHECKPOINT_INTERVAL = 5  # seconds between checkpoint writes
+VALUE_FLAGS = ("--concurrency", "--rate", "--cache-dir", "--prod-base", "--dev-base")
+
+
+def get_arg(flag, default):
+    if flag in sys.argv:
+        i = sys.argv.index(flag)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
 
-    req = urllib.request.Request(url, data=req_body, headers=headers, method=method)
+
+def apply_result(rec, side, result):
+    """Patch a record's <side>Body and <side> metadata with a fetch result."""
+    rec[f"{side}Body"] = result["body"]
+    rec[side]["size"] = result["size"]
+    rec[side]["hash"] = result["hash"]
+    rec[side]["status"] = result["status"]
+    rec[side]["contentType"] = result["contentType"]
+
+
+def load_checkpoint(checkpoint_path, input_path, output_path):
+    """Return the saved checkpoint if it belongs to this input and output, else None."""
     try:
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
-            body = resp.read().decode("utf-8")
-            status = resp.status
-            content_type = resp.headers.get("Content-Type", "")
-            return {
-                "body": body,
-                "status": status,
-                "contentType": content_type,
-                "size": len(body),
-                "hash": hashlib.md5(body.encode("utf-8")).hexdigest(),
-            }, None
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8")
-        return {
-            "body": body,
-            "status": e.code,
-            "contentType": e.headers.get("Content-Type", ""),
-            "size": len(body),
-            "hash": hashlib.md5(body.encode("utf-8")).hexdigest(),
-        }, None
-    except Exception as e:
-        return None, str(e)
+        with open(checkpoint_path) as f:
+            cp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    st = os.stat(input_path)
+    if (cp.get("input") != os.path.abspath(input_path) or cp.get("inputSize") != st.st_size
+            or cp.get("inputMtimeNs") != st.st_mtime_ns):
+        print(f"Ignoring stale checkpoint {checkpoint_path} (input changed)")
+        return None
+    if not os.path.exists(output_path) or os.path.getsize(output_path) < cp["outputOffset"]:
+        print(f"Ignoring checkpoint {checkpoint_path} (output is missing or short)")
+        return None
+    return cp
+
+
+def save_checkpoint(checkpoint_path, cp):
+    tmp = checkpoint_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cp, f, indent=2)
+    os.replace(tmp, checkpoint_path)
 
 
 def main():
-    if len(sys.argv) < 3:
+    args = []
+    argv = iter(sys.argv[1:])
+    for a in argv:
+        if a in VALUE_FLAGS:
+            next(argv, None)
+        elif not a.startswith("--"):
+            args.append(a)
+    if len(args) < 2:
         print(__doc__)
         sys.exit(1)
 
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
+    input_path = args[0]
+    output_path = args[1]
     dry_run = "--dry-run" in sys.argv
+    concurrency = int(get_arg("--concurrency", DEFAULT_CONCURRENCY))
+    rate = float(get_arg("--rate", DEFAULT_RATE))
+    prod_base = get_arg("--prod-base", PROD_BASE)
+    dev_base = get_arg("--dev-base", DEV_BASE)
+    cache = None if "--no-cache" in sys.argv else FetchCache(get_arg("--cache-dir", DEFAULT_CACHE_DIR))
+    checkpoint_path = output_path + ".checkpoint"
 
-    # First pass: count truncated records
-    total = 0
-    prod_trunc = 0
-    dev_trunc = 0
-    req_trunc = 0
-
-    with open(input_path) as f:
-        for line in f:
-            total += 1
-            r = json.loads(line)
-            if len(r.get("prodBody", "")) == TRUNCATION_THRESHOLD:
-                prod_trunc += 1
-            if len(r.get("devBody", "")) == TRUNCATION_THRESHOLD:
-                dev_trunc += 1
-            if len(r.get("requestBody", "")) == TRUNCATION_THRESHOLD:
-                req_trunc += 1
-
-    print(f"Total records: {total:,}")
-    print(f"Truncated prodBody: {prod_trunc}")
-    print(f"Truncated devBody: {dev_trunc}")
-    print(f"Truncated requestBody: {req_trunc} (cannot backfill - inputs not reproducible)")
-    print()
+    # Counters cover committed (written) records only, so they can be saved
+    # in the checkpoint alongside the offsets.
+    stats = {"total": 0, "prodTrunc": 0, "devTrunc": 0, "reqTrunc": 0,
+             "backfilledProd": 0, "backfilledDev": 0, "failed": 0}
+    input_offset = 0
+    cp = None
+    if not dry_run and "--restart" not in sys.argv:
+        cp = load_checkpoint(checkpoint_path, input_path, output_path)
+    if cp:
+        stats.update(cp["stats"])
+        input_offset = cp["inputOffset"]
+        print(f"Resuming from checkpoint: {stats['total']:,} records already written")
+    elif not dry_run and os.path.exists(checkpoint_path):
+        # Stale or skipped: it must not outlive this run if this run never saves one
+        os.remove(checkpoint_path)
 
-    if dry_run:
-        print("Dry run - no changes made.")
-        return
+    window = concurrency * 4
+    pending = collections.deque()  # (line_num, raw, end offset, rec or None, trunc flags, {side: future})
+    in_flight = 0  # pending records with outstanding fetches
+    last_checkpoint = time.monotonic()
+    first_failed = None  # line number of the first record with a failed fetch
+
+    def count(flags):
+        stats["total"] += 1
+        stats["prodTrunc"] += flags[0]
+        stats["devTrunc"] += flags[1]
+        stats["reqTrunc"] += flags[2]
 
-    # Second pass: copy records, backfilling truncated bodies
-    backfilled_prod = 0
-    backfilled_dev = 0
-    failed = 0
-    line_num = 0
+    def flush_head():
+        nonlocal in_flight, last_checkpoint, first_failed
+        num, raw, end_offset, rec, flags, futures = pending.popleft()
+        count(flags)
+        if not futures:
+            fout.write(raw)
+        else:
+            in_flight -= 1
+            for side, fut in futures.items():
+                result, err = fut.result()
+                source = "cache" if result and result["cached"] else "server"
+                print(f"[{num}] {rec['id']}: re-fetched {side} from {source} {rec['method']} {rec['url'][:80]}...", end=" ")
+                if result:
+                    apply_result(rec, side, result)
+                    stats["backfilledProd" if side == "prod" else "backfilledDev"] += 1
+                    print(f"OK ({result['size']:,} chars, status {result['status']})", flush=True)
+                else:
+                    stats["failed"] += 1
+                    first_failed = first_failed or num
+                    print(f"FAILED: {err}", flush=True)
+            fout.write(json.dumps(rec, separators=(",", ":")).encode("utf-8") + b"\n")
+        # Past a failed record the checkpoint stays put, so a resumed run retries it
+        if not first_failed and time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+            fout.flush()
+            st = os.stat(input_path)
+            save_checkpoint(checkpoint_path, {
+                "input": os.path.abspath(input_path),
+                "inputSize": st.st_size,
+                "inputMtimeNs": st.st_mtime_ns,
+                "inputOffset": end_offset,
+                "outputOffset": fout.tell(),
+                "stats": stats,
+            })
+            last_checkpoint = time.monotonic()
 
-    with open(input_path) as fin, open(output_path, "w") as fout:
-        for line in fin:
+    if dry_run:
+        fout = None
+    elif cp:
+        fout = open(output_path, "r+b")
+        fout.truncate(cp["outputOffset"])
+        fout.seek(cp["outputOffset"])
+    else:
+        fout = open(output_path, "wb")
+    if fout and output_path.endswith(".gz"):
+        # Checkpoints flush, which ends a frame, so outputOffset is always a
+        # frame boundary to truncate to and append from
+        fout = SeekableGzipWriter(fout)
+    fetcher = None if dry_run else Fetcher([prod_base, dev_base], concurrency=concurrency,
+                                           rate=rate, cache=cache)
+    try:
+        offset = input_offset
+        line_num = stats["total"]
+        for raw in iter_lines(input_path, input_offset):
+            offset += len(raw)
             line_num += 1
-            rec = json.loads(line)
+            rec = None
+            flags = (False, False, False)
+            futures = {}
+            if len(raw) >= TRUNCATION_THRESHOLD:
+                rec = json.loads(raw)
+                flags = (len(rec.get("prodBody", "")) == TRUNCATION_THRESHOLD,
+                         len(rec.get("devBody", "")) == TRUNCATION_THRESHOLD,
+                         len(rec.get("requestBody", "")) == TRUNCATION_THRESHOLD)
+                if fetcher and flags[0]:
+                    futures["prod"] = fetcher.submit(prod_base, rec)
+                if fetcher and flags[1]:
+                    futures["dev"] = fetcher.submit(dev_base, rec)
+            if dry_run:
+                count(flags)
+                continue
 
-            prod_is_trunc = len(rec.get("prodBody", "")) == TRUNCATION_THRESHOLD
-            dev_is_trunc = len(rec.get("devBody", "")) == TRUNCATION_THRESHOLD
+            pending.append((line_num, raw, offset, rec if futures else None, flags, futures))
+            if futures:
+                in_flight += 1
 
-            if prod_is_trunc:
-                print(f"[{line_num}/{total}] {rec['id']}: re-fetching prod {rec['method']} {rec['url'][:80]}...", end=" ", flush=True)
-                result, err = fetch_response(PROD_BASE, rec)
-                if result:
-                    rec["prodBody"] = result["body"]
-                    rec["prod"]["size"] = result["size"]
-                    rec["prod"]["hash"] = result["hash"]
-                    rec["prod"]["status"] = result["status"]
-                    rec["prod"]["contentType"] = result["contentType"]
-                    backfilled_prod += 1
-                    print(f"OK ({result['size']:,} chars, status {result['status']})")
-                else:
-                    failed += 1
-                    print(f"FAILED: {err}")
-                time.sleep(0.5)  # be polite
+            # Write out everything that is ready; block on the oldest record
+            # only once the window of outstanding fetches (or buffered
+            # records) is full.
+            while pending and (all(f.done() for f in pending[0][5].values())
+                               or in_flight > window or len(pending) > MAX_PENDING):
+                flush_head()
 
-            if dev_is_trunc:
-                print(f"[{line_num}/{total}] {rec['id']}: re-fetching dev {rec['method']} {rec['url'][:80]}...", end=" ", flush=True)
-                result, err = fetch_response(DEV_BASE, rec)
-                if result:
-                    rec["devBody"] = result["body"]
-                    rec["dev"]["size"] = result["size"]
-                    rec["dev"]["hash"] = result["hash"]
-                    rec["dev"]["status"] = result["status"]
-                    rec["dev"]["contentType"] = result["contentType"]
-                    backfilled_dev += 1
-                    print(f"OK ({result['size']:,} chars, status {result['status']})")
-                else:
-                    failed += 1
-                    print(f"FAILED: {err}")
-                time.sleep(0.5)
+        while pending:
+            flush_head()
+    finally:
+        if fetcher:
+            fetcher.close()
+        if fout:
+            fout.close()
+
+    print(f"Total records: {stats['total']:,}")
+    print(f"Truncated prodBody: {stats['prodTrunc']}")
+    print(f"Truncated devBody: {stats['devTrunc']}")
+    print(f"Truncated requestBody: {stats['reqTrunc']} (cannot backfill - inputs not reproducible)")
+
+    if dry_run:
+        print()
+        print("Dry run - no changes made.")
+        return
 
-            fout.write(json.dumps(rec, separators=(",", ":")) + "\n")
+    if not first_failed and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
     print()
     print(f"Done. Wrote {output_path}")
-    print(f"  Backfilled prod: {backfilled_prod}/{prod_trunc}")
-    print(f"  Backfilled dev: {backfilled_dev}/{dev_trunc}")
-    print(f"  Failed: {failed}")
+    print(f"  Backfilled prod: {stats['backfilledProd']}/{stats['prodTrunc']}")
+    print(f"  Backfilled dev: {stats['backfilledDev']}/{stats['devTrunc']}")
+    print(f"  Failed: {stats['failed']}")
+    if first_failed:
+        print(f"  Re-run to retry them: it resumes from the last checkpoint before record {first_failed:,}"
+              if os.path.exists(checkpoint_path) else "  Re-run to retry them (no checkpoint was saved before them)")
+    if cache:
+        print(f"  Cache: {cache.hits} replayed, {cache.stores} stored ({cache.cache_dir})")
 
 
 if __name__ == "__main__":
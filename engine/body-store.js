@@ -0,0 +1,357 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Content-addressed store for response bodies, shared by every job, plus a
+ * packer that splits comparison.ndjson into small metadata lines and
+ * deduplicated blobs.
+ *
+ * Blobs are keyed by the md5 of the body (the same digest capture records
+ * in prod.hash / dev.hash) and stored gzipped as
+ * <store>/<key[0:2]>/<key>.gz. The store is jobs/.bodies/ unless the
+ * BODY_STORE environment variable names another directory. Mirrors
+ * engine/body_store.py, which reads the same store.
+ *
+ * A packed file (comparison.packed.ndjson) has one line per input line,
+ * with each prodBody / devBody / requestBody string replaced by a ref:
+ *   {"$body":"<md5>"}                 body was written as JSON.stringify does
+ *   {"$body":"<md5>","ascii":true}    body was written with non-ASCII escaped
+ *                                     (Python json.dumps' default)
+ * so unpack restores the original file byte for byte. Bodies encoded any
+ * other way, or that are not valid Unicode, stay inline. Every packed line is checked to unpack to its
+ * input line before it is written.
+ *
+ * compare.js reads <job>/comparison.packed.ndjson when the job has no
+ * comparison.ndjson (see findComparison); deltas-reader.js /
+ * deltas_reader.py resolve bodies of compact deltas that point into it.
+ * pack and unpack read seekable gzip input (seekable-gzip.js) as well; the
+ * packed file itself can be compressed the same way.
+ *
+ * Usage:
+ *   node engine/body-store.js pack <comparison.ndjson> [<out.packed.ndjson>]
+ *   node engine/body-store.js unpack <comparison.packed.ndjson> [<out.ndjson>]
+ *   node engine/body-store.js stats
+ *
+ * pack reports the dedup ratio (body bytes in / unique body bytes), the
+ * bytes added to the store, and how long parsing every body takes against
+ * parsing each distinct body once.
+ */
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+const { iterLines } = require('./ndjson-index');
+const { compressedPath } = require('./seekable-gzip');
+
+const DEFAULT_STORE_DIR = process.env.BODY_STORE || path.join(__dirname, '..', 'jobs', '.bodies');
+const BODY_FIELDS = ['prodBody', 'devBody', 'requestBody'];
+// Decompressed bodies kept in memory by get(), by total length
+const TEXT_CACHE_CHARS = 64 * 1024 * 1024;
+
+function md5Hex(text) {
+  return crypto.createHash('md5').update(text, 'utf8').digest('hex');
+}
+
+function isBodyRef(v) {
+  return v !== null && typeof v === 'object' && typeof v.$body === 'string';
+}
+
+class BodyStore {
+  constructor(dir = DEFAULT_STORE_DIR) {
+    this.dir = dir;
+    this.known = new Set();
+    this.texts = new Map();
+    this.textChars = 0;
+    this.written = 0;
+    this.writtenBytes = 0;
+  }
+
+  pathFor(key) {
+    return path.join(this.dir, key.slice(0, 2), `${key}.gz`);
+  }
+
+  /** Store text if it is not there yet; returns its key. */
+  put(text, key = md5Hex(text)) {
+    if (this.known.has(key)) return key;
+    const file = this.pathFor(key);
+    if (!fs.existsSync(file)) {
+      fs.mkdirSync(path.dirname(file), { recursive: true });
+      const gz = zlib.gzipSync(Buffer.from(text, 'utf8'));
+      const tmp = `${file}.${process.pid}.tmp`;
+      fs.writeFileSync(tmp, gz);
+      fs.renameSync(tmp, file);
+      this.written++;
+      this.writtenBytes += gz.length;
+    }
+    this.known.add(key);
+    return key;
+  }
+
+  /** The body stored under key. Repeated keys return the same string. */
+  get(key) {
+    let text = this.texts.get(key);
+    if (text !== undefined) return text;
+    try {
+      text = zlib.gunzipSync(fs.readFileSync(this.pathFor(key))).toString('utf8');
+    } catch (e) {
+      throw new Error(`Body ${key} missing from ${this.dir}: ${e.message}`);
+    }
+    this.texts.set(key, text);
+    this.textChars += text.length;
+    for (const [k, t] of this.texts) {
+      if (this.textChars <= TEXT_CACHE_CHARS) break;
+      this.texts.delete(k);
+      this.textChars -= t.length;
+    }
+    return text;
+  }
+
+  /** Replace body refs in a parsed record with the bodies, in place. */
+  resolve(record) {
+    for (const f of BODY_FIELDS) {
+      if (isBodyRef(record[f])) record[f] = this.get(record[f].$body);
+    }
+    return record;
+  }
+}
+
+// ---- Line splicing ----
+
+function skipSpace(s, i) {
+  while (i < s.length && (s[i] === ' ' || s[i] === '\t' || s[i] === '\r' || s[i] === '\n')) i++;
+  return i;
+}
+
+/** Index just past the string token starting at s[i] === '"'. */
+function stringEnd(s, i) {
+  let j = i + 1;
+  for (;;) {
+    j = s.indexOf('"', j);
+    if (j === -1) throw new Error('unterminated string');
+    let backslashes = 0;
+    for (let k = j - 1; s.charCodeAt(k) === 92; k--) backslashes++;
+    if (backslashes % 2 === 0) return j + 1;
+    j++;
+  }
+}
+
+function valueEnd(s, i) {
+  if (s[i] === '"') return stringEnd(s, i);
+  if (s[i] === '{' || s[i] === '[') {
+    let depth = 0;
+    for (let j = i; j < s.length; j++) {
+      const c = s[j];
+      if (c === '"') j = stringEnd(s, j) - 1;
+      else if (c === '{' || c === '[') depth++;
+      else if ((c === '}' || c === ']') && --depth === 0) return j + 1;
+    }
+    throw new Error('unterminated value');
+  }
+  let j = i;
+  while (j < s.length && !',}] \t\r\n'.includes(s[j])) j++;
+  return j;
+}
+
+/** [[key, start, end]] of the body fields' values in a one-line JSON object, in line order. */
+function bodySpans(line) {
+  const spans = [];
+  let i = skipSpace(line, 0);
+  if (line[i] !== '{') return spans;
+  i = skipSpace(line, i + 1);
+  while (i < line.length && line[i] !== '}') {
+    const keyEnd = stringEnd(line, i);
+    const key = JSON.parse(line.slice(i, keyEnd));
+    const start = skipSpace(line, skipSpace(line, keyEnd) + 1);
+    const end = valueEnd(line, start);
+    if (BODY_FIELDS.includes(key)) spans.push([key, start, end]);
+    i = skipSpace(line, end);
+    if (line[i] === ',') i = skipSpace(line, i + 1);
+  }
+  return spans;
+}
+
+// JSON string token as Python's json.dumps writes it by default
+function asciiToken(text) {
+  return JSON.stringify(text).replace(/[\u007f-\uffff]/g, c => `\\u${c.charCodeAt(0).toString(16).padStart(4, '0')}`);
+}
+
+/** Swap each span's token in line for replace(token), right to left. */
+function splice(line, spans, replace) {
+  let out = line;
+  for (let n = spans.length - 1; n >= 0; n--) {
+    const [, start, end] = spans[n];
+    const token = replace(line.slice(start, end));
+    if (token !== null) out = out.slice(0, start) + token + out.slice(end);
+  }
+  return out;
+}
+
+/**
+ * Packed form of one comparison line: { packed, refs, inline } where refs
+ * lists [key, body] for each body moved out (nothing is stored yet) and
+ * inline counts bodies left in place.
+ */
+function packLine(line) {
+  const refs = [];
+  let inline = 0;
+  const packed = splice(line, bodySpans(line), token => {
+    if (token[0] !== '"') return null;
+    const text = JSON.parse(token);
+    const ascii = JSON.stringify(text) !== token;
+    // Lone surrogates would not survive the UTF-8 blob
+    if (!text.isWellFormed() || (ascii && asciiToken(text) !== token)) {
+      inline++;
+      return null;
+    }
+    const key = md5Hex(text);
+    refs.push([key, text]);
+    return JSON.stringify(ascii ? { $body: key, ascii: true } : { $body: key });
+  });
+  return { packed, refs, inline };
+}
+
+/** The original line for a packed line; getText(key) supplies bodies. */
+function unpackLine(line, getText) {
+  return splice(line, bodySpans(line), token => {
+    if (token[0] !== '{') return null;
+    const ref = JSON.parse(token);
+    if (!isBodyRef(ref)) return null;
+    const text = getText(ref.$body);
+    return ref.ascii ? asciiToken(text) : JSON.stringify(text);
+  });
+}
+
+// ---- CLI ----
+
+function packedPath(file) {
+  return file.replace(/(\.ndjson)?(\.gz)?$/, '.packed.ndjson');
+}
+
+/**
+ * The job's comparison file: comparison.ndjson, else its seekable gzip
+ * (see seekable-gzip.js), else the packed file, plain or gzipped. Returns
+ * the plain path if there is none.
+ */
+function findComparison(jobDir) {
+  const plain = path.join(jobDir, 'comparison.ndjson');
+  const packed = packedPath(plain);
+  return [plain, compressedPath(plain), packed, compressedPath(packed)].find(f => fs.existsSync(f)) || plain;
+}
+
+function pack(input, output) {
+  const store = new BodyStore();
+  const tmp = `${output}.${process.pid}.tmp`;
+  const out = fs.openSync(tmp, 'w');
+  const distinct = new Map();  // key -> length
+  let lines = 0;
+  let bodies = 0;
+  let inline = 0;
+  let bodyChars = 0;
+  let parseNs = 0n;
+  let buf = '';
+  for (const { line: raw } of iterLines(input)) {
+    const line = raw.toString('utf8');
+    lines++;
+    let { packed, refs, inline: kept } = packLine(line);
+    const texts = new Map(refs);
+    if (refs.length && unpackLine(packed, key => texts.get(key)) !== line) {
+      packed = line;
+      kept += refs.length;
+      refs = [];
+    }
+    inline += kept;
+    for (const [key, text] of refs) {
+      bodies++;
+      bodyChars += text.length;
+      if (distinct.has(key)) continue;
+      distinct.set(key, text.length);
+      store.put(text, key);
+      const started = process.hrtime.bigint();
+      try { JSON.parse(text); } catch { /* not JSON */ }
+      parseNs += process.hrtime.bigint() - started;
+    }
+    buf += packed + '\n';
+    if (buf.length > 1 << 22) {
+      fs.writeSync(out, buf);
+      buf = '';
+    }
+  }
+  fs.writeSync(out, buf);
+  fs.closeSync(out);
+  fs.renameSync(tmp, output);
+
+  // Parsing every occurrence is estimated from the time to parse each
+  // distinct body once, scaled by size
+  let uniqueChars = 0;
+  for (const n of distinct.values()) uniqueChars += n;
+  const uniqueMs = Number(parseNs) / 1e6;
+  const allMs = uniqueChars ? uniqueMs * bodyChars / uniqueChars : 0;
+
+  const mb = n => (n / 1048576).toFixed(1);
+  console.error(`Packed ${lines} lines of ${input} -> ${output} (${mb(fs.statSync(output).size)} MB)`);
+  console.error(`  ${bodies} bodies (${mb(bodyChars)} MB), ${distinct.size} distinct (${mb(uniqueChars)} MB): ` +
+    `dedup ratio ${(uniqueChars ? bodyChars / uniqueChars : 1).toFixed(1)}x; ${inline} kept inline`);
+  console.error(`  Store ${store.dir}: ${store.written} new blob(s), ${mb(store.writtenBytes)} MB gzipped; ` +
+    `${distinct.size - store.written} already stored`);
+  console.error(`  Parsing: ~${allMs.toFixed(0)} ms for every body vs ${uniqueMs.toFixed(0)} ms for each distinct body once`);
+}
+
+function unpack(input, output) {
+  const store = new BodyStore();
+  const tmp = `${output}.${process.pid}.tmp`;
+  const out = fs.openSync(tmp, 'w');
+  let buf = '';
+  let lines = 0;
+  for (const { line } of iterLines(input)) {
+    buf += unpackLine(line.toString('utf8'), key => store.get(key)) + '\n';
+    lines++;
+    if (buf.length > 1 << 22) {
+      fs.writeSync(out, buf);
+      buf = '';
+    }
+  }
+  fs.writeSync(out, buf);
+  fs.closeSync(out);
+  fs.renameSync(tmp, output);
+  console.error(`Unpacked ${lines} lines of ${input} -> ${output}`);
+}
+
+function stats() {
+  let blobs = 0;
+  let bytes = 0;
+  let dirs = [];
+  try {
+    dirs = fs.readdirSync(DEFAULT_STORE_DIR);
+  } catch {
+    // empty store
+  }
+  for (const d of dirs) {
+    for (const f of fs.readdirSync(path.join(DEFAULT_STORE_DIR, d))) {
+      if (!f.endsWith('.gz')) continue;
+      blobs++;
+      bytes += fs.statSync(path.join(DEFAULT_STORE_DIR, d, f)).size;
+    }
+  }
+  console.log(`${DEFAULT_STORE_DIR}: ${blobs} blob(s), ${(bytes / 1048576).toFixed(1)} MB`);
+}
+
+function main() {
+  const [command, input, output] = process.argv.slice(2);
+  if (command === 'pack' && input) {
+    pack(input, output || packedPath(input));
+  } else if (command === 'unpack' && input) {
+    unpack(input, output || input.replace(/\.packed\.ndjson(\.gz)?$/, '.ndjson'));
+  } else if (command === 'stats') {
+    stats();
+  } else {
+    console.error('Usage:\n  node engine/body-store.js pack <comparison.ndjson> [<out.packed.ndjson>]\n' +
+      '  node engine/body-store.js unpack <comparison.packed.ndjson> [<out.ndjson>]\n' +
+      '  node engine/body-store.js stats');
+    process.exit(1);
+  }
+}
+
+if (require.main === module) main();
+
+module.exports = { BodyStore, isBodyRef, packLine, unpackLine, packedPath, findComparison, DEFAULT_STORE_DIR };
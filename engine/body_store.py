@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Reader for the content-addressed body store written by engine/body-store.js.
+
+Bodies are keyed by their md5 and stored gzipped as
+<store>/<key[:2]>/<key>.gz; the store is jobs/.bodies/ unless the BODY_STORE
+environment variable names another directory. In a packed comparison file
+(comparison.packed.ndjson) each prodBody / devBody / requestBody is either
+the body string or a ref {"$body": "<md5>"[, "ascii": true]}; resolve()
+replaces refs with the bodies. Packing and unpacking are done by
+body-store.js.
+
+Usage:
+  python3 engine/body_store.py get <key>...            # prints the bodies
+  python3 engine/body_store.py cat <packed.ndjson>     # prints resolved records
+
+From a script:
+  from body_store import BodyStore, iter_records
+  for record in iter_records("jobs/<round>/comparison.packed.ndjson"):
+      ...   # record["prodBody"] etc. are strings, packed or not
+"""
+
+import gzip
+import json
+import os
+import sys
+from collections import OrderedDict
+
+from seekable_gzip import compressed_path, iter_lines
+
+DEFAULT_STORE_DIR = os.environ.get("BODY_STORE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs", ".bodies")
+BODY_FIELDS = ("prodBody", "devBody", "requestBody")
+# Decompressed bodies kept in memory by get(), by total length
+TEXT_CACHE_CHARS = 64 * 1024 * 1024
+
+
+def is_body_ref(value):
+    return isinstance(value, dict) and isinstance(value.get("$body"), str)
+
+
+class BodyStore:
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self.texts = OrderedDict()
+        self.text_chars = 0
+
+    def path_for(self, key):
+        return os.path.join(self.store_dir, key[:2], f"{key}.gz")
+
+    def get(self, key):
+        """The body stored under key."""
+        text = self.texts.get(key)
+        if text is not None:
+            return text
+        try:
+            with gzip.open(self.path_for(key), "rb") as f:
+                text = f.read().decode("utf-8")
+        except OSError as e:
+            raise KeyError(f"Body {key} missing from {self.store_dir}: {e}") from e
+        self.texts[key] = text
+        self.text_chars += len(text)
+        while self.text_chars > TEXT_CACHE_CHARS and len(self.texts) > 1:
+            _, old = self.texts.popitem(last=False)
+            self.text_chars -= len(old)
+        return text
+
+    def resolve(self, record):
+        """Replace body refs in a parsed record with the bodies, in place."""
+        for field in BODY_FIELDS:
+            if is_body_ref(record.get(field)):
+                record[field] = self.get(record[field]["$body"])
+        return record
+
+
+def find_comparison(job_dir):
+    """The job's comparison file: comparison.ndjson, else its seekable gzip, else
+    the packed file, plain or gzipped (findComparison in body-store.js)."""
+    plain = os.path.join(job_dir, "comparison.ndjson")
+    packed = os.path.join(job_dir, "comparison.packed.ndjson")
+    candidates = (plain, compressed_path(plain), packed, compressed_path(packed))
+    return next((p for p in candidates if os.path.exists(p)), plain)
+
+
+def iter_records(path, store=None):
+    """Parsed records of a comparison file, packed or not, plain or seekable gzip,
+    with bodies resolved."""
+    store = store or BodyStore()
+    for line in iter_lines(path):
+        if line.strip():
+            yield store.resolve(json.loads(line))
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "get":
+        store = BodyStore()
+        for key in args[1:]:
+            sys.stdout.write(store.get(key) + "\n")
+    elif len(args) == 2 and args[0] == "cat":
+        for record in iter_records(args[1]):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Differential check and benchmark for pipeline.js canonicalEqual against
+ * the reference definition JSON.stringify(sortKeysDeep(a)) ===
+ * JSON.stringify(sortKeysDeep(b)) that compare.js used before.
+ *
+ * For every record with parseable bodies it checks these pairs:
+ *   - prod vs dev;
+ *   - each same-named parameter pair;
+ *   - prod vs a copy with every object's keys shuffled (equal);
+ *   - prod vs a copy with one leaf changed (unequal).
+ * It also checks a fixed list of JSON.stringify edge cases: undefined,
+ * NaN, -0, sparse arrays, and so on. Both implementations must agree on
+ * every pair.
+ *
+ * The benchmark times both implementations on the $expand records (the
+ * largest bodies), separately for equal and unequal pairs.
+ *
+ * Usage:
+ *   node engine/check-canonical-equal.js [<file.ndjson>...] [--iterations N]
+ *
+ * With no files, every *comparison.ndjson[.gz] / deltas*.ndjson under jobs/ is
+ * used. Exits non-zero if the implementations disagree anywhere.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const { getOperation, sortKeysDeep, canonicalEqual } = require('./pipeline');
+const { DeltasReader } = require('./deltas-reader');
+const { iterLines } = require('./ndjson-index');
+
+function getArg(flag, def) {
+  const i = process.argv.indexOf(flag);
+  return i >= 0 && i + 1 < process.argv.length ? process.argv[i + 1] : def;
+}
+
+function reference(a, b) {
+  return JSON.stringify(sortKeysDeep(a)) === JSON.stringify(sortKeysDeep(b));
+}
+
+function findInputs(dir) {
+  const found = [];
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const p = path.join(dir, entry.name);
+    if (entry.isDirectory()) found.push(...findInputs(p));
+    else if (/(comparison\.ndjson(\.gz)?|^deltas.*\.ndjson)$/.test(entry.name)) found.push(p);
+  }
+  return found.sort();
+}
+
+// Deterministic PRNG so failures reproduce
+function rng(seed) {
+  return () => {
+    seed = (seed * 1103515245 + 12345) & 0x7fffffff;
+    return seed / 0x80000000;
+  };
+}
+
+function shuffledCopy(v, rand) {
+  if (v === null || typeof v !== 'object') return v;
+  if (Array.isArray(v)) return v.map(x => shuffledCopy(x, rand));
+  const keys = Object.keys(v);
+  for (let i = keys.length - 1; i > 0; i--) {
+    const j = Math.floor(rand() * (i + 1));
+    [keys[i], keys[j]] = [keys[j], keys[i]];
+  }
+  const out = {};
+  for (const k of keys) out[k] = shuffledCopy(v[k], rand);
+  return out;
+}
+
+/** Deep copy with one randomly chosen leaf changed; null if there is no leaf. */
+function perturbedCopy(v, rand) {
+  const copy = JSON.parse(JSON.stringify(v));
+  const leaves = [];
+  (function collect(node) {
+    for (const k of Object.keys(node)) {
+      if (node[k] !== null && typeof node[k] === 'object') collect(node[k]);
+      else leaves.push([node, k]);
+    }
+  })(copy);
+  if (leaves.length === 0) return null;
+  const [node, k] = leaves[Math.floor(rand() * leaves.length)];
+  node[k] = typeof node[k] === 'string' ? `${node[k]}x` : typeof node[k] === 'number' ? node[k] + 1 : 'x';
+  return copy;
+}
+
+const EDGE_CASES = [
+  [undefined, undefined], [undefined, null], [undefined, () => 1], [null, NaN], [0, -0],
+  [Infinity, null], [1, '1'], ['', null], [true, 1], [[], {}], [{}, { a: undefined }],
+  [{ a: 1 }, { a: 1, b: undefined }], [{ a: null }, { a: NaN }], [{ a: null }, {}],
+  [[undefined], [null]], [[() => 1], [null]], [[1, , 3], [1, null, 3]], [[NaN], [null]],
+  [{ 0: 'a' }, ['a']], [{ b: 1, a: 2 }, { a: 2, b: 1 }], [{ a: [1, 2] }, { a: [2, 1] }],
+  [{ a: { b: { c: 1 } } }, { a: { b: { c: 1, d: Symbol('s') } } }], [new Date(0), {}],
+  [JSON.parse('{"__proto__": {"x": 1}, "a": 1}'), { a: 1 }],
+  [Object.assign(Object.create({ inherited: 1 }), { a: 1 }), { a: 1 }],
+];
+
+function main() {
+  const iterations = parseInt(getArg('--iterations', '5'), 10);
+  const files = process.argv.slice(2).filter((a, i, all) => !a.startsWith('--') && all[i - 1] !== '--iterations');
+  const inputs = files.length ? files : findInputs(path.join(__dirname, '..', 'jobs'));
+  const rand = rng(42);
+
+  let checked = 0;
+  let failures = 0;
+  const check = (a, b, where) => {
+    checked++;
+    const expected = reference(a, b);
+    if (canonicalEqual(a, b) !== expected) {
+      failures++;
+      if (failures <= 10) console.log(`MISMATCH ${where}: reference says ${expected}`);
+    }
+  };
+
+  EDGE_CASES.forEach(([a, b], i) => {
+    check(a, b, `edge case ${i}`);
+    check(b, a, `edge case ${i} (swapped)`);
+  });
+
+  const benchEqual = [];
+  const benchUnequal = [];
+  let records = 0;
+  for (const file of inputs) {
+    const reader = new DeltasReader(file);
+    for (const { line: raw } of iterLines(file)) {
+      const line = raw.toString('utf8');
+      if (!line.trim()) continue;
+      let record, prod, dev;
+      try {
+        record = reader.hydrate(JSON.parse(line));
+        prod = JSON.parse(record.prodBody);
+        dev = JSON.parse(record.devBody);
+      } catch {
+        continue;
+      }
+      if (!prod || !dev || typeof prod !== 'object' || typeof dev !== 'object') continue;
+      records++;
+      const where = `${path.relative(process.cwd(), file)} ${record.id}`;
+      check(prod, dev, where);
+      const devParams = new Map((dev.parameter || []).map(p => [p.name, p]));
+      for (const p of prod.parameter || []) {
+        if (devParams.has(p.name)) check(p, devParams.get(p.name), `${where} parameter ${p.name}`);
+      }
+      const shuffled = shuffledCopy(prod, rand);
+      const perturbed = perturbedCopy(prod, rand);
+      check(prod, shuffled, `${where} shuffled`);
+      if (perturbed) check(prod, perturbed, `${where} perturbed`);
+
+      if (getOperation(record.url) === 'expand') {
+        benchEqual.push([prod, shuffled]);
+        benchUnequal.push([prod, dev]);
+      }
+    }
+    reader.close();
+  }
+  if (records === 0) {
+    console.error('No records with parseable bodies found');
+    process.exit(1);
+  }
+  console.log(`Differential check: ${checked - failures}/${checked} pairs agree ` +
+    `(${records} records from ${inputs.length} file(s), ${EDGE_CASES.length} edge cases)`);
+
+  const time = (fn, pairs) => {
+    let best = Infinity;
+    for (let i = 0; i < iterations; i++) {
+      const started = process.hrtime.bigint();
+      for (const [a, b] of pairs) fn(a, b);
+      best = Math.min(best, Number(process.hrtime.bigint() - started) / 1e6);
+    }
+    return best;
+  };
+  for (const [label, pairs] of [['equal', benchEqual], ['unequal', benchUnequal]]) {
+    if (pairs.length === 0) continue;
+    const ref = time(reference, pairs);
+    const fast = time(canonicalEqual, pairs);
+    console.log(`Benchmark ($expand, ${label}, ${pairs.length} pairs, best of ${iterations}): ` +
+      `stringify ${ref.toFixed(1)}ms, canonicalEqual ${fast.toFixed(1)}ms (${(ref / fast).toFixed(1)}x)`);
+  }
+
+  process.exit(failures ? 1 : 0);
+}
+
+main();
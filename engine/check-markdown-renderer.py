@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Golden-output check and micro-benchmark for dump-bugs-html.py's markdown_to_html.
+
+The golden corpus is every (body_md, body_html) pair already published under
+jobs/: the bugs-all.json export and the BUGS array embedded in each
+jobs/*/bugs/bugs.html. Each body is re-rendered and must reproduce the
+published HTML byte for byte. (archive/ is excluded; it was produced by an
+older renderer.)
+
+Usage:
+  python3 engine/check-markdown-renderer.py [--iterations N]
+
+Exits non-zero if any body renders differently.
+"""
+
+import glob
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(ENGINE_DIR)
+
+
+def load_renderer():
+    sys.path.insert(0, ENGINE_DIR)
+    spec = importlib.util.spec_from_file_location("dump_bugs_html", os.path.join(ENGINE_DIR, "dump-bugs-html.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.markdown_to_html
+
+
+def golden_corpus():
+    """Return {body_md: (body_html, source_path)} from published reports."""
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "jobs", "**", "bugs*.json"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        bugs = data.get("bugs", []) if isinstance(data, dict) else data
+        for bug in bugs:
+            if "body_md" in bug and "body_html" in bug:
+                corpus.setdefault(bug["body_md"], (bug["body_html"], path))
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "jobs", "**", "*.html"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            m = re.search(r'^const BUGS = (\[.*\]);$', f.read(), re.MULTILINE)
+        if not m:
+            continue
+        for bug in json.loads(m.group(1)):
+            if "body_md" in bug and "body_html" in bug:
+                corpus.setdefault(bug["body_md"], (bug["body_html"], path))
+    return corpus
+
+
+def main():
+    iterations = 20
+    if "--iterations" in sys.argv:
+        iterations = int(sys.argv[sys.argv.index("--iterations") + 1])
+
+    markdown_to_html = load_renderer()
+    corpus = golden_corpus()
+    if not corpus:
+        print("No published bug bodies found under jobs/", file=sys.stderr)
+        sys.exit(1)
+
+    failures = 0
+    for body_md, (expected, path) in corpus.items():
+        actual = markdown_to_html(body_md)
+        if actual != expected:
+            failures += 1
+            first = body_md.split("\n", 1)[0][:60]
+            at = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+                      min(len(actual), len(expected)))
+            print(f"MISMATCH ({os.path.relpath(path, REPO_ROOT)}) {first!r}")
+            print(f"  expected: {expected[max(0, at - 40):at + 80]!r}")
+            print(f"  actual:   {actual[max(0, at - 40):at + 80]!r}")
+
+    total_chars = sum(len(md) for md in corpus)
+    print(f"Golden check: {len(corpus) - failures}/{len(corpus)} bodies identical ({total_chars:,} chars)")
+
+    # Micro-benchmark: whole corpus, plus the single largest body
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for body_md in corpus:
+            markdown_to_html(body_md)
+    elapsed = time.perf_counter() - started
+    rendered = iterations * len(corpus)
+    print(f"Benchmark: {rendered} renders in {elapsed:.3f}s "
+          f"({rendered / elapsed:,.0f} bodies/s, {iterations * total_chars / elapsed / 1e6:.1f} MB/s)")
+    largest = max(corpus, key=len)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        markdown_to_html(largest)
+    print(f"Largest body ({len(largest):,} chars): {(time.perf_counter() - started) / iterations * 1000:.2f} ms/render")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Differential check for how compare.js credits OK records to a tolerance
+ * kind (summary.json okBreakdown, the normalizedBy of each comparison).
+ *
+ * compareRecord skips change detection for normalizes that cannot alter
+ * normalizedBy and reuses the previous normalize's serialized bodies as the
+ * next "before". --profile measures every normalize, so a --profile run is
+ * the reference: for each job, compare.js runs once with and once without
+ * it, and okBreakdown and deltas.ndjson must match.
+ *
+ * A built-in synthetic job always runs first, with tolerances that edit the
+ * bodies in place and return the same objects -- an unmeasured in-place
+ * normalize followed by a no-op temp-tolerance must stay credited to
+ * equiv-autofix. Its okBreakdown is also checked against fixed expectations.
+ *
+ * Usage:
+ *   node engine/check-normalized-by.js [<job-dir>...]
+ *
+ * Job directories are only read: their comparison file is linked into a
+ * temporary job and their tolerances.js passed with --tolerances. Exits
+ * non-zero on any difference.
+ */
+
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const { execFileSync } = require('child_process');
+const { findComparison } = require('./body-store');
+
+const COMPARE = path.join(__dirname, 'compare.js');
+
+// Tolerances for the synthetic job. Each applies to the records whose URL
+// carries one of its case tags.
+const SYNTHETIC_TOLERANCES = `'use strict';
+const { getParamValue } = require(${JSON.stringify(path.join(__dirname, '..', 'baseline', 'tolerances.js'))});
+const on = (record, ...cases) => cases.some(c => record.url.includes('case=' + c));
+const tolerances = [
+  {
+    id: 'strip-noise',
+    kind: 'equiv-autofix',
+    match({ record }) { return on(record, 'unmeasured-in-place', 'in-place-temp') ? 'normalize' : null; },
+    normalize({ prod, dev }) {
+      const strip = body => ({ ...body, parameter: body.parameter.filter(p => p.name !== 'noise') });
+      return { prod: strip(prod), dev: strip(dev) };
+    },
+  },
+  {
+    id: 'sort-params-in-place',
+    kind: 'equiv-autofix',
+    match({ record }) { return on(record, 'unmeasured-in-place', 'measured-in-place') ? 'normalize' : null; },
+    normalize({ prod, dev }) {
+      for (const body of [prod, dev]) body.parameter.sort((a, b) => a.name.localeCompare(b.name));
+      return { prod, dev };
+    },
+  },
+  {
+    id: 'temp-in-place',
+    kind: 'temp-tolerance',
+    match({ record }) { return on(record, 'in-place-temp') ? 'normalize' : null; },
+    normalize({ prod, dev }) {
+      for (const body of [prod, dev]) body.parameter = body.parameter.filter(p => p.name !== 'message');
+      return { prod, dev };
+    },
+  },
+  {
+    id: 'temp-no-op',
+    kind: 'temp-tolerance',
+    match({ record }) { return on(record, 'unmeasured-in-place', 'measured-in-place') ? 'normalize' : null; },
+    normalize({ prod, dev }) { return { prod, dev }; },
+  },
+];
+module.exports = { tolerances, getParamValue };
+`;
+
+const param = (name, value) => ({ name, valueString: value });
+const parameters = (...parameter) => ({ resourceType: 'Parameters', parameter });
+
+// [case, prod body, dev body, expected okBreakdown bucket]
+const SYNTHETIC_CASES = [
+  // strip-noise is measured and sets equiv-autofix; the in-place sort is not
+  // measured; the no-op temp-tolerance must not see the sort as its change
+  ['unmeasured-in-place',
+    parameters(param('result', 'true'), param('display', 'A'), param('noise', '1')),
+    parameters(param('display', 'A'), param('result', 'true')), 'equiv-autofix'],
+  ['measured-in-place',
+    parameters(param('result', 'true'), param('display', 'A')),
+    parameters(param('display', 'A'), param('result', 'true')), 'equiv-autofix'],
+  ['in-place-temp',
+    parameters(param('result', 'true'), param('noise', '1'), param('message', 'x')),
+    parameters(param('result', 'true'), param('message', 'y')), 'temp-tolerance'],
+];
+
+function writeSyntheticJob(dir) {
+  const lines = SYNTHETIC_CASES.map(([name, prod, dev], i) => {
+    const prodBody = JSON.stringify(prod);
+    const devBody = JSON.stringify(dev);
+    return JSON.stringify({
+      id: `synthetic-${i}`,
+      method: 'GET',
+      url: `/r4/CodeSystem/$validate-code?system=http%3A%2F%2Fexample.org&code=${i}&case=${name}`,
+      match: false,
+      prod: { status: 200, contentType: 'application/fhir+json', size: prodBody.length, hash: `p${i}` },
+      dev: { status: 200, contentType: 'application/fhir+json', size: devBody.length, hash: `d${i}` },
+      prodBody,
+      devBody,
+    });
+  });
+  fs.writeFileSync(path.join(dir, 'comparison.ndjson'), lines.join('\n') + '\n');
+  fs.writeFileSync(path.join(dir, 'tolerances.js'), SYNTHETIC_TOLERANCES);
+}
+
+/** Run compare.js on jobDir, returning okBreakdown and the deltas text. */
+function run(jobDir, tolerances, profile) {
+  const args = [COMPARE, '--job', jobDir, '--tolerances', tolerances];
+  if (profile) args.push('--profile');
+  execFileSync(process.execPath, args, { stdio: ['ignore', 'ignore', 'inherit'] });
+  const results = path.join(jobDir, 'results');
+  return {
+    okBreakdown: JSON.parse(fs.readFileSync(path.join(results, 'summary.json'), 'utf8')).okBreakdown,
+    deltas: fs.readFileSync(path.join(results, 'deltas', 'deltas.ndjson'), 'utf8'),
+  };
+}
+
+function checkJob(label, jobDir, tolerances, expected) {
+  const fast = run(jobDir, tolerances, false);
+  const reference = run(jobDir, tolerances, true);
+  const problems = [];
+  if (JSON.stringify(fast.okBreakdown) !== JSON.stringify(reference.okBreakdown)) {
+    problems.push(`okBreakdown ${JSON.stringify(fast.okBreakdown)}, --profile gives ${JSON.stringify(reference.okBreakdown)}`);
+  }
+  if (fast.deltas !== reference.deltas) problems.push('deltas.ndjson differs from the --profile run');
+  if (expected) {
+    for (const [bucket, n] of Object.entries(expected)) {
+      if ((fast.okBreakdown[bucket] || 0) !== n) {
+        problems.push(`expected ${n} ${bucket}, got okBreakdown ${JSON.stringify(fast.okBreakdown)}`);
+      }
+    }
+  }
+  for (const p of problems) console.log(`MISMATCH ${label}: ${p}`);
+  if (!problems.length) console.log(`${label}: okBreakdown ${JSON.stringify(fast.okBreakdown)} matches --profile`);
+  return problems.length;
+}
+
+function main() {
+  const jobs = process.argv.slice(2);
+  const tmp = fs.mkdtempSync(path.join(os.tmpdir(), 'check-normalized-by-'));
+  let failures = 0;
+  try {
+    const synthetic = path.join(tmp, 'synthetic');
+    fs.mkdirSync(synthetic);
+    writeSyntheticJob(synthetic);
+    const expected = {};
+    for (const [, , , bucket] of SYNTHETIC_CASES) expected[bucket] = (expected[bucket] || 0) + 1;
+    failures += checkJob('synthetic', synthetic, path.join(synthetic, 'tolerances.js'), expected);
+
+    jobs.forEach((job, i) => {
+      const dir = path.join(tmp, `job-${i}`);
+      fs.mkdirSync(dir);
+      const source = path.resolve(findComparison(job));
+      fs.symlinkSync(source, path.join(dir, path.basename(source)));
+      failures += checkJob(job, dir, path.resolve(job, 'tolerances.js'), null);
+    });
+  } finally {
+    fs.rmSync(tmp, { recursive: true, force: true });
+  }
+  process.exit(failures ? 1 : 0);
+}
+
+main();
@@ -0,0 +1,209 @@
+#!/usr/bin/env bash
+set -uo pipefail
+
+# End-to-end check of prompts/parallel-triage.sh, without Claude: runs it
+# with two workers and a stub AGENT_CMD on a synthetic 8-record job, in a
+# throwaway git repo holding a copy of engine/ and prompts/.
+#
+# Usage:
+#   ./engine/check-parallel-triage.sh [--keep]
+#
+# The stub's behavior depends on the order agent runs start in:
+#   runs 1-2  wait for each other, then both edit the same existing line of
+#             tolerances.js: one lands, the other conflicts and is parked
+#             with its work on a conflict/<id> branch
+#   runs 3-4  wait for each other, then both append a tolerance: the
+#             append/append conflict is resolved by merge-tolerances.js and
+#             both land
+#   run 5     writes no analysis.md; the record is released, fails again on
+#             its second attempt and is parked
+#   run 6+    the first one appends a tolerance under which compare.js (in
+#             the copy) fails twice: the record is landed-stale, not parked
+#   others    just write analysis.md
+# Afterwards the claims, ledger, branches, main's tolerances.js and
+# parallel-stats.ndjson are checked. Exits non-zero on any difference;
+# --keep leaves the scratch directory for inspection.
+
+TRIAGE_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+KEEP=0
+[[ "${1:-}" == "--keep" ]] && KEEP=1
+
+SCRATCH="$(mktemp -d "${TMPDIR:-/tmp}/check-parallel-triage.XXXXXX")"
+REPO="$SCRATCH/triage"
+STUB="$SCRATCH/stub"
+JOB_REL=jobs/check
+JOB="$REPO/$JOB_REL"
+if [[ "$KEEP" -eq 0 ]]; then
+  trap 'rm -rf "$SCRATCH"' EXIT
+else
+  echo "Scratch directory: $SCRATCH"
+fi
+
+mkdir -p "$REPO" "$STUB" "$JOB"
+cp -r "$TRIAGE_DIR/engine" "$TRIAGE_DIR/prompts" "$TRIAGE_DIR/.gitignore" "$REPO/"
+rm -rf "$REPO/engine/__pycache__"
+
+# compare.js fails while tolerances.js has the check-compare-fails tolerance
+# and $STUB/compare-failures counts down above zero
+sed -i "2a\\
+{ const fs = require('fs'); const n = Number(fs.existsSync('$STUB/compare-failures') && fs.readFileSync('$STUB/compare-failures', 'utf8'));\\
+  if (n > 0 && fs.readFileSync('$JOB/tolerances.js', 'utf8').includes('check-compare-fails')) {\\
+    fs.writeFileSync('$STUB/compare-failures', String(n - 1)); console.error('check: compare.js made to fail'); process.exit(1); } }" \
+  "$REPO/engine/compare.js"
+
+cat > "$JOB/tolerances.js" <<'EOF'
+'use strict';
+
+function getParamValue(params, name) {
+  const p = params?.parameter?.find(p => p.name === name);
+  return p && (p.valueString ?? p.valueBoolean);
+}
+
+const tolerances = [
+  {
+    id: 'check-base',
+    kind: 'equiv-autofix',
+    description: 'untouched',
+    match() { return null; },
+  },
+];
+
+module.exports = { tolerances, getParamValue };
+EOF
+
+node -e '
+const param = (name, valueString) => ({ name, valueString });
+const lines = [];
+for (let i = 0; i < 8; i++) {
+  const prodBody = JSON.stringify({ resourceType: "Parameters", parameter: [param("display", "A" + i), param("p" + i, "x")] });
+  const devBody = JSON.stringify({ resourceType: "Parameters", parameter: [param("display", "B" + i), param("p" + i, "y")] });
+  lines.push(JSON.stringify({
+    id: "check-" + i, method: "GET", url: "/r4/CodeSystem/$lookup?system=http%3A%2F%2Fexample.org&code=" + i,
+    match: false,
+    prod: { status: 200, contentType: "application/fhir+json", size: prodBody.length, hash: "p" + i },
+    dev: { status: 200, contentType: "application/fhir+json", size: devBody.length, hash: "d" + i },
+    prodBody, devBody,
+  }));
+}
+process.stdout.write(lines.join("\n") + "\n");
+' > "$JOB/comparison.ndjson"
+
+cat > "$STUB/agent.sh" <<EOF
+#!/usr/bin/env bash
+# Stub agent: runs in the worker's worktree (see check-parallel-triage.sh)
+STUB="$STUB"
+EOF
+cat >> "$STUB/agent.sh" <<'EOF'
+id="$(basename "$ISSUE_DIR")"
+seq=$(flock "$STUB/seq.lock" bash -c 'n=$(( $(cat "$1" 2>/dev/null || echo 0) + 1 )); echo $n > "$1"; echo $n' _ "$STUB/seq")
+echo "$seq $WORKER $id" >> "$STUB/runs"
+
+# Wait until the other run of the pair has started, so both branch off the same main
+pair() {
+  touch "$STUB/started-$seq"
+  for _ in $(seq 600); do
+    [[ -e "$STUB/started-$1" ]] && return 0
+    sleep 0.1
+  done
+  echo "stub: run $1 never started" >&2
+  exit 1
+}
+
+append() {
+  sed -i "/^];/i\\
+  {\\
+    id: '$1',\\
+    kind: 'equiv-autofix',\\
+    match() { return null; },\\
+  }," "$JOB_REL/tolerances.js"
+}
+
+if [[ "$id" == "$(cat "$STUB/fail-id" 2>/dev/null)" ]]; then
+  exit 1
+fi
+case $seq in
+  1|2)
+    pair $(( 3 - seq ))
+    sed -i "s/description: 'untouched'/description: 'edited by run $seq'/" "$JOB_REL/tolerances.js"
+    ;;
+  3|4)
+    pair $(( 7 - seq ))
+    append "check-append-$seq"
+    ;;
+  5)
+    echo "$id" > "$STUB/fail-id"
+    exit 1
+    ;;
+  *)
+    if mkdir "$STUB/compare-fails" 2>/dev/null; then
+      echo 2 > "$STUB/compare-failures"
+      echo "$id" > "$STUB/compare-fails/id"
+      append check-compare-fails
+    fi
+    ;;
+esac
+echo "stub analysis of $id (run $seq)" > "$ISSUE_DIR/analysis.md"
+EOF
+
+cd "$REPO" || exit 1
+git init -q -b main
+git config user.email check@example.org
+git config user.name check-parallel-triage
+node engine/compare.js --job "$JOB_REL" > "$SCRATCH/setup.log" 2>&1 || { cat "$SCRATCH/setup.log"; exit 1; }
+git add -A
+git commit -q -m "check-parallel-triage: synthetic job"
+
+echo "Running parallel-triage.sh with 2 stub workers..."
+AGENT_CMD="bash $STUB/agent.sh" AGENT_TIMEOUT=120 MAX_ATTEMPTS=2 \
+  ./prompts/parallel-triage.sh "$JOB_REL" 2 > "$SCRATCH/run.log" 2>&1
+status=$?
+
+failures=0
+fail() {
+  echo "FAIL: $*"
+  failures=$((failures + 1))
+}
+check() {
+  local what=$1 expected=$2 actual=$3
+  if [[ "$expected" == "$actual" ]]; then
+    echo "ok: $what ($actual)"
+  else
+    fail "$what: expected $expected, got $actual"
+  fi
+}
+
+[[ $status -eq 0 ]] || fail "parallel-triage.sh exited with $status"
+outcome() { grep -c "\"outcome\":\"$1\"" "$JOB/triage-logs/parallel-stats.ndjson"; }
+check "landed" 5 "$(outcome landed)"
+check "landed with stale deltas" 1 "$(outcome landed-stale)"
+check "merge conflicts" 1 "$(outcome conflict)"
+check "failed agent runs" 2 "$(outcome failed)"
+check "agent runs" 9 "$(wc -l < "$STUB/runs")"
+
+parked() { grep -l "\"reason\":\"$1\"" "$JOB"/.picker/claims/* 2>/dev/null | wc -l; }
+check "claims left" 2 "$(ls "$JOB/.picker/claims" | wc -l)"
+check "parked for merge conflict" 1 "$(parked "merge conflict")"
+check "parked after failing" 1 "$(parked "failed 2 times")"
+check "record parked after failing" "$(cat "$STUB/fail-id")" \
+  "$(basename "$(grep -l '"failed 2 times"' "$JOB"/.picker/claims/* 2>/dev/null)")"
+check "conflict branches" 1 "$(git branch --list 'conflict/*' | wc -l)"
+
+check "Triage commits on main" 6 "$(git log --oneline main | grep -c '^[0-9a-f]* Triage ')"
+check "analyzed ledger" 6 "$(sort -u "$JOB/.picker/analyzed" | wc -l)"
+for id in check-append-3 check-append-4 check-compare-fails; do
+  grep -q "id: '$id'" "$JOB/tolerances.js" || fail "main's tolerances.js lacks $id"
+done
+check "edits of the shared line on main" 1 "$(grep -c "description: 'edited by run" "$JOB/tolerances.js")"
+stale_id="$(cat "$STUB/compare-fails/id" 2>/dev/null)"
+[[ -n "$stale_id" && -f "$JOB/issues/$stale_id/analysis.md" ]] ||
+  fail "the landed-stale record ($stale_id) has no analysis on main"
+(cd "$REPO" && node engine/next-record.js --job "$JOB_REL" > /dev/null 2>&1) &&
+  fail "next-record.js still hands out a record"
+
+if [[ $failures -gt 0 ]]; then
+  echo "--- parallel-triage.sh output"
+  cat "$SCRATCH/run.log"
+  echo "$failures check(s) failed"
+  exit 1
+fi
+echo "All checks passed"
@@ -0,0 +1,258 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Delta clustering: groups the records of deltas.ndjson by a normalized diff
+ * signature, so the picker can hand out one representative per pattern,
+ * largest pattern first, instead of the same bug thousands of times.
+ *
+ * Usage:
+ *   node engine/cluster-deltas.js --job jobs/<round-name> [--top N] [--if-stale]
+ *
+ * --if-stale does nothing if clusters.json already matches deltas.ndjson,
+ * so scripts can run it after every compare.js without paying twice.
+ *
+ * A record's signature is built from its tolerance-normalized bodies (the
+ * same pipeline run next-record.js writes into issue dirs):
+ *   op, category   from record.comparison
+ *   status         [prodStatus, devStatus]
+ *   system         comparison.system, else the request's system parameter
+ *                  (query string or POSTed Parameters), version dropped
+ *   params         findParameterDiffs shape: sorted "<type>:<param>"
+ *   paths          the set of JSON paths where the bodies differ; array
+ *                  elements are named by their `name` (Parameters) or
+ *                  collapsed to [], "-" / "+" mark prod-only / dev-only
+ *
+ * Writes <job>/results/clusters.json, largest cluster first:
+ *   { version, deltas: { size, mtimeNs }, records, clusters: [
+ *       { key, size, representative, signature, members } ] }
+ * The representative is the cluster's first record in file order. The
+ * deltas stamp makes the file stale once compare.js rewrites the deltas;
+ * building hydrates and normalizes every delta, so it is its own step, run
+ * after compare.js (start-triage.sh, triage-loop.sh, parallel-triage.sh).
+ * next-record.js only reads the file and picks in file order while it is
+ * missing or stale.
+ */
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const { canonicalEqual, buildDispatch, applyTolerances } = require('./pipeline');
+const { NdjsonIndex } = require('./ndjson-index');
+const { DeltasReader } = require('./deltas-reader');
+
+const CLUSTERS_VERSION = 1;
+// A body pair differing in more places than this is summarized; the
+// signature then ends with MORE_PATHS instead of growing with the diff
+const MAX_PATHS = 40;
+const MORE_PATHS = '...';
+
+function clustersPath(jobDir) {
+  return path.join(jobDir, 'results/clusters.json');
+}
+
+function deltasPath(jobDir) {
+  return path.join(jobDir, 'results/deltas/deltas.ndjson');
+}
+
+function deltasStamp(file) {
+  const st = fs.statSync(file, { bigint: true });
+  return { size: Number(st.size), mtimeNs: st.mtimeNs.toString() };
+}
+
+function isObject(v) {
+  return v !== null && typeof v === 'object' && !Array.isArray(v);
+}
+
+// Array elements are matched up by their FHIR `name` where they have one,
+// so reordered or inserted parameters do not shift everything after them
+function elementKey(v) {
+  return isObject(v) && typeof v.name === 'string' ? v.name : null;
+}
+
+function groupElements(list) {
+  const groups = new Map();
+  for (const v of list) {
+    const key = elementKey(v);
+    const label = key === null ? '[]' : `[${key}]`;
+    if (!groups.has(label)) groups.set(label, []);
+    groups.get(label).push(v);
+  }
+  return groups;
+}
+
+/** Add the normalized paths where a and b differ to out (a Set). */
+function collectDiffPaths(a, b, where, out) {
+  if (out.size > MAX_PATHS || canonicalEqual(a, b)) return;
+  if (a === undefined) {
+    out.add(`+${where}`);
+  } else if (b === undefined) {
+    out.add(`-${where}`);
+  } else if (isObject(a) && isObject(b)) {
+    const keys = new Set([...Object.keys(a), ...Object.keys(b)]);
+    for (const k of keys) collectDiffPaths(a[k], b[k], where ? `${where}.${k}` : k, out);
+  } else if (Array.isArray(a) && Array.isArray(b)) {
+    const ga = groupElements(a);
+    const gb = groupElements(b);
+    for (const label of new Set([...ga.keys(), ...gb.keys()])) {
+      const xs = ga.get(label) || [];
+      const ys = gb.get(label) || [];
+      for (let i = 0; i < Math.max(xs.length, ys.length); i++) {
+        collectDiffPaths(xs[i], ys[i], `${where}${label}`, out);
+      }
+    }
+  } else {
+    out.add(where || '$');
+  }
+}
+
+function diffPaths(prod, dev) {
+  if (!prod || !dev) return null;
+  const found = new Set();
+  collectDiffPaths(prod, dev, '', found);
+  const paths = [...found].sort();
+  return paths.length > MAX_PATHS ? [...paths.slice(0, MAX_PATHS), MORE_PATHS] : paths;
+}
+
+function paramValue(body, name) {
+  if (!isObject(body) || !Array.isArray(body.parameter)) return undefined;
+  const p = body.parameter.find(x => x && x.name === name);
+  if (!p) return undefined;
+  return p.valueUri ?? p.valueString ?? p.valueCanonical ?? p.valueCoding?.system ??
+    p.valueCodeableConcept?.coding?.[0]?.system;
+}
+
+function requestSystem(record) {
+  const comparison = record.comparison || {};
+  if (comparison.system) return comparison.system;
+  const query = record.url.split('?')[1];
+  const fromQuery = query ? new URLSearchParams(query).get('system') : null;
+  if (fromQuery) return fromQuery;
+  if (record.requestBody) {
+    try {
+      const body = JSON.parse(record.requestBody);
+      return paramValue(body, 'system') ?? paramValue(body, 'coding') ?? paramValue(body, 'codeableConcept') ?? null;
+    } catch {
+      return null;
+    }
+  }
+  return null;
+}
+
+/** The normalized diff signature of one delta record. */
+function signatureOf(record, dispatch) {
+  const comparison = record.comparison || {};
+  const system = requestSystem(record);
+  const { prod, dev } = applyTolerances(record, dispatch);
+  return {
+    op: comparison.op ?? null,
+    category: comparison.category ?? null,
+    status: [record.prod?.status ?? null, record.dev?.status ?? null],
+    system: typeof system === 'string' ? system.split('|')[0] : null,
+    params: (comparison.diffs || []).map(d => `${d.type}:${d.param}`).sort(),
+    paths: diffPaths(prod, dev),
+  };
+}
+
+function signatureKey(signature) {
+  return crypto.createHash('sha256').update(JSON.stringify(signature)).digest('hex').slice(0, 12);
+}
+
+/** Cluster the job's deltas and write clusters.json. Returns what was written. */
+function buildClusters(jobDir) {
+  const file = deltasPath(jobDir);
+  const { tolerances } = require(path.join(jobDir, 'tolerances'));
+  const dispatch = buildDispatch(tolerances);
+
+  const stamp = deltasStamp(file);
+  const index = NdjsonIndex.open(file);
+  const reader = new DeltasReader(file);
+  const rows = [...index.entries()].sort((a, b) => a.offset - b.offset);
+  const byKey = new Map();
+  try {
+    for (const row of rows) {
+      const signature = signatureOf(reader.hydrate(JSON.parse(index.readLine(row))), dispatch);
+      const key = signatureKey(signature);
+      if (!byKey.has(key)) byKey.set(key, { key, size: 0, representative: row.id, signature, members: [] });
+      const cluster = byKey.get(key);
+      cluster.size++;
+      cluster.members.push(row.id);
+    }
+  } finally {
+    index.close();
+    reader.close();
+  }
+
+  // Largest first; ties keep file order of the representatives
+  const clusters = [...byKey.values()].sort((a, b) => b.size - a.size);
+  const result = { version: CLUSTERS_VERSION, deltas: stamp, records: rows.length, clusters };
+  const out = clustersPath(jobDir);
+  const tmp = `${out}.${process.pid}.tmp`;
+  fs.writeFileSync(tmp, JSON.stringify(result, null, 1) + '\n');
+  fs.renameSync(tmp, out);
+  return result;
+}
+
+/**
+ * The job's clusters, rebuilt first if clusters.json is missing or was
+ * built from a different deltas.ndjson. With rebuild false, returns null
+ * instead of rebuilding.
+ */
+function loadClusters(jobDir, { rebuild = true } = {}) {
+  try {
+    const data = JSON.parse(fs.readFileSync(clustersPath(jobDir), 'utf8'));
+    const stamp = deltasStamp(deltasPath(jobDir));
+    if (data.version === CLUSTERS_VERSION && data.deltas?.size === stamp.size &&
+      data.deltas?.mtimeNs === stamp.mtimeNs) {
+      return data;
+    }
+  } catch {
+    // missing or unreadable: rebuild below
+  }
+  return rebuild ? buildClusters(jobDir) : null;
+}
+
+function describe(signature) {
+  const parts = [signature.op, signature.category, signature.status.join('/')];
+  if (signature.system) parts.push(signature.system);
+  if (signature.params.length) parts.push(signature.params.join(' '));
+  if (signature.paths?.length) {
+    const shown = signature.paths.slice(0, 4).join(' ');
+    parts.push(signature.paths.length > 4 ? `${shown} (+${signature.paths.length - 4})` : shown);
+  }
+  return parts.join('  ');
+}
+
+function main() {
+  const i = process.argv.indexOf('--job');
+  const jobArg = i >= 0 ? process.argv[i + 1] : null;
+  if (!jobArg) {
+    console.error('Usage: node engine/cluster-deltas.js --job <job-directory> [--top N] [--if-stale]');
+    process.exit(1);
+  }
+  const t = process.argv.indexOf('--top');
+  const top = t >= 0 ? parseInt(process.argv[t + 1], 10) : 20;
+  const jobDir = path.resolve(jobArg);
+  if (!fs.existsSync(deltasPath(jobDir))) {
+    console.error(`Delta file not found: ${deltasPath(jobDir)}`);
+    process.exit(1);
+  }
+
+  if (process.argv.includes('--if-stale') && loadClusters(jobDir, { rebuild: false })) {
+    console.log(`${path.relative(process.cwd(), clustersPath(jobDir))} is up to date`);
+    return;
+  }
+
+  const started = Date.now();
+  const { records, clusters } = buildClusters(jobDir);
+  const singletons = clusters.filter(c => c.size === 1).length;
+  console.log(`${records} records in ${clusters.length} clusters (${singletons} singletons) ` +
+    `in ${((Date.now() - started) / 1000).toFixed(1)}s -> ${path.relative(process.cwd(), clustersPath(jobDir))}`);
+  for (const c of clusters.slice(0, top)) {
+    console.log(`${String(c.size).padStart(6)}  ${c.key}  ${c.representative}\n        ${describe(c.signature)}`);
+  }
+}
+
+if (require.main === module) main();
+
+module.exports = { buildClusters, loadClusters, clustersPath, signatureOf, diffPaths };
@@ -0,0 +1,177 @@
+'use strict';
+
+/**
+ * Persistent per-record result cache for compare.js --incremental.
+ *
+ * Layout (<job>/results/compare-cache/):
+ *   meta.json       { version, engine, helpers, tolerances: [{ id, fp }] }
+ *   entries.ndjson  one { id, h, t, c } per record, in input order:
+ *                   h = sha1 of the comparison.ndjson line,
+ *                   t = ids of the tolerances whose match() returned
+ *                       skip/normalize for it, in pipeline order,
+ *                   c = the comparison result.
+ *
+ * A record's result depends only on its line, on the tolerances that
+ * touched it, and on code shared by every tolerance. A tolerance that
+ * returned null cannot have changed anything. So a cached result is reused
+ * unless one of these holds:
+ *   - the line changed;
+ *   - a tolerance in its `t` list was removed or edited;
+ *   - a new or edited tolerance's selector admits the record. Such a
+ *     tolerance without a selector admits every record.
+ * Everything is recomputed when any of these changed:
+ *   - compare.js or pipeline.js;
+ *   - the text of tolerances.js outside the `const tolerances = [...]`
+ *     array (shared helpers);
+ *   - the relative order of the tolerances kept from the last run.
+ * A tolerance's fingerprint covers all of its fields, and each function
+ * field's source text.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const readline = require('readline');
+
+const CACHE_VERSION = 1;
+
+function sha256(text) {
+  return crypto.createHash('sha256').update(text).digest('hex');
+}
+
+function lineHash(line) {
+  return crypto.createHash('sha1').update(line).digest('hex');
+}
+
+function toleranceFingerprint(t) {
+  return sha256(JSON.stringify(t, (key, value) => {
+    if (typeof value === 'function') return `fn:${value.toString()}`;
+    if (value instanceof RegExp) return `re:${value.toString()}`;
+    return value;
+  }));
+}
+
+/**
+ * Hash of tolerances.js with the tolerance array cut out: the helpers and
+ * constants every tolerance may call. If the array cannot be located the
+ * whole file is hashed, so any edit forces a full run.
+ */
+function helperFingerprint(source) {
+  const start = source.search(/^const tolerances = \[/m);
+  const end = start >= 0 ? source.slice(start).search(/^\];/m) : -1;
+  if (start < 0 || end < 0) return sha256(source);
+  return sha256(source.slice(0, start) + source.slice(start + end));
+}
+
+function engineFingerprint() {
+  return sha256(['compare.js', 'pipeline.js', 'compare-cache.js']
+    .map(f => fs.readFileSync(path.join(__dirname, f), 'utf8'))
+    .join('\0'));
+}
+
+function buildMeta(tolerances, tolerancesPath) {
+  return {
+    version: CACHE_VERSION,
+    engine: engineFingerprint(),
+    helpers: helperFingerprint(fs.readFileSync(tolerancesPath, 'utf8')),
+    tolerances: tolerances.map(t => ({ id: t.id, fp: toleranceFingerprint(t) })),
+  };
+}
+
+/**
+ * Decide what the previous run's results are still good for. Returns
+ *   { reuse: false, reason }                     -> recompute everything
+ *   { reuse: true, invalid: [ids], added: [indices] }
+ * where `invalid` are removed/edited tolerance ids (records they touched are
+ * recomputed) and `added` are indices of new/edited tolerances (records their
+ * selector admits are recomputed).
+ */
+function planIncremental(oldMeta, newMeta, tolerances) {
+  if (!oldMeta || oldMeta.version !== CACHE_VERSION) return { reuse: false, reason: 'no previous results' };
+  if (oldMeta.engine !== newMeta.engine) return { reuse: false, reason: 'compare engine changed' };
+  if (oldMeta.helpers !== newMeta.helpers) return { reuse: false, reason: 'shared helpers in tolerances.js changed' };
+
+  const oldIds = oldMeta.tolerances.map(t => t.id);
+  const newIds = newMeta.tolerances.map(t => t.id);
+  if (new Set(oldIds).size !== oldIds.length || new Set(newIds).size !== newIds.length) {
+    return { reuse: false, reason: 'duplicate tolerance ids' };
+  }
+  const oldFp = new Map(oldMeta.tolerances.map(t => [t.id, t.fp]));
+  const newFp = new Map(newMeta.tolerances.map(t => [t.id, t.fp]));
+  const keptOld = oldIds.filter(id => newFp.has(id));
+  const keptNew = newIds.filter(id => oldFp.has(id));
+  if (keptOld.join('\n') !== keptNew.join('\n')) return { reuse: false, reason: 'tolerance order changed' };
+
+  const invalid = oldIds.filter(id => newFp.get(id) !== oldFp.get(id));
+  const added = [];
+  for (let i = 0; i < newIds.length; i++) {
+    if (oldFp.get(newIds[i]) === newFp.get(newIds[i])) continue;
+    if (!tolerances[i].selector) {
+      return { reuse: false, reason: `new/edited tolerance ${newIds[i]} has no selector` };
+    }
+    added.push(i);
+  }
+  return { reuse: true, invalid, added };
+}
+
+class ResultCache {
+  constructor(dir) {
+    this.dir = dir;
+    this.metaPath = path.join(dir, 'meta.json');
+    this.entriesPath = path.join(dir, 'entries.ndjson');
+  }
+
+  readMeta() {
+    try {
+      return JSON.parse(fs.readFileSync(this.metaPath, 'utf8'));
+    } catch {
+      return null;
+    }
+  }
+
+  writeMeta(meta) {
+    fs.mkdirSync(this.dir, { recursive: true });
+    fs.writeFileSync(this.metaPath, JSON.stringify(meta, null, 2));
+  }
+
+  /** Remove the meta file so an interrupted run is never trusted. */
+  invalidate() {
+    try { fs.unlinkSync(this.metaPath); } catch { /* not there */ }
+  }
+
+  /** Load entries into a Map id -> { h, t, c }. */
+  async load() {
+    const entries = new Map();
+    if (!fs.existsSync(this.entriesPath)) return entries;
+    const rl = readline.createInterface({ input: fs.createReadStream(this.entriesPath), crlfDelay: Infinity });
+    for await (const line of rl) {
+      if (!line) continue;
+      const e = JSON.parse(line);
+      entries.set(e.id, e);
+    }
+    return entries;
+  }
+}
+
+/**
+ * Per-run lookup: returns the cached entry for a record when the plan
+ * allows reusing it, else null.
+ */
+function makeLookup(entries, plan, dispatch, getOperation) {
+  const invalid = new Set(plan.invalid);
+  return (record, hash) => {
+    const e = entries.get(record.id);
+    if (!e || e.h !== hash) return null;
+    if (e.t.some(id => invalid.has(id))) return null;
+    if (plan.added.length) {
+      const op = getOperation(record.url);
+      if (plan.added.some(i => dispatch.selects(i, record, op))) return null;
+    }
+    return e;
+  };
+}
+
+module.exports = {
+  ResultCache, buildMeta, planIncremental, makeLookup, lineHash,
+  toleranceFingerprint, helperFingerprint,
+};
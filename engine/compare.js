@@ -10,103 +10,471 @@
  *
  * Usage:
  *   node engine/compare.js --job jobs/<round-name> [--tolerances /path/to/tolerances.js]
+ *                          [--workers N] [--profile [--profile-top N]] [--verify-dispatch]
+ *                          [--incremental | --verify-cache] [--deltas-format full|compact]
  *
  * The job directory must contain:
- *   - comparison.ndjson (input data)
+ *   - comparison.ndjson (input data), or comparison.ndjson.gz (seekable
+ *     gzip, see seekable-gzip.js), or comparison.packed.ndjson[.gz] with
+ *     bodies in the shared body store (see body-store.js)
  *   - tolerances.js (tolerance definitions)
  *
  * Output is written to <job>/results/
+ *
+ * --workers N splits comparison.ndjson into N newline-aligned byte ranges (of
+ * the uncompressed NDJSON, cut at frame boundaries for seekable gzip) and
+ * runs each on its own worker thread. Each worker writes its deltas to a
+ * shard file; the shards are concatenated in input order and the per-shard
+ * counters merged in shard order, so deltas.ndjson and summary.json are the
+ * same as a single-threaded run.
+ *
+ * --profile instruments every tolerance: match calls, skip/normalize hits,
+ * effective normalizations (output actually changed), CPU time in match and
+ * normalize, and an allocation estimate from V8 heap deltas sampled on every
+ * HEAP_SAMPLE_EVERY-th record. Results go to results/tolerance-profile.json
+ * and the --profile-top (default 15) most expensive tolerances are printed.
+ *
+ * Tolerances that declare a `selector` (see pipeline.js) are only matched
+ * against records their selector admits. --verify-dispatch also runs the
+ * plain linear scan on every record and reports any record whose result
+ * differs, and any tolerance that matched a record its selector excludes;
+ * it exits non-zero if there are any.
+ *
+ * --incremental keeps a per-record result cache in results/compare-cache/
+ * (see compare-cache.js) and only recomputes records whose line changed or
+ * that a removed, edited or new tolerance could affect; it falls back to a
+ * full run when shared code changed. --verify-cache does the same and also
+ * recomputes every reused record from scratch, failing if any differs.
+ *
+ * --deltas-format compact writes deltas without prodBody/devBody/requestBody;
+ * each record instead carries src: { file, offset, length, sha1 }, a pointer
+ * to its line in comparison.ndjson (file is relative to the deltas
+ * directory). deltas-reader.js / deltas_reader.py hydrate the bodies back
+ * on demand; the default, full, embeds them as before.
+ *
+ * Byte-identical bodies recur across records (the same $expand, the same
+ * OperationOutcome). A body whose hash (prod.hash / dev.hash) has been seen
+ * before is parsed once and the tree shared by later records with the same
+ * text; see ParseCache. Parse reuse is reported at the end of the run.
  */
 
 const fs = require('fs');
 const path = require('path');
 const readline = require('readline');
+const v8 = require('v8');
+const { Worker, isMainThread, parentPort, workerData } = require('worker_threads');
+const { getOperation, canonicalEqual, buildDispatch } = require('./pipeline');
+const { ResultCache, buildMeta, planIncremental, makeLookup, lineHash } = require('./compare-cache');
+const { BodyStore, findComparison } = require('./body-store');
+const { createReadStream, lineBoundaries } = require('./seekable-gzip');
+
+const DELTAS_FORMATS = ['full', 'compact'];
 
 function getArg(flag, def) {
   const i = process.argv.indexOf(flag);
   return i >= 0 && i + 1 < process.argv.length ? process.argv[i + 1] : def;
 }
 
-const JOB_DIR = getArg('--job', null);
-if (!JOB_DIR) {
-  console.error('Usage: node engine/compare.js --job <job-directory> [--tolerances <path-to-tolerances.js>]');
-  process.exit(1);
-}
+let JOB_DIR, jobDir, tolerancesPath, workerCount, profiling, profileTop, verifyDispatch;
+let incremental, verifyCache, cacheDir, plan, deltasFormat;
+if (isMainThread) {
+  JOB_DIR = getArg('--job', null);
+  if (!JOB_DIR) {
+    console.error('Usage: node engine/compare.js --job <job-directory> [--tolerances <path-to-tolerances.js>] [--workers N]');
+    process.exit(1);
+  }
 
-const jobDir = path.resolve(JOB_DIR);
-const tolerancesArg = getArg('--tolerances', null);
-const tolerancesPath = tolerancesArg
-  ? path.resolve(tolerancesArg)
-  : path.join(jobDir, 'tolerances.js');
-if (!fs.existsSync(tolerancesPath)) {
-  console.error(`Tolerances file not found: ${tolerancesPath}`);
-  process.exit(1);
+  jobDir = path.resolve(JOB_DIR);
+  const tolerancesArg = getArg('--tolerances', null);
+  tolerancesPath = tolerancesArg
+    ? path.resolve(tolerancesArg)
+    : path.join(jobDir, 'tolerances.js');
+  if (!fs.existsSync(tolerancesPath)) {
+    console.error(`Tolerances file not found: ${tolerancesPath}`);
+    process.exit(1);
+  }
+  workerCount = Math.max(1, parseInt(getArg('--workers', '1'), 10) || 1);
+  profiling = process.argv.includes('--profile');
+  profileTop = parseInt(getArg('--profile-top', '15'), 10);
+  verifyDispatch = process.argv.includes('--verify-dispatch');
+  verifyCache = process.argv.includes('--verify-cache');
+  incremental = verifyCache || process.argv.includes('--incremental');
+  cacheDir = path.join(jobDir, 'results', 'compare-cache');
+  deltasFormat = getArg('--deltas-format', 'full');
+  if (!DELTAS_FORMATS.includes(deltasFormat)) {
+    console.error(`Unknown --deltas-format '${deltasFormat}' (expected ${DELTAS_FORMATS.join(' or ')})`);
+    process.exit(1);
+  }
+} else {
+  ({ tolerancesPath, profiling, verifyDispatch, incremental, verifyCache, cacheDir, plan, deltasFormat } = workerData);
 }
 const { tolerances, getParamValue } = require(tolerancesPath);
-const inputPath = path.join(jobDir, 'comparison.ndjson');
-const outDir = path.join(jobDir, 'results');
+const inputPath = isMainThread ? findComparison(jobDir) : workerData.inputPath;
+const bodyStore = new BodyStore();
+const outDir = isMainThread ? path.join(jobDir, 'results') : null;
+const dispatch = buildDispatch(tolerances);
+const linearOrder = tolerances.map((t, index) => ({ index, t, test: null }));
+
+// ---- Tolerance profiling ----
+
+const HEAP_SAMPLE_EVERY = 10;
+
+class ToleranceProfiler {
+  constructor(tolerances) {
+    this.records = 0;
+    this.sampleHeap = false;
+    this.stats = tolerances.map(t => ({
+      id: t.id,
+      kind: t.kind || 'unknown',
+      matchCalls: 0,
+      skipHits: 0,
+      normalizeHits: 0,
+      normalizeCalls: 0,
+      effectiveNormalizations: 0,
+      matchNs: 0,
+      normalizeNs: 0,
+      heapSampledCalls: 0,
+      heapSampledBytes: 0,
+    }));
+  }
 
-// ---- Comparison ----
+  startRecord() {
+    this.records++;
+    this.sampleHeap = this.records % HEAP_SAMPLE_EVERY === 0;
+  }
+
+  // Time fn() and, on sampled records, the heap growth across it. A GC during
+  // the call can make the delta negative; those are counted as zero.
+  measure(s, field, fn) {
+    const heapBefore = this.sampleHeap ? v8.getHeapStatistics().used_heap_size : 0;
+    const t0 = process.hrtime.bigint();
+    const out = fn();
+    s[field] += Number(process.hrtime.bigint() - t0);
+    if (this.sampleHeap) {
+      s.heapSampledCalls++;
+      s.heapSampledBytes += Math.max(0, v8.getHeapStatistics().used_heap_size - heapBefore);
+    }
+    return out;
+  }
+
+  match(i, t, ctx) {
+    const s = this.stats[i];
+    s.matchCalls++;
+    const action = this.measure(s, 'matchNs', () => t.match(ctx));
+    if (action === 'skip') s.skipHits++;
+    else if (action === 'normalize') s.normalizeHits++;
+    return action;
+  }
+
+  normalize(i, t, ctx) {
+    const s = this.stats[i];
+    s.normalizeCalls++;
+    return this.measure(s, 'normalizeNs', () => t.normalize(ctx));
+  }
 
-function getOperation(url) {
-  const base = url.split('?')[0];
-  if (base.includes('$validate-code')) return 'validate-code';
-  if (base.includes('$batch-validate-code')) return 'batch-validate-code';
-  if (base.includes('$expand')) return 'expand';
-  if (base.includes('$lookup')) return 'lookup';
-  if (base.includes('$subsumes')) return 'subsumes';
-  if (base.includes('$translate')) return 'translate';
-  if (base.includes('/metadata')) return 'metadata';
-  if (base.match(/\/(CodeSystem|ValueSet|ConceptMap)(\/|$)/)) return 'read';
-  return 'other';
+  effective(i) {
+    this.stats[i].effectiveNormalizations++;
+  }
+
+  merge(other) {
+    this.records += other.records;
+    other.stats.forEach((o, i) => {
+      const s = this.stats[i];
+      for (const k of Object.keys(s)) if (typeof s[k] === 'number') s[k] += o[k];
+    });
+  }
+
+  report() {
+    const tolerances = this.stats.map((s, index) => {
+      const calls = s.matchCalls + s.normalizeCalls;
+      return {
+        index,
+        id: s.id,
+        kind: s.kind,
+        matchCalls: s.matchCalls,
+        skipHits: s.skipHits,
+        normalizeHits: s.normalizeHits,
+        effectiveNormalizations: s.effectiveNormalizations,
+        matchMs: +(s.matchNs / 1e6).toFixed(3),
+        normalizeMs: +(s.normalizeNs / 1e6).toFixed(3),
+        totalMs: +((s.matchNs + s.normalizeNs) / 1e6).toFixed(3),
+        usPerMatch: s.matchCalls ? +(s.matchNs / s.matchCalls / 1e3).toFixed(3) : 0,
+        allocBytesEst: s.heapSampledCalls ? Math.round(s.heapSampledBytes / s.heapSampledCalls * calls) : null,
+      };
+    });
+    return {
+      timestamp: new Date().toISOString(),
+      records: this.records,
+      heapSampleEvery: HEAP_SAMPLE_EVERY,
+      totalMs: +tolerances.reduce((a, t) => a + t.totalMs, 0).toFixed(3),
+      neverFired: tolerances.filter(t => t.skipHits === 0 && t.normalizeHits === 0).map(t => t.id),
+      neverEffective: tolerances
+        .filter(t => t.normalizeHits > 0 && t.effectiveNormalizations === 0 && t.skipHits === 0)
+        .map(t => t.id),
+      tolerances,
+    };
+  }
 }
 
+const profiler = profiling ? new ToleranceProfiler(tolerances) : null;
+
+// ---- Dispatch verification ----
+
+const verifier = verifyDispatch ? { records: 0, mismatches: 0, examples: [], violations: {} } : null;
+
+function verifyRecord(record, comparison) {
+  verifier.records++;
+  const linear = compareRecord(record, {
+    linear: true,
+    onViolation: (t, action) => {
+      if (!verifier.violations[t.id]) {
+        verifier.violations[t.id] = { count: 0, action, exampleId: record.id, exampleUrl: record.url };
+      }
+      verifier.violations[t.id].count++;
+    },
+  });
+  if (JSON.stringify(linear) !== JSON.stringify(comparison)) {
+    verifier.mismatches++;
+    if (verifier.examples.length < 5) {
+      verifier.examples.push({ id: record.id, url: record.url, dispatched: comparison, linear });
+    }
+  }
+}
+
+function mergeVerifier(other) {
+  verifier.records += other.records;
+  verifier.mismatches += other.mismatches;
+  verifier.examples.push(...other.examples.slice(0, 5 - verifier.examples.length));
+  for (const [id, v] of Object.entries(other.violations)) {
+    if (verifier.violations[id]) verifier.violations[id].count += v.count;
+    else verifier.violations[id] = v;
+  }
+}
+
+function reportVerifier() {
+  const violations = Object.entries(verifier.violations);
+  console.log(`\nDispatch verification: ${verifier.records} records, ` +
+    `${verifier.mismatches} result mismatch(es), ${violations.length} selector violation(s)`);
+  for (const ex of verifier.examples) {
+    console.log(`  MISMATCH ${ex.id} ${ex.url}`);
+    console.log(`    dispatched: ${JSON.stringify(ex.dispatched).slice(0, 200)}`);
+    console.log(`    linear:     ${JSON.stringify(ex.linear).slice(0, 200)}`);
+  }
+  for (const [id, v] of violations) {
+    console.log(`  VIOLATION ${id}: returned '${v.action}' on ${v.count} record(s) outside its selector, e.g. ${v.exampleId} ${v.exampleUrl}`);
+  }
+  return verifier.mismatches === 0 && violations.length === 0;
+}
+
+// ---- Parsed-body cache ----
+
+const PARSE_CACHE_CHARS = 32 * 1024 * 1024;
+
 /**
- * Deep-sort all object keys recursively so JSON.stringify produces
- * a canonical string regardless of key insertion order.
- *
- * JSON object key order carries no meaning in FHIR. This is fundamental
- * to comparison semantics, not a tolerance — it applies unconditionally.
+ * Parsed bodies keyed by capture hash. A body is cached the second time its
+ * hash turns up (so one-off bodies cost nothing), and a hit must also have
+ * the same text. A cached tree is shared, so compareRecord takes a private
+ * copy before the first normalize (copying a tree is several times faster
+ * than parsing it again); match() must not modify ctx anyway.
  */
-function sortKeysDeep(obj) {
-  if (obj === null || obj === undefined || typeof obj !== 'object') return obj;
-  if (Array.isArray(obj)) return obj.map(sortKeysDeep);
-  const sorted = {};
-  for (const key of Object.keys(obj).sort()) {
-    sorted[key] = sortKeysDeep(obj[key]);
-  }
-  return sorted;
+class ParseCache {
+  constructor(maxChars) {
+    this.maxChars = maxChars;
+    this.seen = new Set();
+    this.entries = new Map();
+    this.chars = 0;
+    this.stats = emptyParseStats();
+  }
+
+  /** { value, shared } for text; throws like JSON.parse. */
+  parse(text, hash) {
+    const hit = hash ? this.entries.get(hash) : undefined;
+    if (hit && hit.text === text) {
+      this.stats.reused++;
+      this.stats.reusedChars += text.length;
+      return { value: hit.value, shared: true };
+    }
+    const started = process.hrtime.bigint();
+    const value = JSON.parse(text);
+    this.stats.parseNs += Number(process.hrtime.bigint() - started);
+    this.stats.parsed++;
+    this.stats.parsedChars += text.length;
+    if (!hash || hit || !this.seen.has(hash)) {
+      if (hash) this.seen.add(hash);
+      return { value, shared: false };
+    }
+    this.entries.set(hash, { text, value });
+    this.chars += text.length;
+    for (const [k, e] of this.entries) {
+      if (this.chars <= this.maxChars) break;
+      this.entries.delete(k);
+      this.chars -= e.text.length;
+    }
+    return { value, shared: true };
+  }
+
+  /** A private copy of a shared tree, for normalize to work on. */
+  copy(value) {
+    const started = process.hrtime.bigint();
+    const copied = copyJson(value);
+    this.stats.copyNs += Number(process.hrtime.bigint() - started);
+    this.stats.copied++;
+    return copied;
+  }
+}
+
+/** Deep copy of a JSON.parse result, identical to parsing the text again. */
+function copyJson(v) {
+  if (v === null || typeof v !== 'object') return v;
+  if (Array.isArray(v)) {
+    const out = new Array(v.length);
+    for (let i = 0; i < v.length; i++) out[i] = copyJson(v[i]);
+    return out;
+  }
+  const out = {};
+  for (const key in v) {
+    // JSON.parse makes '__proto__' an own property; assignment would not
+    if (key === '__proto__') {
+      Object.defineProperty(out, key, { value: copyJson(v[key]), enumerable: true, writable: true, configurable: true });
+    } else {
+      out[key] = copyJson(v[key]);
+    }
+  }
+  return out;
 }
 
-function deepEqual(a, b) {
-  return JSON.stringify(sortKeysDeep(a)) === JSON.stringify(sortKeysDeep(b));
+function emptyParseStats() {
+  return { parsed: 0, parsedChars: 0, parseNs: 0, reused: 0, reusedChars: 0, copied: 0, copyNs: 0 };
+}
+
+const parseCache = new ParseCache(PARSE_CACHE_CHARS);
+
+function mergeParseStats(other) {
+  for (const [k, n] of Object.entries(other)) parseCache.stats[k] += n;
 }
 
-function compareRecord(record) {
+function reportParseStats() {
+  const s = parseCache.stats;
+  // Saved time is estimated at the run's average parse speed, less copying
+  const nsPerChar = s.parsedChars ? s.parseNs / s.parsedChars : 0;
+  const savedMs = (s.reusedChars * nsPerChar - s.copyNs) / 1e6;
+  console.log(`\nBody parsing: ${s.parsed} parsed (${(s.parseNs / 1e6).toFixed(0)} ms), ` +
+    `${s.reused} reused by hash, ${s.copied} copied for normalize (${(s.copyNs / 1e6).toFixed(0)} ms); ` +
+    `~${savedMs.toFixed(0)} ms saved`);
+}
+
+// ---- Comparison ----
+
+// ---- Incremental result cache ----
+
+const cacheStats = incremental ? { reused: 0, recomputed: 0, mismatches: 0, examples: [] } : null;
+
+function mergeCacheStats(other) {
+  cacheStats.reused += other.reused;
+  cacheStats.recomputed += other.recomputed;
+  cacheStats.mismatches += other.mismatches;
+  cacheStats.examples.push(...other.examples.slice(0, 5 - cacheStats.examples.length));
+}
+
+function reportCacheStats() {
+  console.log(`\nIncremental: ${cacheStats.reused} record(s) reused, ${cacheStats.recomputed} recomputed`);
+  if (!verifyCache) return true;
+  console.log(`Cache verification: ${cacheStats.reused} reused record(s) recomputed from scratch, ` +
+    `${cacheStats.mismatches} mismatch(es)`);
+  for (const ex of cacheStats.examples) {
+    console.log(`  MISMATCH ${ex.id} ${ex.url}`);
+    console.log(`    cached: ${JSON.stringify(ex.cached).slice(0, 200)}`);
+    console.log(`    fresh:  ${JSON.stringify(ex.fresh).slice(0, 200)}`);
+  }
+  return cacheStats.mismatches === 0;
+}
+
+/**
+ * Run the pipeline on one record. With linear set, every tolerance is
+ * matched (the dispatch index is bypassed) and onViolation(t, action) is
+ * called when a tolerance matches a record its selector excludes. If a
+ * touched array is given, the ids of tolerances whose match() returned
+ * skip/normalize are pushed onto it in order.
+ */
+function compareRecord(record, { linear = false, onViolation = null, touched = null } = {}) {
   const op = getOperation(record.url);
+  const prof = linear ? null : profiler;
   const prodStatus = record.prod.status;
   const devStatus = record.dev.status;
 
-  // Parse bodies
+  // Parse bodies. Byte-identical bodies (same capture hash and text), within
+  // the record or across records via parseCache, are parsed once and shared
+  // until a tolerance normalizes them; match() must not modify ctx, so
+  // sharing is invisible to the pipeline.
+  const sameRaw = (record.match === true || record.prod.hash === record.dev.hash) &&
+    record.prodBody === record.devBody;
   let prod, dev;
-  try { prod = JSON.parse(record.prodBody); } catch { prod = null; }
-  try { dev = JSON.parse(record.devBody); } catch { dev = null; }
+  let prodShared = false;
+  let devShared = false;
+  try { ({ value: prod, shared: prodShared } = parseCache.parse(record.prodBody, record.prod.hash)); } catch { prod = null; }
+  if (sameRaw) {
+    dev = prod;
+    devShared = prod !== null;
+  } else {
+    try { ({ value: dev, shared: devShared } = parseCache.parse(record.devBody, record.dev.hash)); } catch { dev = null; }
+  }
 
   // Apply tolerance pipeline — track which kinds contributed
   const ctx = { record, prod, dev };
   let normalizedBy = null; // 'equiv-autofix' or 'temp-tolerance'
-  for (const t of tolerances) {
-    const action = t.match(ctx);
+  // Change detection serializes the bodies, so it is only done while the
+  // result could still alter normalizedBy (or when profiling). Each side's
+  // string from the previous normalize is reused as the next "before" while
+  // ctx still holds the same object and nothing ran in between; match() must
+  // not modify ctx. A normalize may edit the bodies in place and return them,
+  // so one whose output is not measured clears the reuse.
+  const UNSEEN = { prod: null, prodText: null, dev: null, devText: null };
+  let seen = UNSEEN;
+  if (prof) prof.startRecord();
+  for (const { index: i, t, test } of linear ? linearOrder : dispatch.forOp(op)) {
+    if (test && !test(record)) continue;
+    const action = prof ? prof.match(i, t, ctx) : t.match(ctx);
+    if (onViolation && (action === 'skip' || action === 'normalize') && !dispatch.selects(i, record, op)) {
+      onViolation(t, action);
+    }
+    if (touched && (action === 'skip' || action === 'normalize')) touched.push(t.id);
     if (action === 'skip') {
       return { category: 'SKIP', reason: t.id, kind: t.kind || 'unknown', op };
     }
     if (action === 'normalize' && ctx.prod && ctx.dev) {
-      const before = JSON.stringify(ctx.prod) + JSON.stringify(ctx.dev);
-      const result = t.normalize(ctx);
+      if (prodShared) {
+        ctx.prod = parseCache.copy(ctx.prod);
+        prodShared = false;
+      }
+      if (devShared) {
+        ctx.dev = parseCache.copy(ctx.dev);
+        devShared = false;
+      }
+      const canEscalate = normalizedBy !== 'temp-tolerance' &&
+        (!normalizedBy || t.kind === 'temp-tolerance');
+      if (!canEscalate && !prof) {
+        const result = t.normalize(ctx);
+        ctx.prod = result.prod;
+        ctx.dev = result.dev;
+        seen = UNSEEN;
+        continue;
+      }
+      const prodBefore = seen.prod === ctx.prod && seen.prodText !== null ? seen.prodText : JSON.stringify(ctx.prod);
+      const devBefore = seen.dev === ctx.dev && seen.devText !== null ? seen.devText : JSON.stringify(ctx.dev);
+      const result = prof ? prof.normalize(i, t, ctx) : t.normalize(ctx);
       ctx.prod = result.prod;
       ctx.dev = result.dev;
-      const after = JSON.stringify(ctx.prod) + JSON.stringify(ctx.dev);
-      if (before !== after) {
+      const prodAfter = JSON.stringify(ctx.prod);
+      let changed = prodAfter !== prodBefore;
+      // A changed temp-tolerance is final, so dev need not be serialized then
+      let devAfter = null;
+      if (!changed || t.kind !== 'temp-tolerance') {
+        devAfter = JSON.stringify(ctx.dev);
+        changed = changed || devAfter !== devBefore;
+      }
+      seen = { prod: ctx.prod, prodText: prodAfter, dev: ctx.dev, devText: devAfter };
+      if (changed) {
+        if (prof) prof.effective(i);
         // Escalate: temp-tolerance trumps equiv-autofix
         if (t.kind === 'temp-tolerance') normalizedBy = 'temp-tolerance';
         else if (!normalizedBy) normalizedBy = t.kind || 'equiv-autofix';
@@ -145,8 +513,8 @@ function compareRecord(record) {
     };
   }
 
-  // Deep compare normalized bodies
-  if (deepEqual(prod, dev)) {
+  // Deep compare normalized bodies (key order is not significant)
+  if (canonicalEqual(prod, dev)) {
     return { category: 'OK', normalizedBy, op };
   }
 
@@ -166,7 +534,7 @@ function findParameterDiffs(prod, dev) {
   for (const [name, param] of prodParams) {
     if (!devParams.has(name)) {
       diffs.push({ type: 'missing-in-dev', param: name });
-    } else if (!deepEqual(param, devParams.get(name))) {
+    } else if (!canonicalEqual(param, devParams.get(name))) {
       diffs.push({ type: 'value-differs', param: name });
     }
   }
@@ -181,24 +549,29 @@ function findParameterDiffs(prod, dev) {
 // ---- Output writers ----
 
 class OutputWriter {
-  constructor(outDir) {
-    this.outDir = outDir;
-    this.deltasDir = path.join(outDir, 'deltas');
-    fs.mkdirSync(this.deltasDir, { recursive: true });
-    const filePath = path.join(this.deltasDir, 'deltas.ndjson');
+  /**
+   * With sourceFile set (compact format), records point into sourceFile,
+   * given relative to the deltas directory, instead of embedding bodies.
+   */
+  constructor(filePath, sourceFile = null) {
+    fs.mkdirSync(path.dirname(filePath), { recursive: true });
     this.stream = fs.createWriteStream(filePath);
+    this.sourceFile = sourceFile;
     this.counts = {};
   }
 
-  write(category, record, comparison) {
+  write(category, record, comparison, src) {
     this.counts[category] = (this.counts[category] || 0) + 1;
-    this.stream.write(JSON.stringify({
+    const head = {
       id: record.id,
       url: record.url,
       method: record.method,
       prod: record.prod,
       dev: record.dev,
       comparison,
+    };
+    this.stream.write(JSON.stringify(this.sourceFile ? { ...head, src: { file: this.sourceFile, ...src } } : {
+      ...head,
       prodBody: record.prodBody,
       devBody: record.devBody,
       ...(record.requestBody ? { requestBody: record.requestBody } : {}),
@@ -210,20 +583,10 @@ class OutputWriter {
   }
 }
 
-// ---- Main ----
-
-async function main() {
-  console.log(`Job directory: ${jobDir}`);
-  console.log(`Tolerances: ${tolerancesPath}`);
-  console.log(`Loaded ${tolerances.length} tolerances`);
+// ---- Record loop ----
 
-  fs.mkdirSync(outDir, { recursive: true });
-
-  const writers = new OutputWriter(outDir);
-  const summary = {
-    jobDir: JOB_DIR,
-    tolerancesPath,
-    timestamp: new Date().toISOString(),
+function emptyCounters() {
+  return {
     totalRecords: 0,
     skipped: 0,
     skippedByKind: {},
@@ -232,58 +595,292 @@ async function main() {
     okBreakdown: { strict: 0, 'equiv-autofix': 0, 'temp-tolerance': 0 },
     operationBreakdown: {},
   };
+}
+
+/**
+ * Compare the records in bytes [start, end) of the input, writing deltas to
+ * out.deltas (and, with --incremental, cache entries to out.entries).
+ * Returns the summary counters for that range. onProgress is called every
+ * 1000 records.
+ */
+async function processRange(start, end, out, onProgress, label = '') {
+  // out.deltas may be a shard file; the pointer is relative to where the
+  // concatenated deltas.ndjson ends up, which is the same directory
+  const compact = deltasFormat === 'compact';
+  const writers = new OutputWriter(out.deltas, compact ? path.relative(path.dirname(out.deltas), inputPath) : null);
+  const counters = emptyCounters();
+  let lookup = null;
+  let entriesOut = null;
+  if (incremental) {
+    if (plan.reuse) lookup = makeLookup(await new ResultCache(cacheDir).load(), plan, dispatch, getOperation);
+    entriesOut = fs.createWriteStream(out.entries);
+  }
 
   const rl = readline.createInterface({
-    input: fs.createReadStream(inputPath),
+    input: createReadStream(inputPath, end === Infinity ? { start } : { start, end: end - 1 }),
     crlfDelay: Infinity,
   });
 
+  // Byte position of each line, for compact pointers. Assumes '\n' line
+  // ends; readers check the pointed-to line against its sha1.
+  let offset = start;
   for await (const line of rl) {
+    const lineOffset = offset;
+    if (compact) offset += Buffer.byteLength(line) + 1;
     if (!line.trim()) continue;
-    summary.totalRecords++;
+    counters.totalRecords++;
 
     let record;
     try {
-      record = JSON.parse(line);
+      record = bodyStore.resolve(JSON.parse(line));
     } catch (e) {
-      console.error(`Line ${summary.totalRecords}: parse error: ${e.message}`);
+      console.error(`${label}Line ${counters.totalRecords}: parse error: ${e.message}`);
       continue;
     }
 
-    const comparison = compareRecord(record);
+    let comparison;
+    let hash = null;
+    if (incremental) {
+      hash = lineHash(line);
+      const cached = lookup && lookup(record, hash);
+      let touched;
+      if (cached) {
+        cacheStats.reused++;
+        comparison = verifyCache ? verifyCached(record, cached.c) : cached.c;
+        touched = cached.t;
+      } else {
+        cacheStats.recomputed++;
+        touched = [];
+        comparison = compareRecord(record, { touched });
+      }
+      entriesOut.write(JSON.stringify({ id: record.id, h: hash, t: touched, c: comparison }) + '\n');
+    } else {
+      comparison = compareRecord(record);
+    }
     const category = comparison.category;
+    if (verifier) verifyRecord(record, comparison);
 
     // Handle skipped records
     if (category === 'SKIP') {
-      summary.skipped++;
+      counters.skipped++;
       const kind = comparison.kind || 'unknown';
-      summary.skippedByKind[kind] = (summary.skippedByKind[kind] || 0) + 1;
-      summary.skippedReasons[comparison.reason] = (summary.skippedReasons[comparison.reason] || 0) + 1;
+      counters.skippedByKind[kind] = (counters.skippedByKind[kind] || 0) + 1;
+      counters.skippedReasons[comparison.reason] = (counters.skippedReasons[comparison.reason] || 0) + 1;
       continue;
     }
 
     // Track stats
-    summary.categories[category] = (summary.categories[category] || 0) + 1;
+    counters.categories[category] = (counters.categories[category] || 0) + 1;
     if (category === 'OK') {
       // Use original match field for strict; key-sorting counts as equiv-autofix
       const bucket = record.match === true ? 'strict' : (comparison.normalizedBy || 'equiv-autofix');
-      summary.okBreakdown[bucket] = (summary.okBreakdown[bucket] || 0) + 1;
+      counters.okBreakdown[bucket] = (counters.okBreakdown[bucket] || 0) + 1;
     }
     const op = comparison.op || 'unknown';
-    if (!summary.operationBreakdown[op]) summary.operationBreakdown[op] = {};
-    summary.operationBreakdown[op][category] = (summary.operationBreakdown[op][category] || 0) + 1;
+    if (!counters.operationBreakdown[op]) counters.operationBreakdown[op] = {};
+    counters.operationBreakdown[op][category] = (counters.operationBreakdown[op][category] || 0) + 1;
 
     // Write delta (skip OK matches)
     if (category !== 'OK') {
-      writers.write(category, record, comparison);
+      writers.write(category, record, comparison, compact && {
+        offset: lineOffset, length: offset - lineOffset - 1, sha1: hash || lineHash(line),
+      });
     }
 
-    if (summary.totalRecords % 1000 === 0) {
-      process.stdout.write(`\r  Processed ${summary.totalRecords} records...`);
-    }
+    if (counters.totalRecords % 1000 === 0) onProgress(counters.totalRecords);
   }
 
   await writers.close();
+  if (entriesOut) await new Promise(r => entriesOut.end(r));
+  return counters;
+}
+
+/** Recompute a reused record; on a mismatch, count it and keep the fresh result. */
+function verifyCached(record, cached) {
+  const fresh = compareRecord(record);
+  // Compare as a round trip through JSON, which is how cached results are stored
+  if (JSON.stringify(fresh) !== JSON.stringify(cached)) {
+    cacheStats.mismatches++;
+    if (cacheStats.examples.length < 5) cacheStats.examples.push({ id: record.id, url: record.url, cached, fresh });
+    return fresh;
+  }
+  return cached;
+}
+
+/**
+ * Add one shard's counters into the running totals. Merging shards in input
+ * order inserts keys in first-seen order, exactly as a single pass would.
+ */
+function mergeCounters(into, from) {
+  into.totalRecords += from.totalRecords;
+  into.skipped += from.skipped;
+  for (const field of ['skippedByKind', 'skippedReasons', 'categories', 'okBreakdown']) {
+    for (const [k, n] of Object.entries(from[field])) into[field][k] = (into[field][k] || 0) + n;
+  }
+  for (const [op, categories] of Object.entries(from.operationBreakdown)) {
+    if (!into.operationBreakdown[op]) into.operationBreakdown[op] = {};
+    for (const [c, n] of Object.entries(categories)) {
+      into.operationBreakdown[op][c] = (into.operationBreakdown[op][c] || 0) + n;
+    }
+  }
+}
+
+/**
+ * Split a file into up to n byte ranges [start, end), each ending just after
+ * a newline (or at EOF), so no record straddles two ranges. A seekable gzip
+ * input is split at frame boundaries.
+ */
+function splitRanges(filePath, n) {
+  const frameBounds = lineBoundaries(filePath, n);
+  if (frameBounds) return toRanges(frameBounds);
+  const size = fs.statSync(filePath).size;
+  const fd = fs.openSync(filePath, 'r');
+  const buf = Buffer.alloc(64 * 1024);
+  const bounds = [0];
+  try {
+    for (let i = 1; i < n; i++) {
+      let pos = Math.max(Math.floor(size * i / n), bounds[bounds.length - 1]);
+      let cut = size;
+      while (pos < size) {
+        const read = fs.readSync(fd, buf, 0, buf.length, pos);
+        const nl = buf.indexOf(10);
+        if (nl >= 0 && nl < read) { cut = pos + nl + 1; break; }
+        pos += read;
+      }
+      bounds.push(cut);
+    }
+  } finally {
+    fs.closeSync(fd);
+  }
+  bounds.push(size);
+  return toRanges(bounds);
+}
+
+function toRanges(bounds) {
+  const ranges = [];
+  for (let i = 0; i + 1 < bounds.length; i++) {
+    if (bounds[i + 1] > bounds[i]) ranges.push([bounds[i], bounds[i + 1]]);
+  }
+  return ranges;
+}
+
+function runWorker(range, out, index, onProgress) {
+  return new Promise((resolve, reject) => {
+    const worker = new Worker(__filename, {
+      workerData: {
+        tolerancesPath, profiling, verifyDispatch, incremental, verifyCache, cacheDir, plan, deltasFormat,
+        inputPath, start: range[0], end: range[1], out, index,
+      },
+    });
+    worker.on('message', msg => {
+      if (msg.type === 'progress') onProgress(index, msg.processed);
+      else if (msg.type === 'done') {
+        if (profiler) profiler.merge(msg.profile);
+        if (verifier) mergeVerifier(msg.verify);
+        if (cacheStats) mergeCacheStats(msg.cache);
+        mergeParseStats(msg.parse);
+        resolve(msg.counters);
+      }
+    });
+    worker.on('error', reject);
+    worker.on('exit', code => {
+      if (code !== 0) reject(new Error(`Worker ${index} exited with code ${code}`));
+    });
+  });
+}
+
+async function appendFile(src, out) {
+  await new Promise((resolve, reject) => {
+    const input = fs.createReadStream(src);
+    input.on('error', reject);
+    input.on('end', resolve);
+    input.pipe(out, { end: false });
+  });
+}
+
+async function concatShards(shardPaths, dest) {
+  const out = fs.createWriteStream(dest);
+  for (const shardPath of shardPaths) {
+    await appendFile(shardPath, out);
+    fs.unlinkSync(shardPath);
+  }
+  await new Promise(r => out.end(r));
+}
+
+async function processSharded(out, n) {
+  const ranges = splitRanges(inputPath, n);
+  const shardOuts = ranges.map((_, i) => ({
+    deltas: `${out.deltas}.shard-${i}`,
+    entries: out.entries && `${out.entries}.shard-${i}`,
+  }));
+  const processed = ranges.map(() => 0);
+  const shardCounters = await Promise.all(ranges.map((range, i) =>
+    runWorker(range, shardOuts[i], i, (index, count) => {
+      processed[index] = count;
+      process.stdout.write(`\r  Processed ${processed.reduce((a, b) => a + b, 0)} records...`);
+    })));
+
+  // Stitch the shard outputs back together in input order
+  await concatShards(shardOuts.map(o => o.deltas), out.deltas);
+  if (out.entries) await concatShards(shardOuts.map(o => o.entries), out.entries);
+
+  const counters = emptyCounters();
+  for (const c of shardCounters) mergeCounters(counters, c);
+  return { counters, shards: ranges.length };
+}
+
+// ---- Main ----
+
+async function main() {
+  console.log(`Job directory: ${jobDir}`);
+  console.log(`Tolerances: ${tolerancesPath}`);
+  console.log(`Loaded ${tolerances.length} tolerances (${dispatch.withSelector} with selectors)`);
+
+  fs.mkdirSync(outDir, { recursive: true });
+
+  const summary = {
+    jobDir: JOB_DIR,
+    tolerancesPath,
+    timestamp: new Date().toISOString(),
+  };
+
+  const out = { deltas: path.join(outDir, 'deltas', 'deltas.ndjson'), entries: null };
+  let cache = null;
+  let meta = null;
+  if (incremental) {
+    cache = new ResultCache(cacheDir);
+    meta = buildMeta(tolerances, tolerancesPath);
+    plan = profiling || verifyDispatch
+      ? { reuse: false, reason: '--profile/--verify-dispatch run every record' }
+      : planIncremental(cache.readMeta(), meta, tolerances);
+    console.log(plan.reuse
+      ? `Incremental: reusing previous results (${plan.invalid.length} removed/edited, ` +
+        `${plan.added.length} new/edited tolerance(s))`
+      : `Incremental: full run (${plan.reason})`);
+    fs.mkdirSync(cacheDir, { recursive: true });
+    out.entries = `${cache.entriesPath}.new`;
+  }
+
+  let counters;
+  if (workerCount > 1) {
+    fs.mkdirSync(path.dirname(out.deltas), { recursive: true });
+    const result = await processSharded(out, workerCount);
+    counters = result.counters;
+    console.log(`\n  (${result.shards} worker thread(s))`);
+  } else {
+    counters = await processRange(0, Infinity, out, count => {
+      process.stdout.write(`\r  Processed ${count} records...`);
+    });
+  }
+  Object.assign(summary, counters);
+
+  if (cache) {
+    // Drop meta first: a crash before the new meta is written must not leave
+    // old meta describing the new entries
+    cache.invalidate();
+    fs.renameSync(out.entries, cache.entriesPath);
+    cache.writeMeta(meta);
+  }
 
   // Write summary
   const summaryPath = path.join(outDir, 'summary.json');
@@ -301,7 +898,54 @@ async function main() {
     const parts = Object.entries(categories).sort().map(([c, n]) => `${c}=${n}`).join(', ');
     console.log(`  ${op}: ${parts}`);
   }
+  reportParseStats();
+  if (profiler) writeProfile(profiler.report());
+
   console.log(`\nResults written to ${outDir}/`);
+
+  if (verifier && !reportVerifier()) process.exitCode = 1;
+  if (cacheStats && !reportCacheStats()) process.exitCode = 1;
+}
+
+function writeProfile(profile) {
+  const profilePath = path.join(outDir, 'tolerance-profile.json');
+  fs.writeFileSync(profilePath, JSON.stringify(profile, null, 2));
+
+  const top = [...profile.tolerances].sort((a, b) => b.totalMs - a.totalMs).slice(0, profileTop);
+  console.log(`\nTolerance profile (${profile.records} records, ${profile.totalMs.toFixed(1)} ms in tolerances):`);
+  console.log(`  ${'ms'.padStart(9)} ${'µs/match'.padStart(9)} ${'matches'.padStart(8)} ${'skip'.padStart(6)} ${'norm'.padStart(6)} ${'eff'.padStart(6)} ${'alloc~'.padStart(8)}  id`);
+  for (const t of top) {
+    const alloc = t.allocBytesEst === null ? '-' : `${(t.allocBytesEst / 1048576).toFixed(1)}M`;
+    console.log(`  ${t.totalMs.toFixed(1).padStart(9)} ${t.usPerMatch.toFixed(2).padStart(9)} ${String(t.matchCalls).padStart(8)} ` +
+      `${String(t.skipHits).padStart(6)} ${String(t.normalizeHits).padStart(6)} ${String(t.effectiveNormalizations).padStart(6)} ${alloc.padStart(8)}  ${t.id}`);
+  }
+  const list = ids => ids.slice(0, 10).join(', ') + (ids.length > 10 ? `, ... (${ids.length - 10} more)` : '');
+  if (profile.neverFired.length) {
+    console.log(`  Never fired (${profile.neverFired.length}): ${list(profile.neverFired)}`);
+  }
+  if (profile.neverEffective.length) {
+    console.log(`  Matched but never changed a record (${profile.neverEffective.length}): ${list(profile.neverEffective)}`);
+  }
+  console.log(`  Full profile: ${profilePath}`);
 }
 
-main().catch(e => { console.error(e); process.exit(1); });
+async function workerMain() {
+  const { start, end, out, index } = workerData;
+  const counters = await processRange(start, end, out, processed => {
+    parentPort.postMessage({ type: 'progress', processed });
+  }, `Shard ${index}, `);
+  parentPort.postMessage({
+    type: 'done',
+    counters,
+    profile: profiler && { records: profiler.records, stats: profiler.stats },
+    verify: verifier,
+    cache: cacheStats,
+    parse: parseCache.stats,
+  });
+}
+
+if (isMainThread) {
+  main().catch(e => { console.error(e); process.exit(1); });
+} else {
+  workerMain().catch(e => { console.error(e); process.exit(1); });
+}
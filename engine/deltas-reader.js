@@ -0,0 +1,187 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Reader for deltas.ndjson in either format compare.js writes:
+ *
+ *   full     every record embeds prodBody, devBody (and requestBody)
+ *   compact  (--deltas-format compact) the bodies are left out and the
+ *            record carries src: { file, offset, length, sha1 } instead --
+ *            the byte range of its line in comparison.ndjson, with file
+ *            relative to the directory of the deltas file (a packed or
+ *            seekable gzip comparison file works too; offsets are then into
+ *            the uncompressed NDJSON, and packed bodies come from the body
+ *            store)
+ *
+ * hydrate() turns a compact record back into exactly the full record
+ * compare.js would have written. The pointed-to line must still hash to
+ * sha1; if it does not (the comparison file was rewritten), the record's
+ * lines are looked up by id through the comparison file's ndjson-index
+ * sidecar, and if none of them hashes to sha1 either the deltas are stale
+ * and hydrate() throws.
+ *
+ * Mirrors engine/deltas_reader.py.
+ *
+ * Usage:
+ *   node engine/deltas-reader.js hydrate <deltas.ndjson>                  # full records to stdout
+ *   node engine/deltas-reader.js compact <deltas.ndjson> [<comparison.ndjson>] [--out <file>]
+ *
+ * compact converts a full deltas file (e.g. an archived deltas.<date>.ndjson)
+ * by locating each record in the comparison file, by default the job's
+ * comparison file two directories up (findComparison in body-store.js).
+ * Pointers are relative to the directory of the compact file: with --out,
+ * the output's; on stdout, the input's, so the output must then be kept in
+ * the same directory as the input. Moving a compact file (or the comparison
+ * file) elsewhere later breaks its pointers. Records whose bodies no longer
+ * match the comparison file are kept in full.
+ */
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const { NdjsonIndex, iterLines } = require('./ndjson-index');
+const { BodyStore, findComparison } = require('./body-store');
+const { openReader } = require('./seekable-gzip');
+
+const BODY_FIELDS = ['prodBody', 'devBody', 'requestBody'];
+
+function sha1(buf) {
+  return crypto.createHash('sha1').update(buf).digest('hex');
+}
+
+function isCompact(record) {
+  return Boolean(record && record.src);
+}
+
+class DeltasReader {
+  constructor(deltasFile) {
+    this.file = deltasFile;
+    this.dir = path.dirname(path.resolve(deltasFile));
+    this.readers = new Map();
+    this.indexes = new Map();
+    this.store = new BodyStore();
+  }
+
+  close() {
+    for (const reader of this.readers.values()) reader.close();
+    for (const index of this.indexes.values()) index.close();
+    this.readers.clear();
+    this.indexes.clear();
+  }
+
+  sourceReader(file) {
+    if (!this.readers.has(file)) this.readers.set(file, openReader(file));
+    return this.readers.get(file);
+  }
+
+  /** The comparison line a compact record points to, as a Buffer. */
+  sourceLine(record) {
+    const { src } = record;
+    const file = path.resolve(this.dir, src.file);
+    const buf = this.sourceReader(file).read(src.offset, src.length);
+    if (buf.length === src.length && sha1(buf) === src.sha1) return buf;
+
+    // Offsets moved: find the line by id instead
+    if (!this.indexes.has(file)) this.indexes.set(file, NdjsonIndex.open(file));
+    const index = this.indexes.get(file);
+    for (const entry of index.lookupAll(record.id)) {
+      const line = Buffer.from(index.readLine(entry), 'utf8');
+      if (sha1(line) === src.sha1) return line;
+    }
+    throw new Error(`${record.id}: its line in ${src.file} has changed since compare.js ran; rerun compare.js`);
+  }
+
+  /** The full record for record; full records are returned as they are. */
+  hydrate(record) {
+    if (!isCompact(record)) return record;
+    const source = this.store.resolve(JSON.parse(this.sourceLine(record).toString('utf8')));
+    const { src, ...head } = record;
+    return {
+      ...head,
+      prodBody: source.prodBody,
+      devBody: source.devBody,
+      ...(source.requestBody ? { requestBody: source.requestBody } : {}),
+    };
+  }
+
+  /** Yield every record of the deltas file, hydrated unless hydrate is false. */
+  *records({ hydrate = true } = {}) {
+    for (const { line } of iterLines(this.file)) {
+      const text = line.toString('utf8');
+      if (!text.trim()) continue;
+      const record = JSON.parse(text);
+      yield hydrate ? this.hydrate(record) : record;
+    }
+  }
+}
+
+/** Compact form of a full record, or null if no line for its id in index's file has its bodies. */
+function compactRecord(record, index, relFile) {
+  for (const entry of index.lookupAll(record.id)) {
+    const line = index.readLine(entry);
+    const source = JSON.parse(line);
+    if (BODY_FIELDS.some(f => (source[f] || undefined) !== (record[f] || undefined))) continue;
+    const head = { ...record };
+    for (const f of BODY_FIELDS) delete head[f];
+    return { ...head, src: { file: relFile, offset: entry.offset, length: entry.length, sha1: sha1(line) } };
+  }
+  return null;
+}
+
+function main() {
+  const args = process.argv.slice(2);
+  const o = args.indexOf('--out');
+  const outFile = o >= 0 ? args.splice(o, 2)[1] : null;
+  const [command, file, sourceArg] = args;
+  if (command === 'hydrate' && file) {
+    const reader = new DeltasReader(file);
+    let out = '';
+    for (const record of reader.records()) {
+      out += JSON.stringify(record) + '\n';
+      if (out.length > 1 << 22) {
+        process.stdout.write(out);
+        out = '';
+      }
+    }
+    process.stdout.write(out);
+    reader.close();
+  } else if (command === 'compact' && file) {
+    const source = sourceArg || findComparison(path.join(path.dirname(file), '..', '..'));
+    // Pointers resolve against the directory the compact file will live in
+    const relFile = path.relative(path.dirname(path.resolve(outFile || file)), path.resolve(source));
+    const index = NdjsonIndex.open(source);
+    const fd = outFile ? fs.openSync(`${outFile}.${process.pid}.tmp`, 'w') : null;
+    const write = text => (fd === null ? process.stdout.write(text) : fs.writeSync(fd, text));
+    let compacted = 0;
+    let kept = 0;
+    let out = '';
+    for (const { line } of iterLines(file)) {
+      const text = line.toString('utf8');
+      if (!text.trim()) continue;
+      const record = JSON.parse(text);
+      const compact = isCompact(record) ? record : compactRecord(record, index, relFile);
+      if (compact) compacted++;
+      else kept++;
+      out += JSON.stringify(compact || record) + '\n';
+      if (out.length > 1 << 22) {
+        write(out);
+        out = '';
+      }
+    }
+    write(out);
+    index.close();
+    if (fd !== null) {
+      fs.closeSync(fd);
+      fs.renameSync(`${outFile}.${process.pid}.tmp`, outFile);
+    }
+    console.error(`${compacted} records compacted, ${kept} kept in full (bodies differ from ${source})`);
+  } else {
+    console.error('Usage:\n  node engine/deltas-reader.js hydrate <deltas.ndjson>\n' +
+      '  node engine/deltas-reader.js compact <deltas.ndjson> [<comparison.ndjson>] [--out <file>]');
+    process.exit(1);
+  }
+}
+
+if (require.main === module) main();
+
+module.exports = { DeltasReader, isCompact };
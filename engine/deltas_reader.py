@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Reader for deltas.ndjson in either format compare.js writes:
+
+  full     every record embeds prodBody, devBody (and requestBody)
+  compact  (--deltas-format compact) the bodies are left out and the record
+           carries src: {file, offset, length, sha1} instead -- the byte
+           range of its line in comparison.ndjson, with file relative to the
+           directory of the deltas file (a packed or seekable gzip
+           comparison file works too; offsets are then into the uncompressed
+           NDJSON, and packed bodies come from the body store, see
+           body_store.py)
+
+hydrate() turns a compact record back into exactly the full record
+compare.js would have written. The pointed-to line must still hash to sha1;
+if it does not (the comparison file was rewritten), the record's lines are
+looked up by id through the comparison file's ndjson_index sidecar, and if
+none of them hashes to sha1 either the deltas are stale and hydrate() raises
+ValueError.
+
+Mirrors engine/deltas-reader.js, which also converts full deltas files to
+the compact format.
+
+Usage:
+  python3 engine/deltas_reader.py hydrate <deltas.ndjson>   # full records to stdout
+
+From a script:
+  from deltas_reader import DeltasReader
+  with DeltasReader("jobs/<round>/results/deltas/deltas.ndjson") as reader:
+      for record in reader.records():
+          ...
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+from body_store import BodyStore
+from ndjson_index import NdjsonIndex
+from seekable_gzip import open_reader
+
+
+def is_compact(record):
+    return bool(record and record.get("src"))
+
+
+class DeltasReader:
+    def __init__(self, path):
+        self.path = path
+        self.dir = os.path.dirname(os.path.abspath(path))
+        self.readers = {}
+        self.indexes = {}
+        self.store = BodyStore()
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        for index in self.indexes.values():
+            index.close()
+        self.readers.clear()
+        self.indexes.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def source_line(self, record):
+        """The comparison line (bytes) a compact record points to."""
+        src = record["src"]
+        path = os.path.normpath(os.path.join(self.dir, src["file"]))
+        if path not in self.readers:
+            self.readers[path] = open_reader(path)
+        line = self.readers[path].read(src["offset"], src["length"])
+        if len(line) == src["length"] and hashlib.sha1(line).hexdigest() == src["sha1"]:
+            return line
+
+        # Offsets moved: find the line by id instead
+        if path not in self.indexes:
+            self.indexes[path] = NdjsonIndex.open(path)
+        index = self.indexes[path]
+        for entry in index.lookup_all(record["id"]):
+            line = index.read_line(entry)
+            if hashlib.sha1(line).hexdigest() == src["sha1"]:
+                return line
+        raise ValueError(f"{record['id']}: its line in {src['file']} has changed since compare.js ran; "
+                         "rerun compare.js")
+
+    def hydrate(self, record):
+        """The full record for record; full records are returned as they are."""
+        if not is_compact(record):
+            return record
+        source = self.store.resolve(json.loads(self.source_line(record)))
+        full = {k: v for k, v in record.items() if k != "src"}
+        full["prodBody"] = source.get("prodBody")
+        full["devBody"] = source.get("devBody")
+        if source.get("requestBody"):
+            full["requestBody"] = source["requestBody"]
+        return full
+
+    def records(self, hydrate=True):
+        """Every record of the deltas file, hydrated unless hydrate is False."""
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                yield self.hydrate(record) if hydrate else record
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] == "hydrate":
+        with DeltasReader(args[1]) as reader:
+            for record in reader.records():
+                sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
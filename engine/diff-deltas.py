@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Diff two deltas files -- an archived deltas.ndjson against the current one,
+or two compare.js runs -- by record id: which records a tolerance change
+eliminated, which it introduced, and which changed category.
+
+Both files are read once, parsing only the part of each line before the
+bodies (see txanalysis/records.py); what is kept per record is its id, op,
+category, URL pattern and line offset, so memory grows with the number of
+ids, not with body size. The report groups each set by op and URL pattern
+(the path plus the url / system parameter, see url_pattern in
+txanalysis/fhir.py). Bodies are only read for --sample, which hydrates
+that many records of one set by offset; compact deltas and seekable gzip
+files work as everywhere else.
+
+Usage:
+  python3 engine/diff-deltas.py <old deltas.ndjson|job dir> <new deltas.ndjson|job dir>
+      [--op OP[,OP]] [--url REGEX] [--top N]
+      [--kind eliminated|introduced|changed] [--sample N --out FILE] [--seed S] [--ids-out FILE]
+
+  --op, --url    only diff records of these ops / whose decoded URL matches
+  --top N        patterns listed per set (default 20)
+  --kind K       set for --sample and --ids-out (default eliminated)
+  --sample N     write N random records of the set to FILE as full records,
+                 from the old file for eliminated, else from the new one
+  --seed S       random seed for --sample
+  --ids-out FILE write the ids of the set to FILE, one per line
+
+From a script:
+  from txanalysis import records
+  eliminated_ids = [line.strip() for line in open("eliminated.txt")]
+  for r in records("jobs/<round>/results/deltas/deltas.<date>.ndjson", ids=eliminated_ids):
+      ...
+"""
+
+import json
+import random
+import sys
+from collections import Counter
+
+from seekable_gzip import open_reader
+from txanalysis import deltas_path, records
+from txanalysis.records import Record, source_for
+
+DEFAULT_TOP = 20
+KINDS = ("eliminated", "introduced", "changed")
+VALUE_FLAGS = ("--op", "--url", "--top", "--kind", "--sample", "--out", "--seed", "--ids-out")
+
+
+def get_arg(flag, default):
+    if flag in sys.argv:
+        i = sys.argv.index(flag)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
+
+
+def scan(path, op, url):
+    """Yield (id, (op, category, pattern, offset, length)) for each record of path,
+    with the repeated strings interned."""
+    for r in records(path, op=op, url=url):
+        yield r.id, (sys.intern(r.op), sys.intern(r.category or ""), sys.intern(r.url_pattern),
+                     r.offset, len(r.line))
+
+
+def diff(old_path, new_path, op=None, url=None):
+    """{kind: {id: (op, category, pattern, offset, length)}}, the old category of
+    each changed record, and the (records, distinct ids) of either file. An id
+    that repeats counts once, as its first record."""
+    old = {}
+    old_lines = 0
+    for record_id, meta in scan(old_path, op, url):
+        old.setdefault(record_id, meta)
+        old_lines += 1
+    old_count = (old_lines, len(old))
+
+    introduced = {}
+    changed = {}
+    old_categories = {}
+    seen = set()
+    new_lines = 0
+    for record_id, meta in scan(new_path, op, url):
+        new_lines += 1
+        if record_id in seen:
+            continue
+        seen.add(record_id)
+        before = old.pop(record_id, None)
+        if before is None:
+            introduced[record_id] = meta
+        elif before[1] != meta[1]:
+            changed[record_id] = meta
+            old_categories[record_id] = before[1]
+    sets = {"eliminated": old, "introduced": introduced, "changed": changed}
+    return sets, old_categories, old_count, (new_lines, len(seen))
+
+
+def describe_count(path, count):
+    lines, ids = count
+    return f"{path} ({lines} records)" if lines == ids else f"{path} ({lines} records, {ids} distinct ids)"
+
+
+def print_groups(title, counts, top, header):
+    total = sum(counts.values())
+    print(f"\n{title} ({total})")
+    if not total:
+        return
+    print(f"  {'count':>7}  {'op':<14} {header}")
+    for key, n in counts.most_common(top):
+        print(f"  {n:7d}  {key[0]:<14} " + "  ".join(key[1:]))
+    rest = counts.most_common()[top:]
+    if rest:
+        print(f"  ... {len(rest)} more patterns ({sum(n for _, n in rest)} records)")
+
+
+def write_sample(path, selected, n, seed, out_path):
+    """Hydrate n random records of selected ({id: meta}) from path into out_path."""
+    chosen = random.Random(seed).sample(sorted(selected.items()), min(n, len(selected)))
+    chosen.sort(key=lambda item: item[1][3])
+    source = source_for(path)
+    with open_reader(path) as reader, open(out_path, "w", encoding="utf-8") as out:
+        for _, (_, _, _, offset, length) in chosen:
+            record = Record(source, reader.read(offset, length), offset=offset)
+            out.write(json.dumps(record.full, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return len(chosen)
+
+
+def main():
+    args = []
+    argv = iter(sys.argv[1:])
+    for a in argv:
+        if a in VALUE_FLAGS:
+            next(argv, None)
+        elif not a.startswith("--"):
+            args.append(a)
+    kind = get_arg("--kind", "eliminated")
+    sample = int(get_arg("--sample", 0))
+    out_path = get_arg("--out", None)
+    if len(args) != 2 or kind not in KINDS or (sample and not out_path):
+        print(__doc__)
+        sys.exit(1)
+
+    old_path, new_path = deltas_path(args[0]), deltas_path(args[1])
+    op = get_arg("--op", None)
+    top = int(get_arg("--top", DEFAULT_TOP))
+    sets, old_categories, old_count, new_count = diff(
+        old_path, new_path, op=op.split(",") if op else None, url=get_arg("--url", None))
+
+    print(f"old: {describe_count(old_path, old_count)}")
+    print(f"new: {describe_count(new_path, new_count)}")
+    print(f"eliminated {len(sets['eliminated'])}, introduced {len(sets['introduced'])}, "
+          f"category changed {len(sets['changed'])}")
+    for name in ("eliminated", "introduced"):
+        counts = Counter((meta[0], meta[2]) for meta in sets[name].values())
+        print_groups(name.capitalize(), counts, top, "pattern")
+    counts = Counter((meta[0], f"{old_categories[record_id] or '-'} -> {meta[1] or '-'}", meta[2])
+                     for record_id, meta in sets["changed"].items())
+    print_groups("Category changed", counts, top, "old -> new category  pattern")
+
+    selected = sets[kind]
+    ids_out = get_arg("--ids-out", None)
+    if ids_out:
+        with open(ids_out, "w", encoding="utf-8") as f:
+            for record_id in sorted(selected, key=lambda i: selected[i][3]):
+                f.write(record_id + "\n")
+        print(f"\nWrote {len(selected)} {kind} ids to {ids_out}")
+    if sample:
+        written = write_sample(old_path if kind == "eliminated" else new_path, selected, sample,
+                               get_arg("--seed", None), out_path)
+        print(f"\nWrote {written} sampled {kind} records to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,42 +10,137 @@ Usage:
 
 When --job is used, the report pre-filters to that round's bugs.
 When --all is used (or no --job), the report shows all bugs across all rounds.
+
+Options:
+  --jobs N       parallel git-bug detail fetches (default 8)
+  --no-cache     re-fetch every bug and re-render every body instead of
+                 using .cache/git-bug and .cache/render
+  --if-changed   leave the output untouched when the bugs, stats and this
+                 script are the same as when it was last generated
+  --split        keep only a small index (id, title, status, labels, impact,
+                 date) in the page and write the bodies to sharded JSON files
+                 in <output-stem>-bodies/ next to it; the page fetches a
+                 shard when a bug is expanded, and all shards when searching.
+                 The page must then be served over HTTP (not file://).
+
+Rendered bodies are memoized in .cache/render/bodies.json, keyed by a hash of
+the Markdown and of the renderer's source. Per-round and --all runs share it.
 """
 
+import hashlib
+import inspect
 import json
 import os
 import re
 import subprocess
 import sys
+import tempfile
 from html import escape
 from datetime import datetime
 
+import git_bug
+
+BODY_SHARDS = 16  # shard files in --split mode, picked by the first hex digit of md5(id)
+INDEX_FIELDS = ("id", "title", "status", "labels", "author", "date", "date_iso", "impact")
+
+RENDER_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".cache", "render", "bodies.json")
 
-def run_git_bug():
-    """Fetch all tx-compare bugs from git-bug, including full comment bodies."""
-    result = subprocess.run(
-        ["git-bug", "bug", "-l", "tx-compare", "-f", "json"],
-        capture_output=True, text=True
-    )
-    if result.returncode != 0:
-        print(f"Error running git-bug list: {result.stderr}", file=sys.stderr)
-        sys.exit(1)
-
-    bug_list = json.loads(result.stdout)
-
-    bugs = []
-    for bug_summary in bug_list:
-        hid = bug_summary["human_id"]
-        detail = subprocess.run(
-            ["git-bug", "bug", "show", hid, "-f", "json"],
-            capture_output=True, text=True
-        )
-        if detail.returncode != 0:
-            print(f"Warning: could not fetch bug {hid}: {detail.stderr}", file=sys.stderr)
-            continue
-        bugs.append(json.loads(detail.stdout))
 
-    return bugs
+def run_git_bug(jobs=git_bug.DEFAULT_JOBS, use_cache=True):
+    """Fetch all tx-compare bugs from git-bug, including full comment bodies.
+
+    Details are fetched through a worker pool and cached by edit time
+    (see git_bug.py), so unchanged bugs are not re-fetched.
+    """
+    bug_list = git_bug.list_bugs("tx-compare")
+    cache = git_bug.BugCache() if use_cache else None
+    return git_bug.fetch_bugs(bug_list, jobs=jobs, cache=cache)
+
+
+# ---- Markdown rendering ----
+#
+# Patterns are compiled once at import. Block structure is decided by
+# dispatching on each stripped line's first character; inline text is
+# tokenized once into links and code spans. Emphasis rules run only on
+# non-code segments that contain their trigger characters. The output is
+# byte-identical to the earlier per-line regex cascade, quirks included (see
+# engine/check-markdown-renderer.py).
+
+_MD_HEADER = re.compile(r'^(#{1,6})\s+(.+)$')
+_MD_UL = re.compile(r'^[-*+]\s+(.+)$')
+_MD_OL = re.compile(r'^\d+[.)]\s+(.+)$')
+_MD_HR = re.compile(r'^[-*_]{3,}\s*$')
+_MD_PARA_BREAK = re.compile(r'```|#|[-*+]\s|\d+[.)]\s')
+_MD_LINK = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+_MD_LINK_PLACEHOLDER = re.compile('\x00LINK(\\d+)\x00')
+_MD_BOLD_STARS = re.compile(r'\*\*(.+?)\*\*')
+_MD_BOLD_UNDERSCORES = re.compile(r'__(.+?)__')
+_MD_EM_STAR = re.compile(r'(?<!\w)\*(.+?)\*(?!\w)')
+_MD_EM_UNDERSCORE = re.compile(r'(?<!\w)_(.+?)_(?!\w)')
+_MD_AUTOLINK = re.compile(r'(?<!href=")(?<!">)(https?://[^\s<>\)]+)')
+
+
+def _code_split(text):
+    """Escape text, rendering backtick-delimited odd segments as <code>."""
+    parts = text.split("`")
+    for j in range(len(parts)):
+        parts[j] = f"<code>{escape(parts[j])}</code>" if j % 2 else escape(parts[j])
+    return "".join(parts)
+
+
+def _format_non_code(s):
+    """Format bold, italic, links in (already escaped) non-code text."""
+    if "**" in s:
+        s = _MD_BOLD_STARS.sub(r'<strong>\1</strong>', s)
+    if "__" in s:
+        s = _MD_BOLD_UNDERSCORES.sub(r'<strong>\1</strong>', s)
+    if "*" in s:
+        s = _MD_EM_STAR.sub(r'<em>\1</em>', s)
+    if "_" in s:
+        s = _MD_EM_UNDERSCORE.sub(r'<em>\1</em>', s)
+    # Markdown links (already tokenized by _inline_format, but keep as fallback)
+    if "](" in s:
+        s = _MD_LINK.sub(r'<a href="\2" target="_blank">\1</a>', s)
+    # Auto-link bare URLs not already inside an href
+    if "http" in s:
+        s = _MD_AUTOLINK.sub(r'<a href="\1" target="_blank">\1</a>', s)
+    return s
+
+
+def _inline_format(s):
+    """Handle inline markdown: bold, inline code, links.
+    Expects RAW text (not pre-escaped). Escapes internally.
+    Links are tokenized first so that backtick-containing link text
+    like [`file.js#L10`](url) is handled correctly."""
+    links = []
+    if "](" in s:
+        pieces = []
+        pos = 0
+        for m in _MD_LINK.finditer(s):
+            link_text = m.group(1)
+            inner = _code_split(link_text) if "`" in link_text else escape(link_text)
+            pieces.append(s[pos:m.start()])
+            pieces.append(f"\x00LINK{len(links)}\x00")
+            links.append(f'<a href="{escape(m.group(2))}" target="_blank">{inner}</a>')
+            pos = m.end()
+        if links:
+            pieces.append(s[pos:])
+            s = "".join(pieces)
+
+    if "`" in s:
+        segments = s.split("`")
+        for j in range(len(segments)):
+            seg = escape(segments[j])
+            segments[j] = f"<code>{seg}</code>" if j % 2 else _format_non_code(seg)
+        result = "".join(segments)
+    else:
+        result = _format_non_code(escape(s))
+
+    if links:
+        result = _MD_LINK_PLACEHOLDER.sub(
+            lambda m: links[int(m.group(1))] if int(m.group(1)) < len(links) else m.group(0), result)
+    return result
 
 
 def markdown_to_html(text):
@@ -54,6 +149,7 @@ def markdown_to_html(text):
         return ""
 
     lines = text.split("\n")
+    n = len(lines)
     html_parts = []
     in_code_block = False
     code_block_lines = []
@@ -66,71 +162,18 @@ def markdown_to_html(text):
         if not list_lines:
             return
         tag = in_list
-        items = "".join(f"<li>{inline_format(l)}</li>" for l in list_lines)
+        items = "".join(f"<li>{_inline_format(l)}</li>" for l in list_lines)
         html_parts.append(f"<{tag}>{items}</{tag}>")
         list_lines = []
         in_list = None
 
-    def inline_format(s):
-        """Handle inline markdown: bold, inline code, links.
-        Expects RAW text (not pre-escaped). Escapes internally.
-        Links are extracted first so that backtick-containing link text
-        like [`file.js#L10`](url) is handled correctly."""
-        # First pass: extract markdown links (which may contain backticks)
-        link_re = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
-        link_placeholder = []
-        def replace_link(m):
-            idx = len(link_placeholder)
-            link_text = m.group(1)
-            link_url = m.group(2)
-            # Render backtick-wrapped text inside link as <code>
-            inner = re.sub(r'`([^`]+)`', lambda cm: f'<code>{escape(cm.group(1))}</code>',
-                           escape(link_text) if '`' not in link_text else link_text)
-            if '`' in link_text:
-                # Re-escape non-code parts only
-                parts = []
-                for j, seg in enumerate(link_text.split('`')):
-                    if j % 2 == 1:
-                        parts.append(f'<code>{escape(seg)}</code>')
-                    else:
-                        parts.append(escape(seg))
-                inner = ''.join(parts)
-            link_placeholder.append(f'<a href="{escape(link_url)}" target="_blank">{inner}</a>')
-            return f'\x00LINK{idx}\x00'
-        s = link_re.sub(replace_link, s)
-
-        # Second pass: handle backtick code spans and other inline formatting
-        parts = []
-        segments = s.split("`")
-        for i, seg in enumerate(segments):
-            if i % 2 == 1:
-                parts.append(f"<code>{escape(seg)}</code>")
-            else:
-                parts.append(format_non_code(escape(seg)))
-        result = "".join(parts)
-
-        # Restore link placeholders
-        for idx, link_html in enumerate(link_placeholder):
-            result = result.replace(f'\x00LINK{idx}\x00', link_html)
-        return result
-
-    def format_non_code(s):
-        """Format bold, italic, links in non-code text."""
-        s = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', s)
-        s = re.sub(r'__(.+?)__', r'<strong>\1</strong>', s)
-        s = re.sub(r'(?<!\w)\*(.+?)\*(?!\w)', r'<em>\1</em>', s)
-        s = re.sub(r'(?<!\w)_(.+?)_(?!\w)', r'<em>\1</em>', s)
-        # Markdown links (already handled in first pass, but keep as fallback)
-        s = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2" target="_blank">\1</a>', s)
-        # Auto-link bare URLs not already inside an href
-        s = re.sub(r'(?<!href=")(?<!">)(https?://[^\s<>\)]+)', r'<a href="\1" target="_blank">\1</a>', s)
-        return s
-
     i = 0
-    while i < len(lines):
+    while i < n:
         line = lines[i]
+        i += 1
+        stripped = line.strip()
 
-        if line.strip().startswith("```"):
+        if stripped.startswith("```"):
             if in_code_block:
                 code_content = escape("\n".join(code_block_lines))
                 lang_attr = f' class="lang-{escape(code_lang)}"' if code_lang else ""
@@ -141,67 +184,59 @@ def markdown_to_html(text):
             else:
                 flush_list()
                 in_code_block = True
-                code_lang = line.strip()[3:].strip()
-            i += 1
+                code_lang = stripped[3:].strip()
             continue
 
         if in_code_block:
             code_block_lines.append(line)
-            i += 1
             continue
 
-        stripped = line.strip()
-
         if not stripped:
             flush_list()
-            i += 1
             continue
 
-        header_match = re.match(r'^(#{1,6})\s+(.+)$', stripped)
-        if header_match:
-            flush_list()
-            level = len(header_match.group(1))
-            content = inline_format(header_match.group(2))
-            html_parts.append(f"<h{level}>{content}</h{level}>")
-            i += 1
-            continue
-
-        ul_match = re.match(r'^[-*+]\s+(.+)$', stripped)
-        if ul_match:
-            if in_list == "ol":
+        first = stripped[0]
+        if first == "#":
+            m = _MD_HEADER.match(stripped)
+            if m:
                 flush_list()
-            in_list = "ul"
-            list_lines.append(ul_match.group(1))
-            i += 1
-            continue
-
-        ol_match = re.match(r'^\d+[.)]\s+(.+)$', stripped)
-        if ol_match:
-            if in_list == "ul":
+                level = len(m.group(1))
+                html_parts.append(f"<h{level}>{_inline_format(m.group(2))}</h{level}>")
+                continue
+        elif first in "-*+":
+            m = _MD_UL.match(stripped)
+            if m:
+                if in_list == "ol":
+                    flush_list()
+                in_list = "ul"
+                list_lines.append(m.group(1))
+                continue
+            if _MD_HR.match(stripped):
                 flush_list()
-            in_list = "ol"
-            list_lines.append(ol_match.group(1))
-            i += 1
-            continue
-
-        if re.match(r'^[-*_]{3,}\s*$', stripped):
+                html_parts.append("<hr>")
+                continue
+        elif first.isdigit():
+            m = _MD_OL.match(stripped)
+            if m:
+                if in_list == "ul":
+                    flush_list()
+                in_list = "ol"
+                list_lines.append(m.group(1))
+                continue
+        elif first == "_" and _MD_HR.match(stripped):
             flush_list()
             html_parts.append("<hr>")
-            i += 1
             continue
 
         flush_list()
         para_lines = [stripped]
-        i += 1
-        while i < len(lines):
+        while i < n:
             nxt = lines[i].strip()
-            if not nxt:
-                break
-            if nxt.startswith("```") or nxt.startswith("#") or re.match(r'^[-*+]\s+', nxt) or re.match(r'^\d+[.)]\s+', nxt):
+            if not nxt or _MD_PARA_BREAK.match(nxt):
                 break
             para_lines.append(nxt)
             i += 1
-        para_html = "<br>\n".join(inline_format(l) for l in para_lines)
+        para_html = "<br>\n".join(_inline_format(l) for l in para_lines)
         html_parts.append(f"<p>{para_html}</p>")
 
     flush_list()
@@ -212,6 +247,75 @@ def markdown_to_html(text):
     return "\n".join(html_parts)
 
 
+def renderer_fingerprint():
+    """Hash of the renderer's code and patterns, for cache invalidation."""
+    h = hashlib.sha256()
+    for fn in (_code_split, _format_non_code, _inline_format, markdown_to_html):
+        h.update(inspect.getsource(fn).encode("utf-8"))
+    for name, value in sorted(globals().items()):
+        if name.startswith("_MD_"):
+            h.update(f"{name}={value.pattern}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class RenderCache:
+    """Persistent body_md -> body_html memo, invalidated when the renderer changes.
+
+    Only the entries this run looked up or stored are saved, so entries for
+    an older renderer or an edited bug body are dropped instead of piling up."""
+
+    def __init__(self, path=RENDER_CACHE_PATH):
+        self.path = path
+        self.renderer = renderer_fingerprint()
+        self.entries = {}
+        self.used = set()
+        self.dirty = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def render(self, body_md):
+        key = hashlib.sha256((self.renderer + "\0" + body_md).encode("utf-8")).hexdigest()
+        self.used.add(key)
+        html = self.entries.get(key)
+        if html is None:
+            html = self.entries[key] = markdown_to_html(body_md)
+            self.dirty = True
+        return html
+
+    def save(self):
+        if not self.dirty and len(self.used) == len(self.entries):
+            return
+        live = {key: self.entries[key] for key in self.used}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(live, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def input_fingerprint(bugs, job_stats, default_round_label, split=False):
+    """Hash of everything the report is generated from, including this script."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        source = f.read()
+    h = hashlib.sha256(source)
+    h.update(json.dumps([bugs, job_stats, default_round_label, split], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_fingerprint(html_path):
+    """Return the fingerprint embedded in a previously generated report, if any."""
+    try:
+        with open(html_path, encoding="utf-8") as f:
+            head = f.read(4096)
+    except OSError:
+        return None
+    m = re.search(r'<meta name="bugs-fingerprint" content="([0-9a-f]+)">', head)
+    return m.group(1) if m else None
+
+
 def read_job_stats(job_dir):
     """Read pipeline stats from a job's summary.json."""
     summary_path = os.path.join(job_dir, "results", "summary.json")
@@ -272,7 +376,7 @@ def ensure_round_labels(bugs, job_dir, round_label):
         print(f"Added '{round_label}' label to {labeled} bug(s)", file=sys.stderr)
 
 
-def build_bug_data(bugs):
+def build_bug_data(bugs, render_cache=None):
     """Build the data structure for the HTML page."""
     bug_data = []
 
@@ -282,7 +386,7 @@ def build_bug_data(bugs):
         if isinstance(comments, list) and len(comments) > 0:
             body_md = comments[0].get("message", "")
 
-        body_html = markdown_to_html(body_md)
+        body_html = render_cache.render(body_md) if render_cache else markdown_to_html(body_md)
 
         create_time = bug.get("create_time", {}).get("time", "")
         edit_time = bug.get("edit_time", {}).get("time", "")
@@ -328,8 +432,66 @@ def build_bug_data(bugs):
     return bug_data
 
 
-def generate_html(bugs, job_stats=None, default_round_label=None):
-    """Generate the full HTML page."""
+def body_shard_dir(out_path):
+    """Directory holding the body shards for a --split report: bugs.html -> bugs-bodies/."""
+    return re.sub(r'\.html$', '', out_path) + "-bodies"
+
+
+def split_bug_data(bug_data):
+    """Split bug entries into a page index and {shard: {id: {body_md, body_html}}}.
+
+    A bug's shard depends only on its id (the first hex digit of its md5, out
+    of a fixed BODY_SHARDS), so regenerating with a few new or edited bugs
+    leaves the other shard files unchanged whatever the bug count.
+    """
+    index = []
+    shards = {}
+    for b in bug_data:
+        shard = int(hashlib.md5(b["id"].encode("utf-8")).hexdigest()[0], 16) % BODY_SHARDS
+        entry = {k: b[k] for k in INDEX_FIELDS}
+        entry["shard"] = shard
+        index.append(entry)
+        shards.setdefault(shard, {})[b["id"]] = {"body_md": b["body_md"], "body_html": b["body_html"]}
+    return index, shards
+
+
+def write_body_shards(shard_dir, shards):
+    """Write <shard>.json files, skipping unchanged ones. Each is written to a
+    temporary file and renamed over the old one, so a page being read, or an
+    interrupted run, never sees a partial shard."""
+    os.makedirs(shard_dir, exist_ok=True)
+    written = 0
+    for n, bodies in shards.items():
+        path = os.path.join(shard_dir, f"{n}.json")
+        text = json.dumps(bodies, ensure_ascii=False, sort_keys=True)
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.read() == text:
+                    continue
+        except OSError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=shard_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        written += 1
+    return written
+
+
+def remove_stale_shards(shard_dir, shards):
+    """Remove shard files not in shards, once the page that used them is replaced."""
+    wanted = {f"{n}.json" for n in shards}
+    for name in os.listdir(shard_dir):
+        if re.fullmatch(r'\d+\.json', name) and name not in wanted:
+            os.remove(os.path.join(shard_dir, name))
+
+
+def generate_html(bugs, job_stats=None, default_round_label=None, fingerprint="", body_base=None):
+    """Generate the full HTML page.
+
+    With body_base set, bugs is the --split index (no bodies) and the page
+    fetches <body_base>/<shard>.json on demand.
+    """
     total = len(bugs)
     open_count = sum(1 for b in bugs if b["status"] == "open")
     closed_count = total - open_count
@@ -343,6 +505,7 @@ def generate_html(bugs, job_stats=None, default_round_label=None):
     sorted_labels = sorted(label_counts.keys(), key=lambda l: -label_counts[l])
 
     bugs_json = json.dumps(bugs, ensure_ascii=False)
+    body_base_json = json.dumps(body_base)
 
     stats = json.dumps({
         "total": total,
@@ -359,6 +522,7 @@ def generate_html(bugs, job_stats=None, default_round_label=None):
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
+<meta name="bugs-fingerprint" content="{fingerprint}">
 <title>FHIRsmith tx-compare Bug Report</title>
 <style>
 :root {{
@@ -931,6 +1095,7 @@ h1 {{
 <script>
 const BUGS = {bugs_json};
 const STATS = {stats};
+const BODY_BASE = {body_base_json};  // null when bodies are inlined in BUGS
 
 document.getElementById("gen-time").textContent = new Date().toLocaleString();
 
@@ -1028,7 +1193,9 @@ function renderBugList() {{
           </div>
         </div>
       </div>
-      <div class="bug-body">${{bug.body_html}}</div>
+      ${{bug.body_html !== undefined
+        ? `<div class="bug-body">${{bug.body_html}}</div>`
+        : `<div class="bug-body pending"><p><em>Loading…</em></p></div>`}}
     </div>`;
   }}
 
@@ -1037,7 +1204,49 @@ function renderBugList() {{
 }}
 
 function toggleBug(header) {{
-  header.parentElement.classList.toggle("expanded");
+  const card = header.parentElement;
+  if (card.classList.toggle("expanded")) showBody(card);
+}}
+
+// Split reports (BODY_BASE set): bodies live in BODY_BASE/<shard>.json and are
+// fetched when a bug is expanded, or all at once when searching.
+const shardLoads = {{}};
+let allBodiesLoaded = !BODY_BASE;
+
+function loadShard(n) {{
+  if (!shardLoads[n]) {{
+    shardLoads[n] = fetch(`${{BODY_BASE}}/${{n}}.json`)
+      .then(r => {{
+        if (!r.ok) throw new Error(`HTTP ${{r.status}}`);
+        return r.json();
+      }})
+      .then(bodies => {{
+        for (const bug of BUGS) {{
+          if (bodies[bug.id]) Object.assign(bug, bodies[bug.id]);
+        }}
+      }})
+      .catch(err => {{
+        delete shardLoads[n];  // allow a retry on the next expand
+        throw err;
+      }});
+  }}
+  return shardLoads[n];
+}}
+
+function loadAllBodies() {{
+  return Promise.all([...new Set(BUGS.map(b => b.shard))].map(loadShard));
+}}
+
+function showBody(card) {{
+  const el = card.querySelector(".bug-body");
+  if (!el.classList.contains("pending")) return;
+  const bug = BUGS.find(b => b.id === card.dataset.id);
+  loadShard(bug.shard).then(() => {{
+    el.innerHTML = bug.body_html;
+    el.classList.remove("pending");
+  }}, err => {{
+    el.innerHTML = `<p><em>Could not load bug body (${{err.message}}). Split reports must be served over HTTP.</em></p>`;
+  }});
 }}
 
 function copyBug(btn, bugId) {{
@@ -1062,7 +1271,10 @@ let allExpanded = false;
 function toggleExpandAll() {{
   allExpanded = !allExpanded;
   const cards = document.querySelectorAll(".bug-card:not(.hidden)");
-  cards.forEach(c => c.classList.toggle("expanded", allExpanded));
+  cards.forEach(c => {{
+    c.classList.toggle("expanded", allExpanded);
+    if (allExpanded) showBody(c);
+  }});
   document.getElementById("expand-all-btn").textContent = allExpanded ? "Collapse all" : "Expand all";
 }}
 
@@ -1096,7 +1308,7 @@ function applyFilters() {{
     }}
 
     if (query && show && bug) {{
-      const searchable = (bug.title + " " + bug.body_md + " " + bug.labels.join(" ")).toLowerCase();
+      const searchable = (bug.title + " " + (bug.body_md || "") + " " + bug.labels.join(" ")).toLowerCase();
       if (!searchable.includes(query)) {{
         show = false;
       }}
@@ -1113,6 +1325,13 @@ function applyFilters() {{
 document.getElementById("search").addEventListener("input", function() {{
   searchQuery = this.value;
   applyFilters();
+  if (searchQuery && !allBodiesLoaded) {{
+    // Titles and labels are searched immediately; bodies once every shard is in
+    loadAllBodies().then(() => {{
+      allBodiesLoaded = true;
+      applyFilters();
+    }}, () => {{}});
+  }}
 }});
 
 // Label filter pills — derive all visuals from activeLabels set
@@ -1177,6 +1396,7 @@ updatePillVisuals();
   // Show regardless of status filter
   card.classList.remove("hidden");
   card.classList.add("expanded");
+  showBody(card);
   requestAnimationFrame(() => card.scrollIntoView({{ behavior: "smooth", block: "start" }}));
 }})();
 </script>
@@ -1201,6 +1421,10 @@ def main():
     out_path = None
     job_dir = None
     show_all = False
+    jobs = git_bug.DEFAULT_JOBS
+    use_cache = True
+    if_changed = False
+    split = False
     args = sys.argv[1:]
     i = 0
     while i < len(args):
@@ -1210,6 +1434,18 @@ def main():
         elif args[i] == "--all":
             show_all = True
             i += 1
+        elif args[i] == "--jobs" and i + 1 < len(args):
+            jobs = int(args[i + 1])
+            i += 2
+        elif args[i] == "--no-cache":
+            use_cache = False
+            i += 1
+        elif args[i] == "--if-changed":
+            if_changed = True
+            i += 1
+        elif args[i] == "--split":
+            split = True
+            i += 1
         elif not args[i].startswith("-"):
             out_path = args[i]
             i += 1
@@ -1224,7 +1460,7 @@ def main():
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
     print("Fetching bugs from git-bug...", file=sys.stderr)
-    bugs = run_git_bug()
+    bugs = run_git_bug(jobs, use_cache)
     print(f"Found {len(bugs)} bugs", file=sys.stderr)
 
     job_stats = None
@@ -1257,11 +1493,29 @@ def main():
     if default_round_label and job_dir:
         ensure_round_labels(bugs, job_dir, default_round_label)
 
-    bug_data = build_bug_data(bugs)
-    html = generate_html(bug_data, job_stats, default_round_label)
+    fingerprint = input_fingerprint(bugs, job_stats, default_round_label, split)
+    if if_changed and read_fingerprint(out_path) == fingerprint:
+        print(f"Unchanged since last run, leaving {out_path} as is", file=sys.stderr)
+        return
+
+    render_cache = RenderCache() if use_cache else None
+    bug_data = build_bug_data(bugs, render_cache)
+    if render_cache:
+        render_cache.save()
+    if split:
+        shard_dir = body_shard_dir(out_path)
+        index, shards = split_bug_data(bug_data)
+        written = write_body_shards(shard_dir, shards)
+        print(f"Wrote {len(shards)} body shard(s) to {shard_dir} ({written} changed)", file=sys.stderr)
+        html = generate_html(index, job_stats, default_round_label, fingerprint,
+                             body_base=os.path.basename(shard_dir))
+    else:
+        html = generate_html(bug_data, job_stats, default_round_label, fingerprint)
 
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(html)
+    if split:
+        remove_stale_shards(shard_dir, shards)
 
     # Also write JSON alongside HTML
     json_path = re.sub(r'\.html$', '.json', out_path)
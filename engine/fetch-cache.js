@@ -0,0 +1,79 @@
+'use strict';
+
+/**
+ * On-disk cache of server responses, shared by the backfill tools.
+ *
+ * Mirrors engine/fetch_cache.py exactly: entries are keyed by
+ * sha256(base \n METHOD \n url \n sha256(requestBody)) and stored as
+ * <cache-dir>/<key[0:2]>/<key>.json, so either tool replays responses the
+ * other one fetched.
+ *
+ * Entry shape:
+ *   { base, method, url, requestBodyHash, status, contentType, hash, body, fetchedAt }
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+
+const DEFAULT_CACHE_DIR = path.join(__dirname, '..', '.cache', 'fetch');
+
+function sha256Hex(text) {
+  return crypto.createHash('sha256').update(text || '', 'utf8').digest('hex');
+}
+
+function cacheKey(base, method, url, requestBody) {
+  return sha256Hex([base, (method || 'GET').toUpperCase(), url, sha256Hex(requestBody)].join('\n'));
+}
+
+class FetchCache {
+  constructor(cacheDir = DEFAULT_CACHE_DIR) {
+    this.cacheDir = cacheDir;
+    this.hits = 0;
+    this.stores = 0;
+  }
+
+  pathFor(key) {
+    return path.join(this.cacheDir, key.slice(0, 2), `${key}.json`);
+  }
+
+  get(base, record) {
+    const key = cacheKey(base, record.method, record.url, record.requestBody);
+    let entry;
+    try {
+      entry = JSON.parse(fs.readFileSync(this.pathFor(key), 'utf8'));
+    } catch {
+      return null;
+    }
+    this.hits++;
+    return entry;
+  }
+
+  put(base, record, status, contentType, body) {
+    const key = cacheKey(base, record.method, record.url, record.requestBody);
+    const file = this.pathFor(key);
+    fs.mkdirSync(path.dirname(file), { recursive: true });
+    const entry = {
+      base,
+      method: (record.method || 'GET').toUpperCase(),
+      url: record.url,
+      requestBodyHash: sha256Hex(record.requestBody),
+      status,
+      contentType,
+      hash: crypto.createHash('md5').update(body, 'utf8').digest('hex'),
+      body,
+      fetchedAt: new Date().toISOString(),
+    };
+    const tmp = `${file}.${process.pid}.tmp`;
+    try {
+      fs.writeFileSync(tmp, JSON.stringify(entry));
+      fs.renameSync(tmp, file);
+    } catch (err) {
+      fs.rmSync(tmp, { force: true });
+      throw err;
+    }
+    this.stores++;
+  }
+}
+
+module.exports = { FetchCache, cacheKey, DEFAULT_CACHE_DIR };
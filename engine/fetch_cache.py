@@ -0,0 +1,82 @@
+"""
+On-disk cache of server responses, shared by the backfill tools.
+
+Entries are keyed by (base, method, url, sha256(requestBody)) and stored one
+JSON file per response under <cache-dir>/<key[:2]>/<key>.json. The layout and
+key derivation are mirrored exactly by engine/fetch-cache.js, so responses
+fetched by backfill-truncated.py are replayed by backfill-missing-bodies.js
+and vice versa.
+
+Entry shape:
+  { base, method, url, requestBodyHash, status, contentType, hash, body, fetchedAt }
+
+Only real HTTP responses are cached (any status); network errors are not.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".cache", "fetch")
+
+
+def sha256_hex(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def cache_key(base, method, url, request_body):
+    return sha256_hex("\n".join([base, (method or "GET").upper(), url, sha256_hex(request_body)]))
+
+
+class FetchCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.stores = 0
+        self._lock = threading.Lock()  # get/put run on the fetch worker threads
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, base, record):
+        """Return the cached entry for this request, or None."""
+        key = cache_key(base, record.get("method"), record["url"], record.get("requestBody"))
+        try:
+            with open(self.path_for(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, base, record, status, content_type, body):
+        """Store a response atomically (write to a temp file, then rename)."""
+        key = cache_key(base, record.get("method"), record["url"], record.get("requestBody"))
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "base": base,
+            "method": (record.get("method") or "GET").upper(),
+            "url": record["url"],
+            "requestBodyHash": sha256_hex(record.get("requestBody")),
+            "status": status,
+            "contentType": content_type,
+            "hash": hashlib.md5(body.encode("utf-8")).hexdigest(),
+            "body": body,
+            "fetchedAt": datetime.now(timezone.utc).isoformat(),
+        }
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            self.stores += 1
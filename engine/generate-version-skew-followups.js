@@ -12,7 +12,8 @@
  *   most likely to remain.
  *
  * Method:
- * 1) Read `comparison.ndjson`.
+ * 1) Read `comparison.ndjson` (or the job's seekable `.gz` / packed form, see
+ *    findComparison in body-store.js).
  * 2) Keep only records where tolerance id `version-skew` returns `normalize`.
  * 3) Categorize each record twice:
  *    - with full tolerances
@@ -106,6 +107,8 @@ const fs = require('fs');
 const path = require('path');
 const readline = require('readline');
 const crypto = require('crypto');
+const { BodyStore, findComparison } = require('./body-store');
+const { createReadStream } = require('./seekable-gzip');
 
 function getArg(flag, def) {
   const i = process.argv.indexOf(flag);
@@ -137,7 +140,8 @@ if (!JOB_DIR) {
 }
 
 const jobDir = path.resolve(JOB_DIR);
-const inputPath = path.join(jobDir, 'comparison.ndjson');
+const inputPath = findComparison(jobDir);
+const bodyStore = new BodyStore();
 const outDir = path.resolve(getArg('--out-dir', path.join(jobDir, 'results', 'version-skew-followups')));
 const sampleSize = Math.max(0, getInt('--sample-size', 200));
 const highRiskShare = Math.max(0, Math.min(1, getFloat('--high-risk-share', 0.85)));
@@ -1017,7 +1021,7 @@ async function main() {
   const noImpact = [];
 
   const rl = readline.createInterface({
-    input: fs.createReadStream(inputPath),
+    input: createReadStream(inputPath),
     crlfDelay: Infinity,
   });
 
@@ -1029,7 +1033,7 @@ async function main() {
 
     let record;
     try {
-      record = JSON.parse(line);
+      record = bodyStore.resolve(JSON.parse(line));
     } catch {
       continue;
     }
@@ -0,0 +1,126 @@
+"""
+Fetch git-bug issues with full comment bodies, in parallel and cached.
+
+`git-bug bug -f json` only lists summaries; the comment bodies need a
+`git-bug bug show <id> -f json` per bug. Those detail calls run through a
+worker pool, and each result is cached on disk under .cache/git-bug/ keyed by
+bug id plus the summary's edit_time/status/labels/comment count, so bugs that
+have not changed since the last run are never re-fetched.
+
+If the list output already carries full comments (bulk JSON), the detail
+calls are skipped entirely.
+
+git-bug holds a per-repository lock while a command runs, so concurrent
+invocations can fail with "locked by another process"; run() retries those
+with a short backoff.
+"""
+
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".cache", "git-bug")
+DEFAULT_JOBS = 8
+LOCK_RETRIES = 20
+_LOCKED = re.compile(r'lock|already in use', re.IGNORECASE)
+
+
+def run(args, input=None):
+    """Run `git-bug <args>`, retrying while another git-bug process holds the repo lock."""
+    for attempt in range(LOCK_RETRIES + 1):
+        result = subprocess.run(["git-bug"] + args, input=input, capture_output=True, text=True)
+        if result.returncode == 0 or not _LOCKED.search(result.stderr) or attempt == LOCK_RETRIES:
+            return result
+        time.sleep(min(2.0, 0.05 * 2 ** attempt) * (0.5 + random.random()))
+
+
+def list_bugs(label=None):
+    """Return git-bug's JSON summary list, optionally filtered by label."""
+    result = run(["bug"] + (["-l", label] if label else []) + ["-f", "json"])
+    if result.returncode != 0:
+        print(f"Error running git-bug list: {result.stderr}", file=sys.stderr)
+        sys.exit(1)
+    return json.loads(result.stdout) or []
+
+
+def show_bug(hid):
+    """Fetch one bug's full JSON. Returns (bug, error)."""
+    detail = run(["bug", "show", hid, "-f", "json"])
+    if detail.returncode != 0:
+        return None, detail.stderr
+    return json.loads(detail.stdout), None
+
+
+def fingerprint(summary):
+    """What must be unchanged for a cached detail to still be valid."""
+    comments = summary.get("comments")
+    return json.dumps({
+        "edit_time": summary.get("edit_time"),
+        "status": summary.get("status"),
+        "labels": summary.get("labels"),
+        "comments": len(comments) if isinstance(comments, list) else comments,
+    }, sort_keys=True)
+
+
+class BugCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path_for(self, summary):
+        bug_id = summary.get("id") or summary["human_id"]
+        return os.path.join(self.cache_dir, f"{bug_id}.json")
+
+    def get(self, summary):
+        try:
+            with open(self.path_for(summary), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["bug"] if entry.get("fingerprint") == fingerprint(summary) else None
+
+    def put(self, summary, bug):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint(summary), "bug": bug}, f, ensure_ascii=False)
+        os.replace(tmp, self.path_for(summary))
+
+
+def fetch_bugs(bug_list, jobs=DEFAULT_JOBS, cache=None, strict=False):
+    """Return full bug details for every summary in bug_list, in list order.
+
+    Bugs that fail to fetch are reported on stderr and left out, or with
+    strict=True, reported and the script exits -- for callers where a missing
+    bug would be taken for one that does not exist.
+    """
+    if all(isinstance(b.get("comments"), list) for b in bug_list):
+        return list(bug_list)  # bulk JSON already has the bodies
+
+    details = [cache.get(b) if cache else None for b in bug_list]
+    missing = [i for i, d in enumerate(details) if d is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            results = pool.map(lambda i: show_bug(bug_list[i]["human_id"]), missing)
+            failed = 0
+            for i, (bug, err) in zip(missing, results):
+                if bug is None:
+                    level = "Error" if strict else "Warning"
+                    print(f"{level}: could not fetch bug {bug_list[i]['human_id']}: {err}", file=sys.stderr)
+                    failed += 1
+                    continue
+                details[i] = bug
+                if cache:
+                    cache.put(bug_list[i], bug)
+        if strict and failed:
+            print(f"{failed} bug(s) could not be fetched; giving up", file=sys.stderr)
+            sys.exit(1)
+    print(f"Fetched {len(missing)} bug(s) from git-bug, {len(bug_list) - len(missing)} from cache",
+          file=sys.stderr)
+    return [d for d in details if d is not None]
@@ -2,7 +2,7 @@
 """Import archived bugs from a round's bugs.md + bugs.json back into git-bug.
 
 Usage:
-    python3 engine/import-bugs.py <bugs-dir> <round-label>
+    python3 engine/import-bugs.py <bugs-dir> <round-label> [--jobs N] [--no-cache]
 
 Example:
     python3 engine/import-bugs.py jobs/2026-02-round-1/bugs round:2026-02-round-1
@@ -10,43 +10,164 @@ Example:
 Reads bugs.json for structured metadata (labels, status) and bugs.md for
 the full body text. Creates each bug in git-bug with all original labels
 plus the specified round label.
+
+Bugs are created by a pool of --jobs workers (default 4); each bug takes one
+`bug new`, one `bug label new` with all its labels, and a `bug status close`
+if it was closed. bugs.md is read as the pool works through it, in file
+order, so creation starts with the first body and only the bugs in flight
+are held in memory; bugs.json entries with no body in bugs.md come last. Bugs already in git-bug (matched by the Original-Bug-ID:
+line at the top of their body) are skipped, so re-running an import is cheap
+and creates no duplicates. Existing bug bodies are read through the
+.cache/git-bug cache unless --no-cache is given. If an existing bug cannot be
+read, the import stops before creating anything rather than risk importing
+its original again.
 """
 
 import json
 import re
-import subprocess
 import sys
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import git_bug
+
+DEFAULT_IMPORT_JOBS = 4
+
+
+_BUG_HEADER = re.compile(r'### \[[ x]\] `([a-f0-9]+)` ')
+
+
+def _finish_body(lines):
+    body = "".join(lines).strip()
+    # Remove trailing --- separator
+    if body.endswith("\n---"):
+        body = body[:-4]
+    return body
+
+
+def iter_bugs_md(md_path):
+    """Lazily yield (human_id, body) for each bug in bugs.md, one line at a time.
+
+    A bug starts at a header line "### [ ] `id` title" or "### [x] `id` title"
+    and its body runs until the next line starting with "### " (any heading of
+    that level, bug or not). Text after a non-bug "### " heading is ignored
+    until the next bug header.
+    """
+    hid = None
+    body = []
+    title_pending = False  # header had an empty title; the next line is taken as the title
+    with open(md_path) as f:
+        for line in f:
+            if title_pending:
+                title_pending = False
+                if not line.endswith("\n"):
+                    hid = None  # header never terminated; not a bug
+                continue
+            if line.startswith("### "):
+                if hid is not None:
+                    yield hid, _finish_body(body)
+                    hid = None
+                m = _BUG_HEADER.match(line)
+                if m and line.endswith("\n"):
+                    hid, body = m.group(1), []
+                    title_pending = len(line) == m.end() + 1
+                continue
+            if hid is not None:
+                body.append(line)
+    if hid is not None and not title_pending:
+        yield hid, _finish_body(body)
 
 
 def parse_bugs_md(md_path):
     """Parse bugs.md to extract bug bodies keyed by human_id."""
-    with open(md_path) as f:
-        content = f.read()
+    return dict(iter_bugs_md(md_path))
+
+
+def imported_ids(jobs, use_cache=True):
+    """Map Original-Bug-ID -> current human_id for bugs already in git-bug.
+
+    Exits if any bug cannot be fetched: its Original-Bug-ID would be unknown
+    and the bug it came from would be imported a second time."""
+    cache = git_bug.BugCache() if use_cache else None
+    existing = {}
+    for bug in git_bug.fetch_bugs(git_bug.list_bugs(), jobs, cache, strict=True):
+        comments = bug.get("comments")
+        if not isinstance(comments, list) or not comments:
+            continue
+        m = re.match(r'Original-Bug-ID:\s*([a-f0-9]+)', comments[0].get("message", ""))
+        if m:
+            existing.setdefault(m.group(1), bug.get("human_id", ""))
+    return existing
+
 
-    bugs = {}
-    # Match bug headers: ### [ ] `id` title  or  ### [x] `id` title
-    pattern = re.compile(
-        r'^### \[[ x]\] `([a-f0-9]+)` .+?\n(.*?)(?=^### |\Z)',
-        re.MULTILINE | re.DOTALL,
-    )
-    for m in pattern.finditer(content):
-        human_id = m.group(1)
-        body = m.group(2).strip()
-        # Remove trailing --- separator
-        body = re.sub(r'\n---\s*$', '', body)
-        bugs[human_id] = body
+def import_bug(bug, body, round_label):
+    """Create, label and (if needed) close one bug. Returns (new_id, log lines, error)."""
+    hid = bug['human_id']
+    title = bug['title']
 
-    return bugs
+    result = git_bug.run(['bug', 'new', '-t', title, '-F', '-', '--non-interactive'], input=body)
+    if result.returncode != 0:
+        return None, [], f"  ERROR creating {hid}: {result.stderr.strip()}"
+
+    # Extract new bug ID from output
+    new_id = result.stdout.strip()
+    # git-bug new outputs something like "abc1234\tNew bug created"
+    new_id = new_id.split()[0] if new_id else None
+    if not new_id:
+        return None, [], f"  ERROR: no ID returned for {hid}"
+
+    lines = [f"  Created {new_id} (was {hid}): {title[:60]}"]
+
+    # Add all original labels + round label in one call
+    all_labels = list(bug.get('labels', [])) + [round_label]
+    git_bug.run(['bug', 'label', 'new', new_id] + all_labels)
+
+    # Close if it was closed
+    if bug['status'] == 'closed':
+        git_bug.run(['bug', 'status', 'close', new_id])
+        lines.append(f"    Closed {new_id}")
+
+    return new_id, lines, None
+
+
+def import_all(todo, round_label, jobs):
+    """Yield import_bug's result for each (bug, body) of todo, in order, running
+    jobs at a time. todo is consumed lazily: at most 2 * jobs bugs are queued."""
+    jobs = max(1, jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for bug, body in todo:
+            pending.append(pool.submit(import_bug, bug, body, round_label))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 def main():
-    if len(sys.argv) < 3:
-        print(f"Usage: {sys.argv[0]} <bugs-dir> <round-label>")
+    positional = []
+    jobs = DEFAULT_IMPORT_JOBS
+    use_cache = True
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--jobs' and i + 1 < len(args):
+            jobs = int(args[i + 1])
+            i += 2
+        elif args[i] == '--no-cache':
+            use_cache = False
+            i += 1
+        else:
+            positional.append(args[i])
+            i += 1
+
+    if len(positional) < 2:
+        print(f"Usage: {sys.argv[0]} <bugs-dir> <round-label> [--jobs N] [--no-cache]")
         sys.exit(1)
 
-    bugs_dir = sys.argv[1]
-    round_label = sys.argv[2]
+    bugs_dir = positional[0]
+    round_label = positional[1]
 
     json_path = os.path.join(bugs_dir, 'bugs.json')
     md_path = os.path.join(bugs_dir, 'bugs.md')
@@ -54,66 +175,45 @@ def main():
     with open(json_path) as f:
         bugs_json = json.load(f)
 
-    bodies = parse_bugs_md(md_path)
+    print(f"Found {len(bugs_json)} bugs in JSON")
 
-    print(f"Found {len(bugs_json)} bugs in JSON, {len(bodies)} bodies in MD")
-
-    created = 0
-    errors = 0
+    existing = imported_ids(jobs, use_cache)
+    wanted = {}  # human_id -> bugs.json entries still to import
+    skipped = 0
     for bug in bugs_json:
         hid = bug['human_id']
-        title = bug['title']
-        labels = bug.get('labels', [])
-        status = bug['status']
-        body = bodies.get(hid, f"(No body found in archive for {hid})")
-
-        # Prepend original ID as reference
-        body = f"Original-Bug-ID: {hid}\n\n{body}"
-
-        # Create the bug
-        result = subprocess.run(
-            ['git-bug', 'bug', 'new', '-t', title, '-F', '-', '--non-interactive'],
-            input=body,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode != 0:
-            print(f"  ERROR creating {hid}: {result.stderr.strip()}")
-            errors += 1
+        if hid in existing:
+            print(f"  Skipped {hid}: already imported as {existing[hid]}")
+            skipped += 1
             continue
+        wanted.setdefault(hid, []).append(bug)
 
-        # Extract new bug ID from output
-        new_id = result.stdout.strip()
-        # git-bug new outputs something like "abc1234\tNew bug created"
-        new_id = new_id.split()[0] if new_id else None
-        if not new_id:
-            print(f"  ERROR: no ID returned for {hid}")
-            errors += 1
-            continue
+    bodies = 0
 
-        print(f"  Created {new_id} (was {hid}): {title[:60]}")
-
-        # Add all original labels + round label
-        all_labels = list(labels) + [round_label]
-        for label in all_labels:
-            subprocess.run(
-                ['git-bug', 'bug', 'label', 'new', new_id, label],
-                capture_output=True,
-                text=True,
-            )
-
-        # Close if it was closed
-        if status == 'closed':
-            subprocess.run(
-                ['git-bug', 'bug', 'status', 'close', new_id],
-                capture_output=True,
-                text=True,
-            )
-            print(f"    Closed {new_id}")
+    def todo():
+        nonlocal bodies
+        for hid, body in iter_bugs_md(md_path):
+            bodies += 1
+            # Prepend original ID as reference
+            for bug in wanted.pop(hid, ()):
+                yield bug, f"Original-Bug-ID: {hid}\n\n{body}"
+        for hid, bugs in wanted.items():
+            for bug in bugs:
+                yield bug, f"Original-Bug-ID: {hid}\n\n(No body found in archive for {hid})"
 
+    created = 0
+    errors = 0
+    # Results come back in input order, so the log reads the same at any --jobs
+    for new_id, lines, error in import_all(todo(), round_label, jobs):
+        if error:
+            print(error)
+            errors += 1
+            continue
+        for line in lines:
+            print(line)
         created += 1
 
-    print(f"\nDone: {created} created, {errors} errors")
+    print(f"\nDone: {created} created, {skipped} skipped, {errors} errors ({bodies} bodies in MD)")
 
 
 if __name__ == '__main__':
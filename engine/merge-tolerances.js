@@ -0,0 +1,106 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Resolve a tolerances.js merge conflict where both sides only appended
+ * tolerances at the same spot -- the usual case when two triage agents land
+ * one after the other (see prompts/parallel-triage.sh).
+ *
+ * Usage:
+ *   node engine/merge-tolerances.js <conflicted-file> <base-file> <ours-file> <theirs-file>
+ *
+ * The conflicted file must use diff3 markers (merge.conflictStyle=diff3).
+ * Every conflict hunk must have an empty base section (pure insert/insert);
+ * it is replaced by ours followed by theirs. The result is then loaded and
+ * must contain exactly the tolerance ids of ours plus the ids theirs added
+ * relative to base, each once -- so a textual merge that fused two objects
+ * together is rejected. On success the conflicted file is rewritten in
+ * place; otherwise it is left untouched and the exit code is 1.
+ */
+
+const fs = require('fs');
+const path = require('path');
+
+function resolveHunks(text) {
+  const lines = text.split('\n');
+  const out = [];
+  let hunks = 0;
+  for (let i = 0; i < lines.length; i++) {
+    if (!lines[i].startsWith('<<<<<<< ')) {
+      out.push(lines[i]);
+      continue;
+    }
+    const ours = [];
+    const base = [];
+    const theirs = [];
+    let section = ours;
+    for (i++; i < lines.length && !lines[i].startsWith('>>>>>>> '); i++) {
+      if (lines[i].startsWith('||||||| ')) section = base;
+      else if (lines[i] === '=======') section = theirs;
+      else section.push(lines[i]);
+    }
+    if (i >= lines.length) throw new Error('unterminated conflict hunk');
+    if (section !== theirs) throw new Error('conflict hunk without diff3 markers (set merge.conflictStyle=diff3)');
+    if (base.some(l => l.trim())) throw new Error('conflict hunk edits existing lines, not only appends');
+    out.push(...ours, ...theirs);
+    hunks++;
+  }
+  return { text: out.join('\n'), hunks };
+}
+
+/** Load a tolerances file's ids. Copied next to the original so relative requires still work. */
+function loadIds(file, like) {
+  const tmp = path.join(path.dirname(like), `.merge-tolerances.${process.pid}.${path.basename(file)}.js`);
+  fs.copyFileSync(file, tmp);
+  try {
+    return require(tmp).tolerances.map(t => t.id);
+  } finally {
+    delete require.cache[require.resolve(tmp)];
+    fs.unlinkSync(tmp);
+  }
+}
+
+function main() {
+  const [conflicted, baseFile, oursFile, theirsFile] = process.argv.slice(2);
+  if (!theirsFile) {
+    console.error('Usage: node engine/merge-tolerances.js <conflicted-file> <base-file> <ours-file> <theirs-file>');
+    process.exit(1);
+  }
+
+  let resolved;
+  try {
+    resolved = resolveHunks(fs.readFileSync(conflicted, 'utf8'));
+  } catch (e) {
+    console.error(`${conflicted}: ${e.message}`);
+    process.exit(1);
+  }
+
+  const scratch = `${conflicted}.resolved`;
+  fs.writeFileSync(scratch, resolved.text);
+  let ids, base, ours, theirs;
+  try {
+    ids = loadIds(scratch, conflicted);
+    base = new Set(loadIds(baseFile, conflicted));
+    ours = loadIds(oursFile, conflicted);
+    theirs = loadIds(theirsFile, conflicted);
+  } catch (e) {
+    fs.unlinkSync(scratch);
+    console.error(`${conflicted}: merged file does not load: ${e.message}`);
+    process.exit(1);
+  }
+
+  const expected = new Set(ours);
+  for (const id of theirs) if (!base.has(id)) expected.add(id);
+  const missing = [...expected].filter(id => !ids.includes(id));
+  if (ids.length !== expected.size || missing.length) {
+    fs.unlinkSync(scratch);
+    console.error(`${conflicted}: merged tolerances do not match ours + theirs` +
+      (missing.length ? ` (missing: ${missing.join(', ')})` : ` (${ids.length} ids, expected ${expected.size})`));
+    process.exit(1);
+  }
+
+  fs.renameSync(scratch, conflicted);
+  console.log(`${conflicted}: resolved ${resolved.hunks} append/append hunk(s), ${ids.length} tolerances`);
+}
+
+main();
@@ -0,0 +1,279 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Byte-offset sidecar index for comparison.ndjson / deltas.ndjson, so a
+ * record can be fetched by id with one positioned read instead of a scan.
+ *
+ * Mirrors engine/ndjson_index.py exactly; either one reads an index the
+ * other built. The index for <file> is <file>.idx:
+ *
+ *   line 1   {"version":1,"size":<bytes>,"mtimeNs":"<ns>","records":<n>}
+ *   then     [id, offset, length, op, prodStatus, devStatus, prodSize, devSize]
+ *            one per record, sorted by the UTF-8 bytes of id, then offset
+ *
+ * offset/length cover the record's line without its newline. op is
+ * getOperation(url). An index whose size/mtimeNs no longer match the data
+ * file is stale and is rebuilt automatically on open.
+ *
+ * The data file may also be a seekable gzip (comparison.ndjson.gz, see
+ * seekable-gzip.js). Offsets are then into the uncompressed NDJSON and a
+ * lookup inflates only the frame holding the line.
+ *
+ * Usage:
+ *   node engine/ndjson-index.js build <file.ndjson>...
+ *   node engine/ndjson-index.js get <file.ndjson> <id>...   # prints the record lines
+ */
+
+const fs = require('fs');
+const { getOperation } = require('./pipeline');
+const { openReader, readChunks } = require('./seekable-gzip');
+
+const INDEX_VERSION = 1;
+const CHUNK_SIZE = 4 * 1024 * 1024;
+const NEWLINE = 0x0a;
+
+function indexPath(file) {
+  return `${file}.idx`;
+}
+
+function sourceStamp(file) {
+  const st = fs.statSync(file, { bigint: true });
+  return { size: Number(st.size), mtimeNs: st.mtimeNs.toString() };
+}
+
+/**
+ * Yield { offset, line } (line is a Buffer without its newline) for every
+ * line of file, plain NDJSON or seekable gzip; offsets are into the NDJSON.
+ */
+function* iterLines(file) {
+  let carry = [];
+  let carryStart = 0;
+  let pos = 0;
+  for (const chunk of readChunks(file)) {
+    const n = chunk.length;
+    let start = 0;
+    let nl;
+    while ((nl = chunk.indexOf(NEWLINE, start)) !== -1) {
+      const piece = chunk.subarray(start, nl);
+      const line = carry.length ? Buffer.concat([...carry, piece]) : Buffer.from(piece);
+      yield { offset: carry.length ? carryStart : pos + start, line };
+      carry = [];
+      start = nl + 1;
+    }
+    if (start < n) {
+      if (!carry.length) carryStart = pos + start;
+      carry.push(Buffer.from(chunk.subarray(start, n)));
+    }
+    pos += n;
+  }
+  if (carry.length) yield { offset: carryStart, line: Buffer.concat(carry) };
+}
+
+/** Scan file and write its .idx. Returns the number of records indexed. */
+function buildIndex(file) {
+  const stamp = sourceStamp(file);
+  const entries = [];
+  for (const { offset, line } of iterLines(file)) {
+    let record;
+    try {
+      record = JSON.parse(line.toString('utf8'));
+    } catch {
+      continue;
+    }
+    if (!record || typeof record.id !== 'string') continue;
+    entries.push({
+      key: Buffer.from(record.id, 'utf8'),
+      row: [
+        record.id, offset, line.length,
+        typeof record.url === 'string' ? getOperation(record.url) : null,
+        record.prod?.status ?? null, record.dev?.status ?? null,
+        record.prod?.size ?? null, record.dev?.size ?? null,
+      ],
+    });
+  }
+  entries.sort((a, b) => Buffer.compare(a.key, b.key) || a.row[1] - b.row[1]);
+
+  const header = { version: INDEX_VERSION, size: stamp.size, mtimeNs: stamp.mtimeNs, records: entries.length };
+  const tmp = `${indexPath(file)}.${process.pid}.tmp`;
+  const fd = fs.openSync(tmp, 'w');
+  try {
+    let out = JSON.stringify(header) + '\n';
+    for (const e of entries) {
+      out += JSON.stringify(e.row) + '\n';
+      if (out.length > CHUNK_SIZE) {
+        fs.writeSync(fd, out);
+        out = '';
+      }
+    }
+    fs.writeSync(fd, out);
+  } finally {
+    fs.closeSync(fd);
+  }
+  fs.renameSync(tmp, indexPath(file));
+  return entries.length;
+}
+
+function readHeader(idxFile) {
+  try {
+    const fd = fs.openSync(idxFile, 'r');
+    try {
+      const buf = Buffer.alloc(512);
+      const n = fs.readSync(fd, buf, 0, buf.length, 0);
+      const nl = buf.indexOf(NEWLINE);
+      return JSON.parse(buf.subarray(0, nl === -1 || nl >= n ? n : nl).toString('utf8'));
+    } finally {
+      fs.closeSync(fd);
+    }
+  } catch {
+    return null;
+  }
+}
+
+function isFresh(file) {
+  const header = readHeader(indexPath(file));
+  if (!header || header.version !== INDEX_VERSION) return false;
+  const stamp = sourceStamp(file);
+  return header.size === stamp.size && header.mtimeNs === stamp.mtimeNs;
+}
+
+function toEntry(row) {
+  const [id, offset, length, op, prodStatus, devStatus, prodSize, devSize] = row;
+  return { id, offset, length, op, prodStatus, devStatus, prodSize, devSize };
+}
+
+class NdjsonIndex {
+  /**
+   * Open the index for file, (re)building it first if it is missing or
+   * stale. With rebuild false, a missing/stale index throws instead.
+   */
+  static open(file, { rebuild = true } = {}) {
+    if (!isFresh(file)) {
+      if (!rebuild) throw new Error(`No up-to-date index for ${file}`);
+      buildIndex(file);
+    }
+    return new NdjsonIndex(file);
+  }
+
+  constructor(file) {
+    this.file = file;
+    this.idx = fs.readFileSync(indexPath(file));
+    this.header = JSON.parse(this.idx.subarray(0, this.idx.indexOf(NEWLINE)).toString('utf8'));
+    this.bodyStart = this.idx.indexOf(NEWLINE) + 1;
+    this.reader = openReader(file);
+  }
+
+  close() {
+    if (this.reader !== null) this.reader.close();
+    this.reader = null;
+  }
+
+  get size() {
+    return this.header.records;
+  }
+
+  // Binary search over the sorted lines of the index; returns the start of
+  // the first line whose id is >= key
+  lowerBound(key) {
+    const idx = this.idx;
+    let lo = this.bodyStart;
+    let hi = idx.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      const prev = idx.lastIndexOf(NEWLINE, mid - 1);
+      const start = prev < lo ? lo : prev + 1;
+      let end = idx.indexOf(NEWLINE, start);
+      if (end === -1) end = idx.length;
+      const id = JSON.parse(idx.subarray(start, end).toString('utf8'))[0];
+      if (Buffer.compare(Buffer.from(id, 'utf8'), key) < 0) lo = end + 1;
+      else hi = start;
+    }
+    return lo;
+  }
+
+  /** Index entry for id ({ id, offset, length, op, ... }), or null. */
+  lookup(id) {
+    const start = this.lowerBound(Buffer.from(id, 'utf8'));
+    if (start >= this.idx.length) return null;
+    let end = this.idx.indexOf(NEWLINE, start);
+    if (end === -1) end = this.idx.length;
+    const row = JSON.parse(this.idx.subarray(start, end).toString('utf8'));
+    return row[0] === id ? toEntry(row) : null;
+  }
+
+  /** Every entry for id (more than one if the id repeats), in file order. */
+  lookupAll(id) {
+    const found = [];
+    let start = this.lowerBound(Buffer.from(id, 'utf8'));
+    while (start < this.idx.length) {
+      let end = this.idx.indexOf(NEWLINE, start);
+      if (end === -1) end = this.idx.length;
+      const row = JSON.parse(this.idx.subarray(start, end).toString('utf8'));
+      if (row[0] !== id) break;
+      found.push(toEntry(row));
+      start = end + 1;
+    }
+    return found;
+  }
+
+  /** Every index entry, in id order, without touching the data file. */
+  *entries() {
+    let start = this.bodyStart;
+    while (start < this.idx.length) {
+      let end = this.idx.indexOf(NEWLINE, start);
+      if (end === -1) end = this.idx.length;
+      if (end > start) yield toEntry(JSON.parse(this.idx.subarray(start, end).toString('utf8')));
+      start = end + 1;
+    }
+  }
+
+  /** The raw line for an entry: a single pread, or one frame of a seekable gzip file. */
+  readLine(entry) {
+    return this.reader.read(entry.offset, entry.length).toString('utf8');
+  }
+
+  /** Parsed record for id, or null. */
+  get(id) {
+    const entry = this.lookup(id);
+    return entry ? JSON.parse(this.readLine(entry)) : null;
+  }
+
+  /** Map id -> parsed record for the ids that exist; reads in file order. */
+  getMany(ids) {
+    const entries = [...new Set(ids)].map(id => this.lookup(id)).filter(Boolean);
+    entries.sort((a, b) => a.offset - b.offset);
+    return new Map(entries.map(e => [e.id, JSON.parse(this.readLine(e))]));
+  }
+}
+
+function main() {
+  const [command, file, ...ids] = process.argv.slice(2);
+  if (command === 'build' && file) {
+    for (const f of [file, ...ids]) {
+      const started = Date.now();
+      const count = buildIndex(f);
+      console.error(`Indexed ${count} records of ${f} in ${((Date.now() - started) / 1000).toFixed(1)}s`);
+    }
+  } else if (command === 'get' && file && ids.length) {
+    const index = NdjsonIndex.open(file);
+    let missing = 0;
+    for (const id of ids) {
+      const entry = index.lookup(id);
+      if (entry) process.stdout.write(index.readLine(entry) + '\n');
+      else {
+        console.error(`Not found: ${id}`);
+        missing++;
+      }
+    }
+    index.close();
+    process.exitCode = missing ? 1 : 0;
+  } else {
+    console.error('Usage:\n  node engine/ndjson-index.js build <file.ndjson>...\n' +
+      '  node engine/ndjson-index.js get <file.ndjson> <id>...');
+    process.exit(1);
+  }
+}
+
+if (require.main === module) main();
+
+module.exports = { NdjsonIndex, buildIndex, indexPath, isFresh, iterLines };
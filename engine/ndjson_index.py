@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Byte-offset sidecar index for comparison.ndjson / deltas.ndjson, so a record
+can be fetched by id with one positioned read instead of a scan.
+
+Mirrors engine/ndjson-index.js exactly; either one reads an index the other
+built. The index for <file> is <file>.idx:
+
+  line 1   {"version":1,"size":<bytes>,"mtimeNs":"<ns>","records":<n>}
+  then     [id, offset, length, op, prodStatus, devStatus, prodSize, devSize]
+           one per record, sorted by the UTF-8 bytes of id, then offset
+
+offset/length cover the record's line without its newline. op is
+getOperation(url) from engine/pipeline.js. An index whose size/mtimeNs no
+longer match the data file is stale and is rebuilt automatically on open.
+
+The data file may also be a seekable gzip (comparison.ndjson.gz, see
+seekable_gzip.py). Offsets are then into the uncompressed NDJSON and a lookup
+inflates only the frame holding the line.
+
+Usage:
+  python3 engine/ndjson_index.py build <file.ndjson>...
+  python3 engine/ndjson_index.py get <file.ndjson> <id>...   # prints the record lines
+
+From a script:
+  from ndjson_index import NdjsonIndex
+  with NdjsonIndex.open("jobs/<round>/comparison.ndjson") as index:
+      record = index.get(record_id)
+"""
+
+import json
+import mmap
+import os
+import re
+import sys
+import time
+
+from seekable_gzip import iter_lines, open_reader
+
+INDEX_VERSION = 1
+
+
+def get_operation(url):
+    """Same classification as getOperation in engine/pipeline.js."""
+    base = url.split("?")[0]
+    for marker, op in (("$validate-code", "validate-code"), ("$batch-validate-code", "batch-validate-code"),
+                       ("$expand", "expand"), ("$lookup", "lookup"), ("$subsumes", "subsumes"),
+                       ("$translate", "translate"), ("/metadata", "metadata")):
+        if marker in base:
+            return op
+    if re.search(r'/(CodeSystem|ValueSet|ConceptMap)(/|$)', base):
+        return "read"
+    return "other"
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtimeNs": str(st.st_mtime_ns)}
+
+
+def build_index(path):
+    """Scan path and write its .idx. Returns the number of records indexed."""
+    stamp = source_stamp(path)
+    entries = []
+    offset = 0
+    for raw in iter_lines(path):
+        start = offset
+        offset += len(raw)
+        line = raw[:-1] if raw.endswith(b"\n") else raw
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get("id"), str):
+            continue
+        prod = record.get("prod") or {}
+        dev = record.get("dev") or {}
+        url = record.get("url")
+        entries.append((record["id"].encode("utf-8"), [
+            record["id"], start, len(line),
+            get_operation(url) if isinstance(url, str) else None,
+            prod.get("status"), dev.get("status"), prod.get("size"), dev.get("size"),
+        ]))
+    entries.sort(key=lambda e: (e[0], e[1][1]))
+
+    header = {"version": INDEX_VERSION, "size": stamp["size"], "mtimeNs": stamp["mtimeNs"],
+              "records": len(entries)}
+    tmp = f"{index_path(path)}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write(json.dumps(header, separators=(",", ":")) + "\n")
+        for _, row in entries:
+            out.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp, index_path(path))
+    return len(entries)
+
+
+def read_header(idx_path):
+    try:
+        with open(idx_path, "rb") as f:
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(path):
+    header = read_header(index_path(path))
+    if not header or header.get("version") != INDEX_VERSION:
+        return False
+    stamp = source_stamp(path)
+    return header.get("size") == stamp["size"] and header.get("mtimeNs") == stamp["mtimeNs"]
+
+
+def _entry(row):
+    keys = ("id", "offset", "length", "op", "prodStatus", "devStatus", "prodSize", "devSize")
+    return dict(zip(keys, row))
+
+
+class NdjsonIndex:
+    @classmethod
+    def open(cls, path, rebuild=True):
+        """Open the index for path, (re)building it first if it is missing or stale.
+
+        With rebuild=False a missing/stale index raises instead.
+        """
+        if not is_fresh(path):
+            if not rebuild:
+                raise FileNotFoundError(f"No up-to-date index for {path}")
+            build_index(path)
+        return cls(path)
+
+    def __init__(self, path):
+        self.path = path
+        with open(index_path(path), "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self.idx.find(b"\n")
+        self.header = json.loads(self.idx[:header_end])
+        self.body_start = header_end + 1
+        self.reader = open_reader(path)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.idx.close()
+            self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.header["records"]
+
+    def _line_end(self, start):
+        end = self.idx.find(b"\n", start)
+        return len(self.idx) if end == -1 else end
+
+    def _lower_bound(self, key):
+        """Start of the first index line whose id is >= key (bytes)."""
+        lo, hi = self.body_start, len(self.idx)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            prev = self.idx.rfind(b"\n", lo, mid)
+            start = lo if prev == -1 else prev + 1
+            end = self._line_end(start)
+            if json.loads(self.idx[start:end])[0].encode("utf-8") < key:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def lookup(self, record_id):
+        """Index entry for record_id ({id, offset, length, op, ...}), or None."""
+        start = self._lower_bound(record_id.encode("utf-8"))
+        if start >= len(self.idx):
+            return None
+        row = json.loads(self.idx[start:self._line_end(start)])
+        return _entry(row) if row[0] == record_id else None
+
+    def lookup_all(self, record_id):
+        """Every entry for record_id (more than one if the id repeats), in file order."""
+        found = []
+        start = self._lower_bound(record_id.encode("utf-8"))
+        while start < len(self.idx):
+            end = self._line_end(start)
+            row = json.loads(self.idx[start:end])
+            if row[0] != record_id:
+                break
+            found.append(_entry(row))
+            start = end + 1
+        return found
+
+    def entries(self):
+        """Every index entry, in id order, without touching the data file."""
+        start = self.body_start
+        while start < len(self.idx):
+            end = self._line_end(start)
+            if end > start:
+                yield _entry(json.loads(self.idx[start:end]))
+            start = end + 1
+
+    def read_line(self, entry):
+        """The raw line (bytes) for an entry: a single pread, or one frame of a seekable gzip file."""
+        return self.reader.read(entry["offset"], entry["length"])
+
+    def get(self, record_id):
+        """Parsed record for record_id, or None."""
+        entry = self.lookup(record_id)
+        return json.loads(self.read_line(entry)) if entry else None
+
+    def get_many(self, record_ids):
+        """{id: parsed record} for the ids that exist; reads in file order."""
+        entries = [e for e in (self.lookup(i) for i in dict.fromkeys(record_ids)) if e]
+        entries.sort(key=lambda e: e["offset"])
+        return {e["id"]: json.loads(self.read_line(e)) for e in entries}
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "build":
+        for path in args[1:]:
+            started = time.time()
+            count = build_index(path)
+            print(f"Indexed {count} records of {path} in {time.time() - started:.1f}s", file=sys.stderr)
+    elif len(args) >= 3 and args[0] == "get":
+        missing = 0
+        with NdjsonIndex.open(args[1]) as index:
+            for record_id in args[2:]:
+                entry = index.lookup(record_id)
+                if entry:
+                    sys.stdout.buffer.write(index.read_line(entry) + b"\n")
+                else:
+                    print(f"Not found: {record_id}", file=sys.stderr)
+                    missing += 1
+        sys.exit(1 if missing else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
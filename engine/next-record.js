@@ -6,12 +6,47 @@
  * deltas.ndjson and creates a prepared issue directory for it.
  *
  * Usage:
- *   node engine/next-record.js --job jobs/<round-name>
+ *   node engine/next-record.js --job jobs/<round-name> [--claim <worker>] [--rescan] [--file-order]
+ *   node engine/next-record.js --job jobs/<round-name> --analyzed <record-id>
+ *   node engine/next-record.js --job jobs/<round-name> --release <record-id>
+ *
+ * Records are walked in file order through the deltas.ndjson.idx sidecar
+ * (see ndjson-index.js), so picking reads only ids and offsets and parses
+ * just the chosen record. State lives in <job>/.picker/:
+ *   analyzed     ledger of record ids with an analysis.md; picking reads
+ *                it as is and stats nothing under issues/. It is updated
+ *                where analysis is added or removed: --analyzed <id> once
+ *                analysis.md is written (triage-loop.sh after each round,
+ *                parallel-triage.sh on landing), --release <id> when the
+ *                issue dir is deleted (a failed run, a reverted triage).
+ *                --rescan, or a missing ledger, rebuilds it from issues/
+ *   claims/<id>  one file per claimed record, created with O_EXCL
+ *
+ * With --claim <worker>, the picked record is claimed atomically for that
+ * worker, so concurrent pickers never hand out the same record; a worker
+ * is first given back its own unfinished claim. Without --claim, claimed
+ * records are skipped but nothing is claimed. Claims of analyzed records
+ * are dropped automatically; --release drops one by hand (e.g. after a
+ * failed agent run), along with its ledger entry.
+ *
+ * Records are served by cluster (see cluster-deltas.js): the representative
+ * of the largest cluster none of whose records is analyzed or claimed comes
+ * first, so one triage covers the most deltas. Once every cluster has been
+ * started, the rest are served in file order. results/clusters.json is
+ * only read, never built here: while it is missing or older than
+ * deltas.ndjson, records are served in file order (rebuild it with
+ * node engine/cluster-deltas.js --job <job> after compare.js). The chosen
+ * record's cluster (signature and a sample of member ids) is written to
+ * cluster.json in its issue dir. --file-order skips the cluster pass.
  */
 
 const fs = require('fs');
 const path = require('path');
-const readline = require('readline');
+const { sortKeysDeep, buildDispatch, applyTolerances } = require('./pipeline');
+const { NdjsonIndex } = require('./ndjson-index');
+const { loadClusters } = require('./cluster-deltas');
+const { DeltasReader } = require('./deltas-reader');
+const { findComparison } = require('./body-store');
 
 function getArg(flag, def) {
   const i = process.argv.indexOf(flag);
@@ -26,40 +61,92 @@ if (!JOB_DIR) {
 
 const jobDir = path.resolve(JOB_DIR);
 const { tolerances } = require(path.join(jobDir, 'tolerances'));
+const dispatch = buildDispatch(tolerances);
 const DELTAS_FILE = path.join(jobDir, 'results/deltas/deltas.ndjson');
 const ISSUES_DIR = path.join(jobDir, 'issues');
+const PICKER_DIR = path.join(jobDir, '.picker');
+const LEDGER_FILE = path.join(PICKER_DIR, 'analyzed');
+const CLAIMS_DIR = path.join(PICKER_DIR, 'claims');
+const CLUSTER_SAMPLE = 20;
 
-function sortKeysDeep(obj) {
-  if (obj === null || obj === undefined || typeof obj !== 'object') return obj;
-  if (Array.isArray(obj)) return obj.map(sortKeysDeep);
-  const sorted = {};
-  for (const key of Object.keys(obj).sort()) {
-    sorted[key] = sortKeysDeep(obj[key]);
+function readLedger() {
+  try {
+    return new Set(fs.readFileSync(LEDGER_FILE, 'utf8').split('\n').filter(Boolean));
+  } catch {
+    return new Set();
   }
-  return sorted;
 }
 
-function runTolerancePipeline(record) {
-  let prod, dev;
-  try { prod = JSON.parse(record.prodBody); } catch { prod = null; }
-  try { dev = JSON.parse(record.devBody); } catch { dev = null; }
-
-  const ctx = { record, prod, dev };
-  const applied = [];
-  for (const t of tolerances) {
-    const action = t.match(ctx);
-    if (action === 'skip') {
-      applied.push(`${t.id}: skip`);
-      return { prod: ctx.prod, dev: ctx.dev, skippedBy: t.id, applied };
-    }
-    if (action === 'normalize' && ctx.prod && ctx.dev) {
-      const result = t.normalize(ctx);
-      ctx.prod = result.prod;
-      ctx.dev = result.dev;
-      applied.push(`${t.id}: normalize`);
+/** Replace the ledger with ids, atomically, like the claim files. */
+function writeLedger(ids) {
+  const tmp = `${LEDGER_FILE}.${process.pid}.tmp`;
+  fs.writeFileSync(tmp, [...ids].map(id => id + '\n').join(''));
+  fs.renameSync(tmp, LEDGER_FILE);
+}
+
+/**
+ * The set of analyzed record ids: the ledger, or with --rescan or no ledger
+ * yet, every issue directory with an analysis.md (written back as the
+ * ledger).
+ */
+function analyzedIds() {
+  if (!process.argv.includes('--rescan') && fs.existsSync(LEDGER_FILE)) return readLedger();
+  const analyzed = new Set(fs.readdirSync(ISSUES_DIR)
+    .filter(id => fs.existsSync(path.join(ISSUES_DIR, id, 'analysis.md'))));
+  writeLedger(analyzed);
+  return analyzed;
+}
+
+/** Add id to the ledger once its analysis.md exists, and drop its claim. */
+function markAnalyzed(id) {
+  if (!fs.existsSync(path.join(ISSUES_DIR, id, 'analysis.md'))) {
+    console.error(`No analysis.md in ${path.join(ISSUES_DIR, id)}`);
+    process.exit(1);
+  }
+  const analyzed = analyzedIds();
+  if (!analyzed.has(id)) writeLedger(analyzed.add(id));
+  fs.rmSync(path.join(CLAIMS_DIR, id), { force: true });
+  console.log(`Marked ${id} analyzed`);
+}
+
+/** Map record id -> claiming worker, for every claim file. */
+function readClaims() {
+  const claims = new Map();
+  for (const id of fs.readdirSync(CLAIMS_DIR)) {
+    try {
+      claims.set(id, JSON.parse(fs.readFileSync(path.join(CLAIMS_DIR, id), 'utf8')).worker);
+    } catch {
+      claims.set(id, '?');  // being written, or unreadable: still taken
     }
   }
-  return { prod: sortKeysDeep(ctx.prod), dev: sortKeysDeep(ctx.dev), skippedBy: null, applied };
+  return claims;
+}
+
+/** Atomically claim id for worker. Returns false if someone else got it first. */
+function tryClaim(id, worker) {
+  try {
+    fs.writeFileSync(path.join(CLAIMS_DIR, id),
+      JSON.stringify({ worker, pid: process.pid, claimedAt: new Date().toISOString() }), { flag: 'wx' });
+    return true;
+  } catch (e) {
+    if (e.code === 'EEXIST') return false;
+    throw e;
+  }
+}
+
+function release(id) {
+  const analyzed = readLedger();
+  if (analyzed.delete(id)) {
+    writeLedger(analyzed);
+    console.log(`Dropped ${id} from the analyzed ledger`);
+  }
+  try {
+    fs.unlinkSync(path.join(CLAIMS_DIR, id));
+    console.log(`Released claim on ${id}`);
+  } catch (e) {
+    if (e.code !== 'ENOENT') throw e;
+    console.log(`No claim on ${id}`);
+  }
 }
 
 async function main() {
@@ -69,40 +156,78 @@ async function main() {
   }
 
   fs.mkdirSync(ISSUES_DIR, { recursive: true });
+  fs.mkdirSync(CLAIMS_DIR, { recursive: true });
 
-  const rl = readline.createInterface({
-    input: fs.createReadStream(DELTAS_FILE),
-    crlfDelay: Infinity,
-  });
+  const releaseId = getArg('--release', null);
+  if (releaseId) {
+    release(releaseId);
+    return;
+  }
+  const analyzedId = getArg('--analyzed', null);
+  if (analyzedId) {
+    markAnalyzed(analyzedId);
+    return;
+  }
+  const worker = getArg('--claim', null);
 
-  let total = 0;
-  let analyzed = 0;
-  let found = null;
+  // Only ids and offsets are read here; the chosen record is the only one parsed
+  const index = NdjsonIndex.open(DELTAS_FILE);
+  const rows = [...index.entries()].sort((a, b) => a.offset - b.offset);
+  const analyzedSet = analyzedIds();
+  const claims = readClaims();
 
-  for await (const line of rl) {
-    const raw = line.trim();
-    if (!raw) continue;
-    total++;
+  const total = rows.length;
+  let analyzed = 0;
+  for (const row of rows) if (analyzedSet.has(row.id)) analyzed++;
 
-    const record = JSON.parse(raw);
-    const recordId = record.id;
-    if (!recordId) continue;
+  // Claims on analyzed records are finished work
+  for (const id of claims.keys()) {
+    if (analyzedSet.has(id)) {
+      fs.rmSync(path.join(CLAIMS_DIR, id), { force: true });
+      claims.delete(id);
+    }
+  }
 
-    const analysisFile = path.join(ISSUES_DIR, recordId, 'analysis.md');
+  const lineOf = new Map(rows.map((row, i) => [row.id, i]));
+  const fileOrder = process.argv.includes('--file-order');
+  const clustersFile = total ? loadClusters(jobDir, { rebuild: false }) : null;
+  const clusters = clustersFile ? clustersFile.clusters : [];
+  const clusterOf = new Map();
+  for (const c of clusters) for (const id of c.members) clusterOf.set(id, c);
 
-    if (fs.existsSync(analysisFile)) {
-      analyzed++;
-      continue;
+  // A worker first gets back its own unfinished claim (e.g. after a crash),
+  // then the representative of the largest untouched cluster, then the
+  // first record nobody has claimed
+  let found = null;
+  let claimedByOthers = 0;
+  if (worker) {
+    const i = rows.findIndex(row => claims.get(row.id) === worker);
+    if (i >= 0) found = { entry: rows[i], lineno: i + 1 };
+  }
+  if (!fileOrder) {
+    for (const c of clusters) {
+      if (found) break;
+      const i = lineOf.get(c.representative);
+      if (i === undefined || c.members.some(id => analyzedSet.has(id) || claims.has(id))) continue;
+      if (worker && !tryClaim(c.representative, worker)) continue;
+      found = { entry: rows[i], lineno: i + 1 };
     }
-
-    if (!found) {
-      found = { raw, recordId, lineno: total };
+  }
+  for (let i = 0; !found && i < rows.length; i++) {
+    const row = rows[i];
+    if (analyzedSet.has(row.id)) continue;
+    if (claims.has(row.id) || (worker && !tryClaim(row.id, worker))) {
+      claimedByOthers++;
+      continue;
     }
+    found = { entry: row, lineno: i + 1 };
   }
 
   if (!found) {
     if (total === 0) {
       console.error(`Delta file is empty: ${DELTAS_FILE}`);
+    } else if (claimedByOthers) {
+      console.error(`No unclaimed records left (${analyzed} of ${total} analyzed, ${claimedByOthers} claimed)`);
     } else {
       console.error(`All ${total} records have been analyzed!`);
     }
@@ -110,8 +235,13 @@ async function main() {
   }
 
   // Create the issue directory and write files
-  const { raw, recordId, lineno } = found;
-  const record = JSON.parse(raw);
+  const { entry, lineno } = found;
+  const recordId = entry.id;
+  // Compact deltas (compare.js --deltas-format compact) get their bodies back
+  const reader = new DeltasReader(DELTAS_FILE);
+  const record = reader.hydrate(JSON.parse(index.readLine(entry)));
+  reader.close();
+  index.close();
   const issueDir = path.join(ISSUES_DIR, recordId);
   fs.mkdirSync(issueDir, { recursive: true });
 
@@ -136,15 +266,15 @@ async function main() {
   );
 
   // Run tolerance pipeline for normalized output
-  const normalized = runTolerancePipeline(record);
+  const normalized = applyTolerances(record, dispatch);
 
   fs.writeFileSync(
     path.join(issueDir, 'prod-normalized.json'),
-    JSON.stringify(normalized.prod, null, 2)
+    JSON.stringify(sortKeysDeep(normalized.prod), null, 2)
   );
   fs.writeFileSync(
     path.join(issueDir, 'dev-normalized.json'),
-    JSON.stringify(normalized.dev, null, 2)
+    JSON.stringify(sortKeysDeep(normalized.dev), null, 2)
   );
 
   // Write applied tolerances
@@ -155,6 +285,18 @@ async function main() {
       : '(none)\n'
   );
 
+  // Write the record's cluster, so the tolerance can be checked against
+  // other records with the same diff signature. Issue dirs are committed, so
+  // only a sample of members goes here; clusters.json has them all.
+  const cluster = clusterOf.get(recordId) || null;
+  if (cluster) {
+    const { members, ...rest } = cluster;
+    fs.writeFileSync(
+      path.join(issueDir, 'cluster.json'),
+      JSON.stringify({ ...rest, sampleMembers: members.slice(0, CLUSTER_SAMPLE) }, null, 2)
+    );
+  }
+
   const remaining = total - analyzed;
   const category = record.comparison?.category || '?';
 
@@ -163,20 +305,28 @@ async function main() {
     pickedAt: new Date().toISOString(),
     recordId: recordId,
     total, analyzed, remaining, category,
+    ...(cluster ? { cluster: cluster.key, clusterSize: cluster.size } : {}),
+    ...(worker ? { worker } : {}),
   }) + '\n';
   fs.appendFileSync(path.join(jobDir, 'progress.ndjson'), progressLine);
 
   // Print summary
   console.log(`Record: ${lineno}/${total} (${analyzed} analyzed, ${remaining} remaining)`);
   console.log(`Category: ${category}`);
+  if (cluster) console.log(`Cluster: ${cluster.key} (${cluster.size} records with this diff signature, see cluster.json)`);
+  else if (!clustersFile && !fileOrder) {
+    console.log(`Cluster: none, results/clusters.json is missing or stale (picked in file order; ` +
+      `node engine/cluster-deltas.js --job ${JOB_DIR} rebuilds it)`);
+  }
   console.log(`Issue dir: ${issueDir}`);
+  if (worker) console.log(`Claimed by: ${worker}`);
   console.log(`Record ID: ${record.id || '?'}`);
   console.log(`URL: ${record.url || '?'}`);
   console.log(`Method: ${record.method || '?'}`);
   console.log(`Prod status: ${record.prod?.status || '?'}`);
   console.log(`Dev status: ${record.dev?.status || '?'}`);
   console.log(`Operation: ${record.comparison?.op || '?'}`);
-  console.log(`Lookup: grep -n '${record.id}' ${path.join(jobDir, 'comparison.ndjson')}`);
+  console.log(`Lookup: node engine/ndjson-index.js get ${findComparison(jobDir)} ${record.id}`);
 }
 
 main().catch(e => { console.error(e); process.exit(1); });
@@ -0,0 +1,231 @@
+'use strict';
+
+/**
+ * Pieces of the tolerance pipeline shared by compare.js, next-record.js and
+ * cluster-deltas.js: operation classification, canonical key sorting and
+ * equality, the selector-based dispatch index, and a plain pipeline run.
+ *
+ * A tolerance may declare a static `selector` describing the only records
+ * its match() can ever return non-null for:
+ *
+ *   selector: {
+ *     op: 'expand' | ['validate-code', 'batch-validate-code'],  // getOperation(url)
+ *     method: 'POST' | ['GET', 'POST'],
+ *     status: [422, 404],          // [prodStatus, devStatus]; null = any
+ *     urlContains: '$expand' | ['dicom-cid-29', 'sect_CID_29'],  // any of
+ *   }
+ *
+ * Every listed field must match (a list means "any of"). Tolerances without
+ * a selector run on every record. The dispatch index groups tolerances by
+ * operation up front, so each record only calls match() on its candidates,
+ * still in the original pipeline order. A selector is a promise about
+ * match(); compare.js --verify-dispatch checks it against a corpus.
+ */
+
+const OPERATIONS = [
+  'validate-code', 'batch-validate-code', 'expand', 'lookup', 'subsumes',
+  'translate', 'metadata', 'read', 'other',
+];
+const SELECTOR_FIELDS = ['op', 'method', 'status', 'urlContains'];
+
+function getOperation(url) {
+  const base = url.split('?')[0];
+  if (base.includes('$validate-code')) return 'validate-code';
+  if (base.includes('$batch-validate-code')) return 'batch-validate-code';
+  if (base.includes('$expand')) return 'expand';
+  if (base.includes('$lookup')) return 'lookup';
+  if (base.includes('$subsumes')) return 'subsumes';
+  if (base.includes('$translate')) return 'translate';
+  if (base.includes('/metadata')) return 'metadata';
+  if (base.match(/\/(CodeSystem|ValueSet|ConceptMap)(\/|$)/)) return 'read';
+  return 'other';
+}
+
+/**
+ * Deep-sort all object keys recursively so JSON.stringify produces
+ * a canonical string regardless of key insertion order.
+ *
+ * JSON object key order carries no meaning in FHIR. This is fundamental
+ * to comparison semantics, not a tolerance — it applies unconditionally.
+ */
+function sortKeysDeep(obj) {
+  if (obj === null || obj === undefined || typeof obj !== 'object') return obj;
+  if (Array.isArray(obj)) return obj.map(sortKeysDeep);
+  const sorted = {};
+  for (const key of Object.keys(obj).sort()) {
+    sorted[key] = sortKeysDeep(obj[key]);
+  }
+  return sorted;
+}
+
+// Values JSON.stringify drops from objects and writes as null in arrays
+function isUnserializable(v) {
+  return v === undefined || typeof v === 'function' || typeof v === 'symbol';
+}
+
+// Non-finite numbers serialize as null
+function jsonLeaf(v) {
+  return typeof v === 'number' && !Number.isFinite(v) ? null : v;
+}
+
+function equalValues(a, b) {
+  a = jsonLeaf(a);
+  b = jsonLeaf(b);
+  if (a === b) return true;
+  if (a === null || b === null || typeof a !== 'object' || typeof b !== 'object') return false;
+
+  if (Array.isArray(a)) {
+    if (!Array.isArray(b) || a.length !== b.length) return false;
+    for (let i = 0; i < a.length; i++) {
+      const x = a[i], y = b[i];
+      if (!equalValues(isUnserializable(x) ? null : x, isUnserializable(y) ? null : y)) return false;
+    }
+    return true;
+  }
+  if (Array.isArray(b)) return false;
+
+  let count = 0;
+  for (const key in a) {
+    // sortKeysDeep cannot copy a '__proto__' key onto a plain object, so
+    // the stringified form never contains one
+    if (!Object.prototype.hasOwnProperty.call(a, key) || key === '__proto__') continue;
+    const x = a[key];
+    if (isUnserializable(x)) continue;
+    count++;
+    if (!Object.prototype.hasOwnProperty.call(b, key)) return false;
+    const y = b[key];
+    if (isUnserializable(y) || !equalValues(x, y)) return false;
+  }
+  for (const key in b) {
+    if (Object.prototype.hasOwnProperty.call(b, key) && key !== '__proto__' && !isUnserializable(b[key])) count--;
+  }
+  return count === 0;
+}
+
+/**
+ * Canonical equality: true exactly when
+ * JSON.stringify(sortKeysDeep(a)) === JSON.stringify(sortKeysDeep(b)),
+ * but computed in one walk over both trees, without building sorted copies,
+ * stopping at the first difference.
+ */
+function canonicalEqual(a, b) {
+  if (isUnserializable(a) || isUnserializable(b)) return isUnserializable(a) && isUnserializable(b);
+  return equalValues(a, b);
+}
+
+function asList(v) {
+  return Array.isArray(v) ? v : [v];
+}
+
+/**
+ * Validate a tolerance's selector and compile it into
+ * { ops: Set|null, test: (record) => boolean | null } where test covers the
+ * non-op fields. Throws on a malformed selector so mistakes surface at load.
+ */
+function compileSelector(t) {
+  const sel = t.selector;
+  if (sel === undefined || sel === null) return { ops: null, test: null };
+  if (typeof sel !== 'object' || Array.isArray(sel)) {
+    throw new Error(`Tolerance ${t.id}: selector must be an object`);
+  }
+  for (const key of Object.keys(sel)) {
+    if (!SELECTOR_FIELDS.includes(key)) {
+      throw new Error(`Tolerance ${t.id}: unknown selector field '${key}' (expected ${SELECTOR_FIELDS.join(', ')})`);
+    }
+  }
+
+  let ops = null;
+  if (sel.op !== undefined) {
+    ops = new Set(asList(sel.op));
+    for (const op of ops) {
+      if (!OPERATIONS.includes(op)) {
+        throw new Error(`Tolerance ${t.id}: unknown selector op '${op}' (expected ${OPERATIONS.join(', ')})`);
+      }
+    }
+  }
+
+  const checks = [];
+  if (sel.method !== undefined) {
+    const methods = new Set(asList(sel.method).map(m => m.toUpperCase()));
+    checks.push(record => methods.has((record.method || 'GET').toUpperCase()));
+  }
+  if (sel.status !== undefined) {
+    if (!Array.isArray(sel.status) || sel.status.length !== 2) {
+      throw new Error(`Tolerance ${t.id}: selector status must be [prodStatus, devStatus]`);
+    }
+    const [prodStatus, devStatus] = sel.status;
+    if (prodStatus !== null) checks.push(record => record.prod?.status === prodStatus);
+    if (devStatus !== null) checks.push(record => record.dev?.status === devStatus);
+  }
+  if (sel.urlContains !== undefined) {
+    const needles = asList(sel.urlContains);
+    checks.push(record => needles.some(n => record.url.includes(n)));
+  }
+
+  const test = checks.length === 0 ? null
+    : checks.length === 1 ? checks[0]
+      : record => checks.every(c => c(record));
+  return { ops, test };
+}
+
+/**
+ * Build the dispatch index for a tolerance list. The returned object has
+ *   forOp(op)        -> [{ index, t, test }] in pipeline order; call test(record)
+ *                       (when non-null) before match()
+ *   selects(i, record, op) -> whether tolerance i is a candidate for record
+ *   withSelector     -> number of tolerances that declare a selector
+ */
+function buildDispatch(tolerances) {
+  const compiled = tolerances.map(compileSelector);
+  const byOp = new Map();
+  for (const op of OPERATIONS) {
+    byOp.set(op, compiled
+      .map((c, index) => ({ index, t: tolerances[index], test: c.test, ops: c.ops }))
+      .filter(e => !e.ops || e.ops.has(op))
+      .map(({ index, t, test }) => ({ index, t, test })));
+  }
+  return {
+    forOp(op) {
+      return byOp.get(op);
+    },
+    selects(i, record, op) {
+      const c = compiled[i];
+      return (!c.ops || c.ops.has(op)) && (!c.test || c.test(record));
+    },
+    withSelector: tolerances.filter(t => t.selector).length,
+  };
+}
+
+/**
+ * Run the tolerance pipeline on one record for inspection, without
+ * compare.js's categorization. Returns { prod, dev, skippedBy, applied }:
+ * the normalized bodies (null where unparseable), the id of the tolerance
+ * that skipped the record (or null), and "<id>: skip|normalize" lines.
+ */
+function applyTolerances(record, dispatch) {
+  let prod, dev;
+  try { prod = JSON.parse(record.prodBody); } catch { prod = null; }
+  try { dev = JSON.parse(record.devBody); } catch { dev = null; }
+
+  const ctx = { record, prod, dev };
+  const applied = [];
+  for (const { t, test } of dispatch.forOp(getOperation(record.url))) {
+    if (test && !test(record)) continue;
+    const action = t.match(ctx);
+    if (action === 'skip') {
+      applied.push(`${t.id}: skip`);
+      return { prod: ctx.prod, dev: ctx.dev, skippedBy: t.id, applied };
+    }
+    if (action === 'normalize' && ctx.prod && ctx.dev) {
+      const result = t.normalize(ctx);
+      ctx.prod = result.prod;
+      ctx.dev = result.dev;
+      applied.push(`${t.id}: normalize`);
+    }
+  }
+  return { prod: ctx.prod, dev: ctx.dev, skippedBy: null, applied };
+}
+
+module.exports = {
+  OPERATIONS, getOperation, sortKeysDeep, canonicalEqual, compileSelector, buildDispatch, applyTolerances,
+};
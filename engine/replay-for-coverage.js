@@ -5,14 +5,14 @@
  * Usage:
  *   node engine/replay-for-coverage.js <comparison.ndjson> [--base http://localhost:3000] [--concurrency 20]
  *
- * Reads each line from comparison.ndjson, fires the request (method + url + requestBody),
- * and reports progress. Designed to be run while the server is instrumented with c8
+ * Reads each line from comparison.ndjson (or a seekable comparison.ndjson.gz),
+ * fires the request (method + url + requestBody), and reports progress. Designed to be run while the server is instrumented with c8
  * for code coverage.
  */
 
 const http = require('http');
-const fs = require('fs');
 const readline = require('readline');
+const { createReadStream } = require('./seekable-gzip');
 
 const args = process.argv.slice(2);
 let ndjsonPath = null;
@@ -96,7 +96,7 @@ function makeRequest(record) {
 async function main() {
   // First pass: count lines
   console.error('Counting records...');
-  const countStream = fs.createReadStream(ndjsonPath, 'utf-8');
+  const countStream = createReadStream(ndjsonPath);
   const countRl = readline.createInterface({ input: countStream, crlfDelay: Infinity });
   for await (const _ of countRl) { total++; }
   console.error(`Found ${total} records to replay`);
@@ -105,7 +105,7 @@ async function main() {
   console.error(`Replaying against ${base} (concurrency=${concurrency})...`);
   const start = Date.now();
 
-  const stream = fs.createReadStream(ndjsonPath, 'utf-8');
+  const stream = createReadStream(ndjsonPath);
   const rl = readline.createInterface({ input: stream, crlfDelay: Infinity });
 
   const inflight = new Set();
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Convert a requests.ndjson file into a comparison.ndjson file by sending
+each request to both prod and dev servers and capturing responses.
+
+Requests are streamed from the input and fired concurrently over pooled
+keep-alive connections (see tx_fetch.py); a record's prod and dev requests
+run in parallel, and at most --window records are in flight at once. Output
+records are written in input order with the usual comparison schema, plus the
+per-server response time in prod.latencyMs / dev.latencyMs.
+
+Requests go out the way the original curl loop sent them, so captures stay
+comparable across rounds: redirects are not followed (the 3xx response is
+recorded), and a POST without a requestBody is sent as a GET with no body.
+
+Usage:
+  python3 engine/requests-to-comparison.py <requests.ndjson> <output.ndjson>
+      [--window N] [--rate R] [--prod-base URL] [--dev-base URL]
+
+  --window N        max records in flight (default 16)
+  --rate R          max requests/sec per server, 0 = unlimited (default 0)
+  --prod-base URL   override the prod server (default https://tx.fhir.org)
+  --dev-base URL    override the dev server (default https://tx-dev.fhir.org)
+"""
+
+import collections
+import hashlib
+import json
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from tx_fetch import Fetcher, PROD_BASE, DEV_BASE
+
+DEFAULT_WINDOW = 16
+VALUE_FLAGS = ("--window", "--rate", "--prod-base", "--dev-base")
+
+
+def get_arg(flag, default):
+    if flag in sys.argv:
+        i = sys.argv.index(flag)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
+
+
+def side_meta(result):
+    """Build the prod/dev metadata block; a failed request is status 0 with an empty body."""
+    if not result:
+        return {"status": 0, "contentType": "", "size": 0,
+                "hash": hashlib.md5(b"").hexdigest(), "latencyMs": None}, ""
+    raw = result["raw"]
+    return {
+        "status": result["status"],
+        "contentType": result["contentType"],
+        "size": len(raw),
+        "hash": hashlib.md5(raw).hexdigest(),
+        "latencyMs": result["latencyMs"],
+    }, result["body"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    args = []
+    argv = iter(sys.argv[1:])
+    for a in argv:
+        if a in VALUE_FLAGS:
+            next(argv, None)
+        elif not a.startswith("--"):
+            args.append(a)
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    input_path, output_path = args[0], args[1]
+    window = int(get_arg("--window", DEFAULT_WINDOW))
+    rate = float(get_arg("--rate", 0))
+    prod_base = get_arg("--prod-base", PROD_BASE)
+    dev_base = get_arg("--dev-base", DEV_BASE)
+
+    count = 0
+    matched = 0
+    failed = 0
+    latencies = {"prod": [], "dev": []}
+    pending = collections.deque()  # (request, prod future, dev future)
+
+    def flush_head():
+        nonlocal count, matched, failed
+        req, prod_fut, dev_fut = pending.popleft()
+        prod_result, prod_err = prod_fut.result()
+        dev_result, dev_err = dev_fut.result()
+        for side, err in (("prod", prod_err), ("dev", dev_err)):
+            if err:
+                failed += 1
+                print(f"  {side} FAILED {req['method']} {req['url'][:80]}: {err}", file=sys.stderr)
+
+        prod_meta, prod_body = side_meta(prod_result)
+        dev_meta, dev_body = side_meta(dev_result)
+        for side, meta in (("prod", prod_meta), ("dev", dev_meta)):
+            if meta["latencyMs"] is not None:
+                latencies[side].append(meta["latencyMs"])
+
+        rec = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "id": str(uuid.uuid4()),
+            "method": req["method"],
+            "url": req["url"],
+            "match": prod_meta["hash"] == dev_meta["hash"],
+            "prod": prod_meta,
+            "dev": dev_meta,
+            "prodBody": prod_body,
+            "devBody": dev_body,
+        }
+        if req.get("requestBody"):
+            rec["requestBody"] = req["requestBody"]
+        fout.write(json.dumps(rec) + "\n")
+
+        count += 1
+        matched += rec["match"]
+        if count % 10 == 0:
+            print(f"  [{count}] requests completed", file=sys.stderr)
+
+    with Fetcher([prod_base, dev_base], concurrency=window, rate=rate,
+                 follow_redirects=False, bodyless_post="get") as fetcher, \
+            open(input_path) as fin, open(output_path, "w") as fout:
+        for line in fin:
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            pending.append((req,
+                            fetcher.submit(prod_base, req, errors="replace"),
+                            fetcher.submit(dev_base, req, errors="replace")))
+            while pending and (len(pending) >= window or
+                               (pending[0][1].done() and pending[0][2].done())):
+                flush_head()
+        while pending:
+            flush_head()
+
+    print(f"Done: {matched} match, {count - matched} mismatch out of {count} total"
+          + (f" ({failed} failed requests)" if failed else ""), file=sys.stderr)
+    for side in ("prod", "dev"):
+        lat = latencies[side]
+        if lat:
+            print(f"  {side} latency: p50={percentile(lat, 50)}ms p95={percentile(lat, 95)}ms "
+                  f"max={max(lat)}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,8 @@ fi
 
 JOB_DIR="$TRIAGE_DIR/$1"
 NDJSON="$JOB_DIR/comparison.ndjson"
+# Seekable gzip form (engine/seekable-gzip.js); the replay reads it directly
+[[ -f "$NDJSON" || ! -f "$NDJSON.gz" ]] || NDJSON="$NDJSON.gz"
 
 if [[ ! -f "$NDJSON" ]]; then
   echo "Error: comparison.ndjson not found at $NDJSON"
@@ -42,7 +44,11 @@ PORT=3099  # Use a non-default port to avoid conflicts
 
 echo "=== Code Coverage Analysis ==="
 echo "  Job: $1"
-echo "  Records: $(wc -l < "$NDJSON")"
+if [[ "$NDJSON" == *.gz ]]; then
+  echo "  Records: $(zcat "$NDJSON" | wc -l)"
+else
+  echo "  Records: $(wc -l < "$NDJSON")"
+fi
 echo "  Server: http://localhost:$PORT"
 echo "  Output: $COVERAGE_DIR"
 echo ""
@@ -0,0 +1,504 @@
+#!/usr/bin/env node
+'use strict';
+
+/**
+ * Seekable gzip container for comparison.ndjson (comparison.ndjson.gz).
+ *
+ * The file is a run of independently compressed gzip members ("frames"),
+ * each holding whole lines, about FRAME_SIZE bytes of NDJSON apiece. It is
+ * an ordinary multi-member gzip file, so zcat, gunzip and Python's gzip
+ * module read it as is. Each member's header carries an extra field
+ * (RFC 1952 FEXTRA, subfield "SG") with the member's compressed and
+ * uncompressed length, the way BGZF does for BAM files:
+ *
+ *   1f 8b 08 04  00 00 00 00  00 ff   gzip header, FLG.FEXTRA, no mtime
+ *   0c 00                             XLEN = 12
+ *   53 47 08 00                       subfield "SG", 8 bytes
+ *   <csize u32le> <usize u32le>       whole member length, uncompressed length
+ *   <deflate data> <crc32> <isize>
+ *
+ * Hopping from header to header gives the frame index (where each frame
+ * starts, compressed and uncompressed) without inflating anything, so any
+ * byte range of the NDJSON -- a record found through the ndjson-index
+ * sidecar, a compact deltas pointer -- costs one frame. Offsets everywhere
+ * (.idx entries, src pointers, --workers ranges) are offsets into the
+ * uncompressed NDJSON, so they mean the same for either form of the file.
+ *
+ * The readers take plain NDJSON and seekable gzip alike, told apart by the
+ * file's first bytes:
+ *   createReadStream(file, { start, end })  like fs.createReadStream; frames
+ *                                           are inflated READ_AHEAD at a time
+ *                                           on the libuv thread pool (inline
+ *                                           on a single core)
+ *   readChunks(file)                        synchronous, for iterLines
+ *   openReader(file)                        .read(offset, length), .size
+ *
+ * Reading skips the gzip CRC; verify checks it for every frame.
+ *
+ * Mirrors engine/seekable_gzip.py; either one reads what the other wrote.
+ *
+ * Usage:
+ *   node engine/seekable-gzip.js compress <file.ndjson> [<out.ndjson.gz>] [--level N] [--frame-size BYTES]
+ *   node engine/seekable-gzip.js decompress <file.ndjson.gz> [<out.ndjson>]
+ *   node engine/seekable-gzip.js info <file.ndjson.gz>
+ *   node engine/seekable-gzip.js verify <file.ndjson.gz>     # checks every frame's CRC
+ */
+
+const fs = require('fs');
+const os = require('os');
+const { Readable, Writable } = require('stream');
+const { pipeline } = require('stream/promises');
+const { promisify } = require('util');
+const zlib = require('zlib');
+
+const gzip = promisify(zlib.gzip);
+const inflateRaw = promisify(zlib.inflateRaw);
+
+// Uncompressed bytes per frame; a frame ends at the first line end past this
+const FRAME_SIZE = 1 << 20;
+const DEFAULT_LEVEL = 6;
+const HEADER_SIZE = 24;
+// Frames inflated (or deflated, when writing) concurrently by the streams.
+// With a single core the thread pool only adds overhead, so
+// createReadStream inflates inline instead.
+const READ_AHEAD = 8;
+const INLINE_INFLATE = os.availableParallelism() < 2;
+// Inflated frames kept by openReader for nearby reads
+const FRAME_CACHE = 8;
+const PLAIN_CHUNK = 4 * 1024 * 1024;
+const NEWLINE = 0x0a;
+const HEADER_PREFIX = Buffer.from([0x1f, 0x8b, 0x08, 0x04]);
+const EXTRA_PREFIX = Buffer.from([0x0c, 0x00, 0x53, 0x47, 0x08, 0x00]);
+
+function compressedPath(file) {
+  return `${file}.gz`;
+}
+
+function frameHeader(csize, usize) {
+  const header = Buffer.alloc(HEADER_SIZE);
+  HEADER_PREFIX.copy(header, 0);
+  header[9] = 0xff;  // OS unknown
+  EXTRA_PREFIX.copy(header, 10);
+  header.writeUInt32LE(csize, 16);
+  header.writeUInt32LE(usize, 20);
+  return header;
+}
+
+/** { csize, usize } from a frame header, or null if buf does not start one. */
+function parseHeader(buf) {
+  if (buf.length < HEADER_SIZE || !buf.subarray(0, 4).equals(HEADER_PREFIX) ||
+    !buf.subarray(10, 16).equals(EXTRA_PREFIX)) {
+    return null;
+  }
+  return { csize: buf.readUInt32LE(16), usize: buf.readUInt32LE(20) };
+}
+
+// zlib's gzip header is a fixed 10 bytes; swap it for the frame header and
+// keep the deflate data, CRC and length it computed
+function toFrame(gz, usize) {
+  return Buffer.concat([frameHeader(HEADER_SIZE + gz.length - 10, usize), gz.subarray(10)]);
+}
+
+// Streaming and lookups skip the CRC (the deflate stream and the length
+// still have to check out); verify checks it for every frame
+function frameData(member) {
+  return member.subarray(HEADER_SIZE, member.length - 8);
+}
+
+function checkLength(data, frame, file) {
+  if (data.length !== frame.ulength) {
+    throw new Error(`${file}: frame at byte ${frame.offset} inflates to ${data.length} bytes, not ${frame.ulength}`);
+  }
+  return data;
+}
+
+function inflateSync(member, frame, file) {
+  return checkLength(zlib.inflateRawSync(frameData(member)), frame, file);
+}
+
+function readFully(fd, length, position) {
+  const buf = Buffer.allocUnsafe(length);
+  let got = 0;
+  while (got < length) {
+    const n = fs.readSync(fd, buf, got, length - got, position + got);
+    if (n === 0) break;
+    got += n;
+  }
+  return got === length ? buf : buf.subarray(0, got);
+}
+
+/** True if file starts with a seekable gzip frame; other gzip files are not seekable. */
+function isSeekableGzip(file) {
+  const fd = fs.openSync(file, 'r');
+  try {
+    return parseHeader(readFully(fd, HEADER_SIZE, 0)) !== null;
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+function checkNotGzip(file, fd) {
+  const head = readFully(fd, 2, 0);
+  if (head.length === 2 && head[0] === 0x1f && head[1] === 0x8b) {
+    throw new Error(`${file} is gzip but not seekable; recompress it with ` +
+      `'zcat ${file} > x.ndjson && node engine/seekable-gzip.js compress x.ndjson'`);
+  }
+}
+
+/**
+ * Frame index of a seekable gzip file: [{ offset, length, uoffset, ulength }],
+ * compressed position and size, then uncompressed position and size.
+ */
+function frameIndex(file) {
+  const fd = fs.openSync(file, 'r');
+  try {
+    const size = fs.fstatSync(fd).size;
+    const frames = [];
+    let pos = 0;
+    let upos = 0;
+    while (pos < size) {
+      const header = parseHeader(readFully(fd, HEADER_SIZE, pos));
+      if (!header || header.csize < HEADER_SIZE + 8 || pos + header.csize > size) {
+        throw new Error(`${file}: no seekable gzip frame at byte ${pos} (truncated, or not written by seekable-gzip)`);
+      }
+      frames.push({ offset: pos, length: header.csize, uoffset: upos, ulength: header.usize });
+      pos += header.csize;
+      upos += header.usize;
+    }
+    return frames;
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+/** Index of the frame holding uncompressed byte offset (frames[0] for 0 of an empty file). */
+function frameAt(frames, offset) {
+  let lo = 0;
+  let hi = frames.length - 1;
+  while (lo < hi) {
+    const mid = (lo + hi + 1) >>> 1;
+    if (frames[mid].uoffset <= offset) lo = mid;
+    else hi = mid - 1;
+  }
+  return lo;
+}
+
+// ---- Random access ----
+
+class PlainReader {
+  constructor(file) {
+    this.file = file;
+    this.fd = fs.openSync(file, 'r');
+    checkNotGzip(file, this.fd);
+    this.size = fs.fstatSync(this.fd).size;
+  }
+
+  read(offset, length) {
+    return readFully(this.fd, length, offset);
+  }
+
+  close() {
+    if (this.fd !== null) fs.closeSync(this.fd);
+    this.fd = null;
+  }
+}
+
+class SeekableGzipReader {
+  constructor(file) {
+    this.file = file;
+    this.frames = frameIndex(file);
+    const last = this.frames[this.frames.length - 1];
+    this.size = last ? last.uoffset + last.ulength : 0;
+    this.fd = fs.openSync(file, 'r');
+    this.cache = new Map();
+  }
+
+  inflate(i) {
+    let data = this.cache.get(i);
+    if (data) {
+      this.cache.delete(i);
+    } else {
+      const frame = this.frames[i];
+      data = inflateSync(readFully(this.fd, frame.length, frame.offset), frame, this.file);
+      if (this.cache.size >= FRAME_CACHE) this.cache.delete(this.cache.keys().next().value);
+    }
+    this.cache.set(i, data);
+    return data;
+  }
+
+  /** length bytes of the NDJSON from offset (fewer at the end of the file). */
+  read(offset, length) {
+    const end = Math.min(offset + length, this.size);
+    const parts = [];
+    for (let i = frameAt(this.frames, offset); offset < end; i++) {
+      const frame = this.frames[i];
+      const data = this.inflate(i);
+      parts.push(data.subarray(offset - frame.uoffset, Math.min(end - frame.uoffset, data.length)));
+      offset = frame.uoffset + frame.ulength;
+    }
+    return parts.length === 1 ? parts[0] : Buffer.concat(parts);
+  }
+
+  close() {
+    if (this.fd !== null) fs.closeSync(this.fd);
+    this.fd = null;
+    this.cache.clear();
+  }
+}
+
+/** A reader with read(offset, length) -> Buffer over the NDJSON, plain or seekable gzip. */
+function openReader(file) {
+  return isSeekableGzip(file) ? new SeekableGzipReader(file) : new PlainReader(file);
+}
+
+// ---- Streaming ----
+
+/** Yield the file's NDJSON as Buffers, synchronously: plain chunks or inflated frames. */
+function* readChunks(file) {
+  const fd = fs.openSync(file, 'r');
+  try {
+    if (parseHeader(readFully(fd, HEADER_SIZE, 0))) {
+      for (const frame of frameIndex(file)) yield inflateSync(readFully(fd, frame.length, frame.offset), frame, file);
+      return;
+    }
+    checkNotGzip(file, fd);
+    const chunk = Buffer.allocUnsafe(PLAIN_CHUNK);
+    let pos = 0;
+    let n;
+    while ((n = fs.readSync(fd, chunk, 0, PLAIN_CHUNK, pos)) > 0) {
+      yield chunk.subarray(0, n);
+      pos += n;
+    }
+  } finally {
+    fs.closeSync(fd);
+  }
+}
+
+async function* inflateRange(file, frames, start, end) {
+  const fh = await fs.promises.open(file, 'r');
+  const pending = [];
+  try {
+    let next = frameAt(frames, start);
+    for (;;) {
+      while (next < frames.length && frames[next].uoffset < end && pending.length < READ_AHEAD) {
+        const frame = frames[next++];
+        const data = INLINE_INFLATE
+          ? Promise.resolve(inflateSync(readFully(fh.fd, frame.length, frame.offset), frame, file))
+          : (async () => {
+            const buf = Buffer.allocUnsafe(frame.length);
+            await fh.read(buf, 0, frame.length, frame.offset);
+            return checkLength(await inflateRaw(frameData(buf)), frame, file);
+          })();
+        data.catch(() => {});  // awaited below, or settled in finally
+        pending.push({ frame, data });
+      }
+      if (!pending.length) break;
+      const { frame, data } = pending.shift();
+      const buf = await data;
+      const from = Math.max(start - frame.uoffset, 0);
+      const to = Math.min(end - frame.uoffset, buf.length);
+      if (to > from) yield from === 0 && to === buf.length ? buf : buf.subarray(from, to);
+    }
+  } finally {
+    await Promise.allSettled(pending.map(p => p.data));
+    await fh.close();
+  }
+}
+
+/**
+ * A Readable of the file's NDJSON bytes [start, end] (end inclusive, as in
+ * fs.createReadStream), plain or seekable gzip.
+ */
+function createReadStream(file, { start = 0, end = Infinity } = {}) {
+  if (!isSeekableGzip(file)) {
+    const fd = fs.openSync(file, 'r');
+    try {
+      checkNotGzip(file, fd);
+    } finally {
+      fs.closeSync(fd);
+    }
+    return fs.createReadStream(file, end === Infinity ? { start } : { start, end });
+  }
+  return Readable.from(inflateRange(file, frameIndex(file), start, end + 1), { objectMode: false });
+}
+
+/** Uncompressed size of the NDJSON in file. */
+function contentSize(file) {
+  if (!isSeekableGzip(file)) return fs.statSync(file).size;
+  const frames = frameIndex(file);
+  const last = frames[frames.length - 1];
+  return last ? last.uoffset + last.ulength : 0;
+}
+
+/**
+ * Line-aligned cut points for splitting file into about n ranges: offsets
+ * just past a newline (or 0 / the end). For seekable gzip these are frame
+ * boundaries, so no frame is inflated twice.
+ */
+function lineBoundaries(file, n) {
+  if (!isSeekableGzip(file)) return null;
+  const frames = frameIndex(file);
+  const size = contentSize(file);
+  const bounds = [0];
+  for (let i = 1; i < n; i++) {
+    const target = Math.floor(size * i / n);
+    const cut = frames[Math.min(frameAt(frames, target) + 1, frames.length - 1)];
+    const at = cut && cut.uoffset > target ? cut.uoffset : size;
+    bounds.push(Math.max(at, bounds[bounds.length - 1]));
+  }
+  bounds.push(size);
+  return bounds;
+}
+
+// ---- Writing ----
+
+/**
+ * Writable that compresses the NDJSON written to it into a seekable gzip
+ * file. A frame ends at the first line end at or past frameSize bytes, so
+ * the frames do not depend on how the input was chunked. Frames are
+ * deflated READ_AHEAD at a time on the thread pool and written in order.
+ */
+class SeekableGzipWriter extends Writable {
+  constructor(file, { level = DEFAULT_LEVEL, frameSize = FRAME_SIZE } = {}) {
+    super();
+    this.file = file;
+    this.level = level;
+    this.frameSize = frameSize;
+    this.fd = fs.openSync(file, 'w');
+    this.buffered = [];
+    this.bufferedBytes = 0;
+    this.queue = [];
+    this.frames = 0;
+    this.bytesIn = 0;
+    this.bytesOut = 0;
+  }
+
+  _write(chunk, encoding, callback) {
+    this.buffered.push(chunk);
+    this.bufferedBytes += chunk.length;
+    if (this.bufferedBytes < this.frameSize) return callback();
+    let data = Buffer.concat(this.buffered);
+    const frames = [];
+    let nl;
+    while (data.length >= this.frameSize && (nl = data.indexOf(NEWLINE, this.frameSize - 1)) !== -1) {
+      frames.push(data.subarray(0, nl + 1));
+      data = data.subarray(nl + 1);
+    }
+    this.buffered = data.length ? [data] : [];
+    this.bufferedBytes = data.length;
+    (async () => {
+      for (const frame of frames) await this.enqueue(frame);
+    })().then(() => callback(), callback);
+  }
+
+  _final(callback) {
+    const rest = this.bufferedBytes ? Buffer.concat(this.buffered) : null;
+    this.buffered = [];
+    this.bufferedBytes = 0;
+    (async () => {
+      if (rest) this.queue.push(this.deflate(rest));
+      while (this.queue.length) await this.writeNext();
+      fs.closeSync(this.fd);
+      this.fd = null;
+    })().then(() => callback(), callback);
+  }
+
+  _destroy(err, callback) {
+    if (this.fd !== null) fs.closeSync(this.fd);
+    this.fd = null;
+    callback(err);
+  }
+
+  deflate(data) {
+    this.bytesIn += data.length;
+    const frame = gzip(data, { level: this.level }).then(gz => toFrame(gz, data.length));
+    frame.catch(() => {});  // awaited in order by writeNext
+    return frame;
+  }
+
+  async enqueue(data) {
+    this.queue.push(this.deflate(data));
+    if (this.queue.length >= READ_AHEAD) await this.writeNext();
+  }
+
+  async writeNext() {
+    const frame = await this.queue.shift();
+    fs.writeSync(this.fd, frame);
+    this.frames++;
+    this.bytesOut += frame.length;
+  }
+}
+
+// ---- CLI ----
+
+function getFlag(args, flag, def) {
+  const i = args.indexOf(flag);
+  if (i < 0) return def;
+  const [value] = args.splice(i, 2).slice(1);
+  return value;
+}
+
+async function compress(input, output, options) {
+  const started = Date.now();
+  const tmp = `${output}.${process.pid}.tmp`;
+  const writer = new SeekableGzipWriter(tmp, options);
+  await pipeline(fs.createReadStream(input, { highWaterMark: 1 << 20 }), writer);
+  fs.renameSync(tmp, output);
+  const mb = n => (n / 1048576).toFixed(1);
+  console.error(`Compressed ${input} (${mb(writer.bytesIn)} MB) -> ${output} (${mb(writer.bytesOut)} MB, ` +
+    `${(writer.bytesIn / Math.max(writer.bytesOut, 1)).toFixed(1)}x) in ${writer.frames} frames ` +
+    `in ${((Date.now() - started) / 1000).toFixed(1)}s`);
+}
+
+function info(file) {
+  const frames = frameIndex(file);
+  const size = fs.statSync(file).size;
+  const usize = contentSize(file);
+  const largest = frames.reduce((m, f) => Math.max(m, f.ulength), 0);
+  console.log(`${file}: ${frames.length} frames, ${size} bytes -> ${usize} bytes of NDJSON ` +
+    `(${(usize / Math.max(size, 1)).toFixed(1)}x); largest frame ${largest} bytes`);
+}
+
+function verify(file) {
+  const frames = frameIndex(file);
+  const fd = fs.openSync(file, 'r');
+  try {
+    for (const frame of frames) {
+      // gunzip checks the CRC and length in the member's trailer
+      zlib.gunzipSync(readFully(fd, frame.length, frame.offset));
+    }
+  } finally {
+    fs.closeSync(fd);
+  }
+  console.log(`${file}: ${frames.length} frames OK`);
+}
+
+async function main() {
+  const args = process.argv.slice(2);
+  const level = parseInt(getFlag(args, '--level', DEFAULT_LEVEL), 10);
+  const frameSize = parseInt(getFlag(args, '--frame-size', FRAME_SIZE), 10);
+  const [command, input, output] = args;
+  if (command === 'compress' && input) {
+    await compress(input, output || compressedPath(input), { level, frameSize });
+  } else if (command === 'decompress' && input) {
+    const out = output ? fs.createWriteStream(output) : process.stdout;
+    await pipeline(createReadStream(input), out);
+  } else if (command === 'info' && input) {
+    info(input);
+  } else if (command === 'verify' && input) {
+    verify(input);
+  } else {
+    console.error('Usage:\n  node engine/seekable-gzip.js compress <file.ndjson> [<out.ndjson.gz>] [--level N] [--frame-size BYTES]\n' +
+      '  node engine/seekable-gzip.js decompress <file.ndjson.gz> [<out.ndjson>]\n' +
+      '  node engine/seekable-gzip.js info <file.ndjson.gz>\n' +
+      '  node engine/seekable-gzip.js verify <file.ndjson.gz>');
+    process.exit(1);
+  }
+}
+
+if (require.main === module) main().catch(e => { console.error(e.message); process.exit(1); });
+
+module.exports = {
+  SeekableGzipWriter, openReader, createReadStream, readChunks, frameIndex, isSeekableGzip,
+  contentSize, lineBoundaries, compressedPath, FRAME_SIZE,
+};
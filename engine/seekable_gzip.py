@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Seekable gzip container for comparison.ndjson (comparison.ndjson.gz).
+
+The file is a run of independently compressed gzip members ("frames"), each
+holding whole lines, about FRAME_SIZE bytes of NDJSON apiece. It is an
+ordinary multi-member gzip file, so zcat and the gzip module read it as is.
+Each member's header carries an extra field (RFC 1952 FEXTRA, subfield "SG")
+with the member's compressed and uncompressed length, the way BGZF does for
+BAM files:
+
+  1f 8b 08 04  00 00 00 00  00 ff   gzip header, FLG.FEXTRA, no mtime
+  0c 00                             XLEN = 12
+  53 47 08 00                       subfield "SG", 8 bytes
+  <csize u32le> <usize u32le>       whole member length, uncompressed length
+  <deflate data> <crc32> <isize>
+
+Hopping from header to header gives the frame index without inflating
+anything, so a byte range of the NDJSON -- a record found through the
+ndjson_index sidecar, a compact deltas pointer -- costs one frame. Offsets
+everywhere are offsets into the uncompressed NDJSON.
+
+The readers take plain NDJSON and seekable gzip alike, told apart by the
+file's first bytes:
+  iter_lines(path, start=0)   raw lines (with their newline) from offset
+                              start, like iterating a file opened "rb";
+                              frames are inflated READ_AHEAD at a time on a
+                              thread pool (zlib releases the GIL; inline on
+                              a single core)
+  open_reader(path)           .read(offset, length), .size
+
+Reading skips the gzip CRC; verify checks it for every frame.
+
+Mirrors engine/seekable-gzip.js; either one reads what the other wrote.
+
+Usage:
+  python3 engine/seekable_gzip.py compress <file.ndjson> [<out.ndjson.gz>] [--level N]
+  python3 engine/seekable_gzip.py decompress <file.ndjson.gz> [<out.ndjson>]
+  python3 engine/seekable_gzip.py info <file.ndjson.gz>
+  python3 engine/seekable_gzip.py verify <file.ndjson.gz>     # checks every frame's CRC
+
+From a script:
+  from seekable_gzip import iter_lines, SeekableGzipWriter
+  with SeekableGzipWriter(open("out.ndjson.gz", "wb")) as out:
+      for raw in iter_lines("jobs/<round>/comparison.ndjson.gz"):
+          out.write(raw)
+"""
+
+import io
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Uncompressed bytes per frame; a frame ends at the first line end past this
+FRAME_SIZE = 1 << 20
+DEFAULT_LEVEL = 6
+HEADER_SIZE = 24
+# Frames inflated concurrently by iter_lines. With a single core the pool
+# only adds overhead, so frames are inflated inline instead.
+READ_AHEAD = 4
+INLINE_INFLATE = (os.cpu_count() or 1) < 2
+# Inflated frames kept by open_reader for nearby reads
+FRAME_CACHE = 8
+HEADER_PREFIX = b"\x1f\x8b\x08\x04"
+EXTRA_PREFIX = b"\x0c\x00SG\x08\x00"
+
+Frame = namedtuple("Frame", "offset length uoffset ulength")
+
+
+def compressed_path(path):
+    return f"{path}.gz"
+
+
+def _frame_header(csize, usize):
+    return HEADER_PREFIX + b"\x00\x00\x00\x00\x00\xff" + EXTRA_PREFIX + struct.pack("<II", csize, usize)
+
+
+def _parse_header(buf):
+    """(csize, usize) from a frame header, or None if buf does not start one."""
+    if len(buf) < HEADER_SIZE or buf[:4] != HEADER_PREFIX or buf[10:16] != EXTRA_PREFIX:
+        return None
+    return struct.unpack_from("<II", buf, 16)
+
+
+def compress_frame(data, level=DEFAULT_LEVEL):
+    deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+    body = deflate.compress(data) + deflate.flush()
+    trailer = struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF)
+    return _frame_header(HEADER_SIZE + len(body) + len(trailer), len(data)) + body + trailer
+
+
+def inflate_frame(member, frame, path):
+    """The NDJSON in one frame. Skips the CRC (the deflate stream and the length
+    still have to check out); verify checks it."""
+    data = zlib.decompress(memoryview(member)[HEADER_SIZE:-8], -15)
+    if len(data) != frame.ulength:
+        raise ValueError(f"{path}: frame at byte {frame.offset} inflates to {len(data)} bytes, not {frame.ulength}")
+    return data
+
+
+def is_seekable_gzip(path):
+    """True if path starts with a seekable gzip frame; other gzip files are not seekable."""
+    with open(path, "rb") as f:
+        return _parse_header(f.read(HEADER_SIZE)) is not None
+
+
+def _check_not_gzip(path, head):
+    if head[:2] == b"\x1f\x8b":
+        raise ValueError(f"{path} is gzip but not seekable; recompress it with "
+                         f"'zcat {path} > x.ndjson && python3 engine/seekable_gzip.py compress x.ndjson'")
+
+
+def frame_index(path):
+    """Frames of a seekable gzip file: Frame(offset, length, uoffset, ulength) each."""
+    frames = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = upos = 0
+        while pos < size:
+            header = _parse_header(os.pread(f.fileno(), HEADER_SIZE, pos))
+            if not header or header[0] < HEADER_SIZE + 8 or pos + header[0] > size:
+                raise ValueError(f"{path}: no seekable gzip frame at byte {pos} "
+                                 "(truncated, or not written by seekable_gzip)")
+            frames.append(Frame(pos, header[0], upos, header[1]))
+            pos += header[0]
+            upos += header[1]
+    return frames
+
+
+def _frame_at(frames, offset):
+    """Index of the frame holding uncompressed byte offset."""
+    lo, hi = 0, len(frames) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if frames[mid].uoffset <= offset:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+# ---- Random access ----
+
+class PlainReader:
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        _check_not_gzip(path, os.pread(self.fd, 2, 0))
+        self.size = os.fstat(self.fd).st_size
+
+    def read(self, offset, length):
+        return os.pread(self.fd, length, offset)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SeekableGzipReader(PlainReader):
+    def __init__(self, path):
+        self.path = path
+        self.frames = frame_index(path)
+        last = self.frames[-1] if self.frames else None
+        self.size = last.uoffset + last.ulength if last else 0
+        self.fd = os.open(path, os.O_RDONLY)
+        self.cache = OrderedDict()
+
+    def _inflate(self, i):
+        data = self.cache.get(i)
+        if data is not None:
+            self.cache.move_to_end(i)
+            return data
+        frame = self.frames[i]
+        data = inflate_frame(os.pread(self.fd, frame.length, frame.offset), frame, self.path)
+        self.cache[i] = data
+        if len(self.cache) > FRAME_CACHE:
+            self.cache.popitem(last=False)
+        return data
+
+    def read(self, offset, length):
+        """length bytes of the NDJSON from offset (fewer at the end of the file)."""
+        end = min(offset + length, self.size)
+        parts = [b""]
+        i = _frame_at(self.frames, offset)
+        while offset < end:
+            frame = self.frames[i]
+            parts.append(self._inflate(i)[offset - frame.uoffset:end - frame.uoffset])
+            offset = frame.uoffset + frame.ulength
+            i += 1
+        return parts[-1] if len(parts) == 2 else b"".join(parts)
+
+
+def open_reader(path):
+    """A reader with read(offset, length) -> bytes over the NDJSON, plain or seekable gzip."""
+    return SeekableGzipReader(path) if is_seekable_gzip(path) else PlainReader(path)
+
+
+# ---- Streaming ----
+
+def iter_frames(path, start=0):
+    """Inflated frames of a seekable gzip file, from the one holding offset start,
+    as (uoffset, bytes). Frames ahead are inflated on a thread pool."""
+    frames = frame_index(path)
+    if not frames:
+        return
+    fd = os.open(path, os.O_RDONLY)
+
+    def load(frame):
+        return inflate_frame(os.pread(fd, frame.length, frame.offset), frame, path)
+
+    try:
+        if INLINE_INFLATE:
+            for frame in frames[_frame_at(frames, start):]:
+                yield frame.uoffset, load(frame)
+            return
+        with ThreadPoolExecutor(READ_AHEAD) as pool:
+            pending = deque()
+            upcoming = iter(frames[_frame_at(frames, start):])
+            for frame in upcoming:
+                pending.append((frame, pool.submit(load, frame)))
+                if len(pending) >= READ_AHEAD:
+                    break
+            while pending:
+                frame, data = pending.popleft()
+                nxt = next(upcoming, None)
+                if nxt:
+                    pending.append((nxt, pool.submit(load, nxt)))
+                yield frame.uoffset, data.result()
+    finally:
+        os.close(fd)
+
+
+def iter_lines(path, start=0):
+    """Raw lines (bytes, with their newline) of the NDJSON in path from offset start,
+    which should be a line start. Plain files are read as is."""
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+        if _parse_header(head) is None:
+            _check_not_gzip(path, head)
+            f.seek(start)
+            yield from f
+            return
+    # Frames hold whole lines, so each can be split on its own
+    for uoffset, data in iter_frames(path, start):
+        yield from io.BytesIO(data[start - uoffset:] if start > uoffset else data)
+
+
+# ---- Writing ----
+
+class SeekableGzipWriter:
+    """Binary file-like that compresses the NDJSON written to it into seekable gzip
+    frames on fileobj. A frame ends at the first line end at or past frame_size bytes,
+    as in seekable-gzip.js. flush() also ends the current frame, so after flush()
+    tell() is a frame boundary -- a safe place to truncate to and append from."""
+
+    def __init__(self, fileobj, level=DEFAULT_LEVEL, frame_size=FRAME_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.frame_size = frame_size
+        self.buffer = bytearray()
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.frame_size:
+            nl = self.buffer.find(b"\n", self.frame_size - 1)
+            if nl < 0:
+                break
+            self._frame(bytes(self.buffer[:nl + 1]))
+            del self.buffer[:nl + 1]
+        return len(data)
+
+    def _frame(self, data):
+        frame = compress_frame(data, self.level)
+        self.fileobj.write(frame)
+        self.frames += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(frame)
+
+    def flush(self):
+        if self.buffer:
+            self._frame(bytes(self.buffer))
+            self.buffer.clear()
+        self.fileobj.flush()
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def close(self):
+        self.flush()
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---- CLI ----
+
+def main():
+    args = sys.argv[1:]
+    level = DEFAULT_LEVEL
+    if "--level" in args:
+        i = args.index("--level")
+        level = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) in (2, 3) and args[0] == "compress":
+        src = args[1]
+        dest = args[2] if len(args) == 3 else compressed_path(src)
+        started = time.time()
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        with open(src, "rb") as fin, SeekableGzipWriter(open(tmp, "wb"), level) as out:
+            for raw in fin:
+                out.write(raw)
+        os.replace(tmp, dest)
+        mb = 1024 * 1024
+        print(f"Compressed {src} ({out.bytes_in / mb:.1f} MB) -> {dest} ({out.bytes_out / mb:.1f} MB, "
+              f"{out.bytes_in / max(out.bytes_out, 1):.1f}x) in {out.frames} frames "
+              f"in {time.time() - started:.1f}s", file=sys.stderr)
+    elif len(args) in (2, 3) and args[0] == "decompress":
+        out = open(args[2], "wb") if len(args) == 3 else sys.stdout.buffer
+        for _, data in iter_frames(args[1]):
+            out.write(data)
+        out.flush()
+    elif len(args) == 2 and args[0] == "info":
+        frames = frame_index(args[1])
+        size = os.path.getsize(args[1])
+        usize = frames[-1].uoffset + frames[-1].ulength if frames else 0
+        largest = max((f.ulength for f in frames), default=0)
+        print(f"{args[1]}: {len(frames)} frames, {size} bytes -> {usize} bytes of NDJSON "
+              f"({usize / max(size, 1):.1f}x); largest frame {largest} bytes")
+    elif len(args) == 2 and args[0] == "verify":
+        frames = frame_index(args[1])
+        with open(args[1], "rb") as f:
+            for frame in frames:
+                # wbits 31: gzip wrapper, so the CRC and length in the trailer are checked
+                zlib.decompress(os.pread(f.fileno(), frame.length, frame.offset), 31)
+        print(f"{args[1]}: {len(frames)} frames OK")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
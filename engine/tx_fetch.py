@@ -0,0 +1,212 @@
+"""
+Concurrent, rate-limited HTTP fetching against the prod/dev tx servers.
+
+Each server gets its own worker pool and token bucket, so prod and dev are
+throttled independently and a record's prod and dev requests run side by side.
+Worker threads keep one persistent (keep-alive) connection per host and reuse
+it across requests. With a FetchCache (see fetch_cache.py), cached responses
+are replayed without touching the server or the rate limit, and every fresh
+response is stored.
+
+Usage from a script in engine/:
+
+  from tx_fetch import Fetcher, PROD_BASE, DEV_BASE
+
+  with Fetcher([PROD_BASE, DEV_BASE], concurrency=4, rate=2.0) as fetcher:
+      fut = fetcher.submit(PROD_BASE, record)
+      result, err = fut.result()
+"""
+
+import hashlib
+import http.client
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+PROD_BASE = "https://tx.fhir.org"
+DEV_BASE = "https://tx-dev.fhir.org"
+TIMEOUT = 60  # seconds per request
+MAX_REDIRECTS = 5
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/sec, holding at most `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_result(body, status, content_type, latency_ms, cached=False, raw=None):
+    return {
+        "body": body,
+        "status": status,
+        "contentType": content_type,
+        "size": len(body),
+        "hash": hashlib.md5(body.encode("utf-8")).hexdigest(),
+        "latencyMs": round(latency_ms),
+        "cached": cached,
+        "raw": raw,  # undecoded response bytes (None when replayed from cache)
+    }
+
+
+class _HostPool:
+    """Worker threads for one server, each holding its own keep-alive connection."""
+
+    def __init__(self, base, concurrency, rate, timeout, cache, follow_redirects, bodyless_post):
+        self.base = base
+        self.cache = cache
+        self.follow_redirects = follow_redirects
+        self.bodyless_post = bodyless_post
+        parsed = urllib.parse.urlsplit(base)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency,
+                                           thread_name_prefix=f"fetch-{self.netloc}")
+
+    def connection(self, scheme, netloc, fresh=False):
+        conns = getattr(self.local, "conns", None)
+        if conns is None:
+            conns = self.local.conns = {}
+        key = (scheme, netloc)
+        conn = conns.get(key)
+        if conn is not None and fresh:
+            conn.close()
+            conn = None
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conns[key] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body, headers):
+        """Send one request over this thread's pooled connection, following redirects
+        unless the fetcher was told not to."""
+        scheme, netloc = self.scheme, self.netloc
+        for _ in range(MAX_REDIRECTS + 1):
+            for attempt in (0, 1):
+                conn = self.connection(scheme, netloc, fresh=attempt > 0)
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                    # Server dropped an idle keep-alive connection; retry once fresh
+                    conn.close()
+                    if attempt:
+                        raise
+            if (self.follow_redirects and resp.status in (301, 302, 303, 307, 308)
+                    and resp.getheader("Location")):
+                target = urllib.parse.urlsplit(urllib.parse.urljoin(
+                    f"{scheme}://{netloc}{path}", resp.getheader("Location")))
+                scheme, netloc = target.scheme, target.netloc
+                path = target.path + (f"?{target.query}" if target.query else "")
+                if resp.status == 303:
+                    method, body = "GET", None
+                continue
+            return resp, data
+        raise http.client.HTTPException(f"too many redirects for {path}")
+
+    def fetch(self, record, errors="strict"):
+        method = record["method"]
+        headers = {
+            "Accept": "application/fhir+json",
+        }
+
+        req_body = None
+        if method == "POST":
+            rb = record.get("requestBody")
+            if rb:
+                headers["Content-Type"] = "application/fhir+json"
+                req_body = rb.encode("utf-8")
+            elif self.bodyless_post == "get":
+                # As the curl capture did: no body, so no -X POST either
+                method = "GET"
+            else:
+                return None, "no requestBody stored for POST"
+
+        if self.cache:
+            entry = self.cache.get(self.base, record)
+            if entry is not None:
+                return make_result(entry["body"], entry["status"], entry["contentType"], 0, cached=True), None
+
+        self.bucket.acquire()
+        started = time.monotonic()
+        try:
+            resp, data = self.request(method, self.prefix + record["url"], req_body, headers)
+            body = data.decode("utf-8", errors)
+        except Exception as e:
+            return None, str(e)
+        content_type = resp.getheader("Content-Type", "")
+        if self.cache:
+            try:
+                self.cache.put(self.base, record, resp.status, content_type, body)
+            except OSError as e:
+                # The response is still good; it just won't be replayed on a re-run
+                print(f"  cache write failed for {record['url'][:80]}: {e}", file=sys.stderr)
+        latency_ms = (time.monotonic() - started) * 1000
+        return make_result(body, resp.status, content_type, latency_ms, raw=data), None
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class Fetcher:
+    """Fetches records from several servers concurrently.
+
+    concurrency:      max in-flight requests per server
+    rate:             max requests/sec per server (0 or None = unlimited)
+    cache:            optional FetchCache consulted before, and filled after, each request
+    follow_redirects: follow 3xx Location headers (as urllib did); False returns
+                      the redirect response itself (as curl without -L did)
+    bodyless_post:    a POST record without requestBody either "fail"s the fetch,
+                      or is sent as a plain "get" (as curl did)
+    """
+
+    def __init__(self, bases, concurrency=4, rate=2.0, timeout=TIMEOUT, cache=None,
+                 follow_redirects=True, bodyless_post="fail"):
+        self.pools = {base: _HostPool(base, concurrency, rate, timeout, cache, follow_redirects, bodyless_post)
+                      for base in bases}
+
+    def submit(self, base, record, errors="strict"):
+        """Queue a fetch; the future resolves to (result, error).
+
+        errors is the UTF-8 decoding mode for the body: "strict" treats an
+        undecodable response as a failure, "replace" keeps it.
+        """
+        pool = self.pools[base]
+        return pool.executor.submit(pool.fetch, record, errors)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,39 @@
+"""
+Analysis library for triage investigations, in place of one-off scripts that
+json.loads every line of the deltas and parse both bodies of every record.
+
+records() yields the records matching op / category / id / URL filters,
+parsing only what it filters on; a Record parses its bodies when first asked
+for them. Deltas (full or compact) and comparison files (plain, packed or
+seekable gzip) all read the same way. The fhir helpers do the expansion and
+Parameters comparisons those scripts kept rewriting, and pmap spreads a
+function over the matches on worker processes.
+
+Usage:
+  PYTHONPATH=engine python3 -m txanalysis <deltas.ndjson|job dir> [--op OP[,OP]] [--category C[,C]]
+      [--url REGEX] [--ids FILE] [--count]
+  prints id, op, category and URL of each match (--count: matches per op and category)
+
+From a script (PYTHONPATH=engine, or sys.path.insert(0, "engine")):
+  from txanalysis import records, code_set_diff, display_diffs
+  for r in records("jobs/<round>", op="expand", url=r"ValueSet/v3-"):
+      diff = code_set_diff(r.prod, r.dev)
+      if diff.prod_only or diff.dev_only:
+          print(r.id, r.param("url"), diff.prod_total, diff.dev_total, len(diff.dev_only))
+
+  from txanalysis import pmap
+  def totals(r):   # module level, so worker processes can find it
+      return r.id, code_set_diff(r.prod, r.dev).dev_total
+  for record_id, total in pmap(totals, records("jobs/<round>", op="expand")):
+      ...
+"""
+
+from .fhir import (CodeSetDiff, code_set_diff, display_diffs, expansion_codes, expansion_contains,
+                   param_value, parse_body, query_param, url_pattern)
+from .parallel import pmap
+from .records import Record, deltas_path, records
+
+__all__ = [
+    "CodeSetDiff", "Record", "code_set_diff", "deltas_path", "display_diffs", "expansion_codes",
+    "expansion_contains", "param_value", "parse_body", "pmap", "query_param", "records", "url_pattern",
+]
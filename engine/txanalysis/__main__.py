@@ -0,0 +1,45 @@
+import sys
+from collections import Counter
+
+from txanalysis import records
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    paths = []
+    it = iter(args)
+    for arg in it:
+        if arg in ("--op", "--category", "--url", "--ids"):
+            options[arg[2:]] = next(it, None)
+        elif arg == "--count":
+            options["count"] = True
+        else:
+            paths.append(arg)
+    if len(paths) != 1 or None in options.values():
+        print(sys.modules["txanalysis"].__doc__)
+        sys.exit(1)
+
+    ids = None
+    if options.get("ids"):
+        with open(options["ids"], encoding="utf-8") as f:
+            ids = [line.strip() for line in f if line.strip()]
+    matches = records(
+        paths[0],
+        op=options["op"].split(",") if options.get("op") else None,
+        category=options["category"].split(",") if options.get("category") else None,
+        ids=ids,
+        url=options.get("url"),
+    )
+    if options.get("count"):
+        counts = Counter((r.op, r.category) for r in matches)
+        for (op, category), n in counts.most_common():
+            print(f"{n:8d}  {op}  {category}")
+        print(f"{sum(counts.values()):8d}  total")
+    else:
+        for r in matches:
+            print(f"{r.id}\t{r.op}\t{r.category}\t{r.url}")
+
+
+if __name__ == "__main__":
+    main()
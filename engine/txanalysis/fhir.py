@@ -0,0 +1,112 @@
+"""
+Helpers for the FHIR bodies of a record: Parameters access the way the
+tolerances do it, and the expansion comparisons issue scripts keep redoing.
+Every helper takes parsed bodies (Record.prod / Record.dev) and treats None
+or a non-JSON body as empty.
+"""
+
+import json
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+
+def parse_body(text):
+    """The parsed JSON body, or None if text is empty or not JSON."""
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def param_value(params, name):
+    """Same as getParamValue in the tolerances: the value[x] (or resource) of the
+    first Parameters parameter called name, or None."""
+    if not isinstance(params, dict) or not params.get("parameter"):
+        return None
+    p = next((p for p in params["parameter"] if p.get("name") == name), None)
+    if not p:
+        return None
+    for key in p:
+        if key.startswith("value") or key == "resource":
+            return p[key]
+    return None
+
+
+def query_param(url, name):
+    """The first value of query parameter name in url, decoded, or None."""
+    values = parse_qs(url.partition("?")[2], keep_blank_values=True).get(name)
+    return values[0] if values else None
+
+
+def url_pattern(url):
+    """The URL without its query, plus the url or system parameter naming the
+    ValueSet / CodeSystem it is about (version dropped): what the records of
+    one terminology share."""
+    base, _, query = url.partition("?")
+    params = parse_qs(query)
+    for name in ("url", "system"):
+        if params.get(name):
+            return f"{base} {name}={params[name][0].split('|')[0]}"
+    return base
+
+
+def expansion_contains(body):
+    """Every expansion.contains entry of a ValueSet, nested ones included, in order."""
+    expansion = body.get("expansion") if isinstance(body, dict) else None
+    found = []
+    stack = list(reversed((expansion or {}).get("contains") or []))
+    while stack:
+        entry = stack.pop()
+        found.append(entry)
+        stack.extend(reversed(entry.get("contains") or []))
+    return found
+
+
+def expansion_codes(body):
+    """{"system|code": contains entry} for a ValueSet's expansion."""
+    return {f"{c.get('system')}|{c.get('code')}": c for c in expansion_contains(body)}
+
+
+class CodeSetDiff(namedtuple("CodeSetDiff", "prod_only dev_only common prod_total dev_total")):
+    """Expansion codes ("system|code", sorted) on one side only and on both, with
+    each side's expansion.total."""
+    __slots__ = ()
+
+    @property
+    def same(self):
+        return not self.prod_only and not self.dev_only
+
+
+def _total(body):
+    expansion = body.get("expansion") if isinstance(body, dict) else None
+    return (expansion or {}).get("total")
+
+
+def code_set_diff(prod, dev):
+    """CodeSetDiff of two ValueSet expansions."""
+    prod_codes = expansion_codes(prod)
+    dev_codes = expansion_codes(dev)
+    return CodeSetDiff(
+        prod_only=sorted(prod_codes.keys() - dev_codes.keys()),
+        dev_only=sorted(dev_codes.keys() - prod_codes.keys()),
+        common=sorted(prod_codes.keys() & dev_codes.keys()),
+        prod_total=_total(prod),
+        dev_total=_total(dev),
+    )
+
+
+def display_diffs(prod, dev):
+    """[(key, prod display, dev display)] where the displays differ: per code both
+    expansions contain, or the display parameter of a $lookup / $validate-code
+    Parameters (key "display")."""
+    if expansion_contains(prod) or expansion_contains(dev):
+        prod_codes = expansion_codes(prod)
+        dev_codes = expansion_codes(dev)
+        return [(key, prod_codes[key].get("display"), dev_codes[key].get("display"))
+                for key in sorted(prod_codes.keys() & dev_codes.keys())
+                if prod_codes[key].get("display") != dev_codes[key].get("display")]
+    prod_display = param_value(prod, "display")
+    dev_display = param_value(dev, "display")
+    return [("display", prod_display, dev_display)] if prod_display != dev_display else []
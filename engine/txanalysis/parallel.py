@@ -0,0 +1,33 @@
+"""
+pmap: a function over matching records on a pool of worker processes.
+
+Records travel to the workers as their raw lines and are parsed there, so
+body parsing -- the expensive part of most investigations -- is what runs in
+parallel; the filtering in records() stays in the calling process.
+"""
+
+import multiprocessing
+import os
+from itertools import islice
+
+# Records in flight per worker, so a long scan never queues the whole file
+BATCHES_PER_WORKER = 4
+
+
+def pmap(fn, records, processes=None, chunksize=16):
+    """fn(record) for each record, in order, as an iterator.
+
+    fn must be a module-level function (it is pickled by name). processes
+    defaults to one per CPU; with a single process fn runs inline."""
+    processes = processes or os.cpu_count() or 1
+    if processes < 2:
+        yield from map(fn, records)
+        return
+    records = iter(records)
+    window = processes * chunksize * BATCHES_PER_WORKER
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            batch = list(islice(records, window))
+            if not batch:
+                break
+            yield from pool.imap(fn, batch, chunksize)
@@ -0,0 +1,237 @@
+"""
+Lazy, filterable iteration over a deltas or comparison file.
+
+records() parses only the head of each line -- everything before the bodies,
+which compare.js and the capture write last -- so filtering on op, category,
+id or URL never touches a body. A Record decodes its bodies on first use:
+compact deltas are hydrated through deltas_reader.py and packed bodies come
+from the body store. With an id set, records are fetched through the file's
+ndjson_index sidecar instead of scanning.
+"""
+
+import json
+import os
+import re
+from functools import cached_property
+from urllib.parse import unquote
+
+from body_store import BODY_FIELDS, BodyStore
+from deltas_reader import DeltasReader, is_compact
+from ndjson_index import NdjsonIndex, get_operation
+from seekable_gzip import iter_lines
+
+from .fhir import param_value, parse_body, query_param, url_pattern
+
+# First body field of a line; the head is everything before it
+BODY_MARKER = b',"prodBody":'
+
+
+def deltas_path(path):
+    """path itself, or the deltas file of a job directory (or of the directory
+    holding it)."""
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, "deltas.ndjson")):
+            return os.path.join(path, "deltas.ndjson")
+        return os.path.join(path, "results", "deltas", "deltas.ndjson")
+    return path
+
+
+def parse_head(line):
+    """The record's fields outside its bodies, parsing the whole line only when
+    the bodies are not where compare.js puts them (compact deltas have none)."""
+    cut = line.find(BODY_MARKER)
+    if cut > 0:
+        try:
+            head = json.loads(line[:cut] + b"}")
+            if isinstance(head, dict) and "id" in head:
+                return head
+        except ValueError:
+            pass
+    return json.loads(line)
+
+
+class Source:
+    """The file records come from, with what its records need to get their bodies."""
+
+    def __init__(self, path):
+        self.path = path
+        self.store = BodyStore()
+        self._deltas = None
+
+    @property
+    def deltas(self):
+        if self._deltas is None:
+            self._deltas = DeltasReader(self.path)
+        return self._deltas
+
+
+# One Source per file and process, shared by its records (also in pmap workers)
+_sources = {}
+
+
+def source_for(path):
+    path = os.path.abspath(path)
+    if path not in _sources:
+        _sources[path] = Source(path)
+    return _sources[path]
+
+
+def _restore(path, line, offset):
+    return Record(source_for(path), line, offset=offset)
+
+
+class Record:
+    """One line of a deltas or comparison file.
+
+    id, url, op, category and the statuses come from the head; full,
+    prod_body / dev_body / request_body (strings) and prod / dev / request
+    (parsed, None unless JSON) are worked out on first use and cached.
+    offset is where the line starts in the (uncompressed) file. Pickles as
+    its raw line, for pmap."""
+
+    def __init__(self, source, line, head=None, offset=None):
+        self.source = source
+        self.line = line
+        self.offset = offset
+        self.head = head if head is not None else parse_head(line)
+
+    def __reduce__(self):
+        return _restore, (self.source.path, self.line, self.offset)
+
+    def __repr__(self):
+        return f"<Record {self.id} {self.op} {self.category}>"
+
+    @property
+    def id(self):
+        return self.head.get("id")
+
+    @property
+    def url(self):
+        return self.head.get("url") or ""
+
+    @property
+    def method(self):
+        return self.head.get("method")
+
+    @cached_property
+    def decoded_url(self):
+        return unquote(self.url)
+
+    @property
+    def url_pattern(self):
+        return url_pattern(self.url)
+
+    @property
+    def comparison(self):
+        return self.head.get("comparison") or {}
+
+    @property
+    def op(self):
+        return self.comparison.get("op") or get_operation(self.url)
+
+    @property
+    def category(self):
+        return self.comparison.get("category")
+
+    @property
+    def prod_status(self):
+        return (self.head.get("prod") or {}).get("status")
+
+    @property
+    def dev_status(self):
+        return (self.head.get("dev") or {}).get("status")
+
+    @cached_property
+    def full(self):
+        """The whole record, bodies as strings, as compare.js would write it in full."""
+        if is_compact(self.head):
+            return self.source.deltas.hydrate(self.head)
+        record = self.head if any(f in self.head for f in BODY_FIELDS) else json.loads(self.line)
+        return self.source.store.resolve(record)
+
+    @cached_property
+    def prod_body(self):
+        return self.full.get("prodBody")
+
+    @cached_property
+    def dev_body(self):
+        return self.full.get("devBody")
+
+    @cached_property
+    def request_body(self):
+        return self.full.get("requestBody")
+
+    @cached_property
+    def prod(self):
+        return parse_body(self.prod_body)
+
+    @cached_property
+    def dev(self):
+        return parse_body(self.dev_body)
+
+    @cached_property
+    def request(self):
+        return parse_body(self.request_body)
+
+    def param(self, name):
+        """A request parameter: from the query string, else from a POSTed Parameters body."""
+        value = query_param(self.url, name)
+        if value is None and self.method == "POST":
+            value = param_value(self.request, name)
+        return value
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    return {value} if isinstance(value, str) else set(value)
+
+
+def _lines_by_id(path, ids):
+    with NdjsonIndex.open(path) as index:
+        entries = [e for record_id in ids for e in index.lookup_all(record_id)]
+        entries.sort(key=lambda e: e["offset"])
+        for entry in entries:
+            yield entry["offset"], index.read_line(entry)
+
+
+def _lines(path):
+    offset = 0
+    for line in iter_lines(path):
+        yield offset, line
+        offset += len(line)
+
+
+def records(path, op=None, category=None, ids=None, url=None, where=None, limit=None):
+    """The records of path matching every filter given, in file order.
+
+    path is a deltas or comparison file (plain, packed or seekable gzip), or
+    a job directory for its deltas. op and category take a name or a
+    collection of names; ids a collection of record ids; url a regex searched
+    for in the percent-decoded URL; where a function of the Record, called
+    last (keep it to head fields to stay fast). limit stops after that many
+    matches."""
+    path = deltas_path(path)
+    source = source_for(path)
+    ops = _as_set(op)
+    categories = _as_set(category)
+    url_re = re.compile(url) if isinstance(url, str) else url
+    lines = _lines_by_id(path, set(ids)) if ids is not None else _lines(path)
+
+    matched = 0
+    for offset, line in lines:
+        if not line.strip():
+            continue
+        record = Record(source, line, offset=offset)
+        if ops is not None and record.op not in ops:
+            continue
+        if categories is not None and record.category not in categories:
+            continue
+        if url_re is not None and not url_re.search(record.decoded_url):
+            continue
+        if where is not None and not where(record):
+            continue
+        yield record
+        matched += 1
+        if limit is not None and matched >= limit:
+            return
@@ -74,6 +74,7 @@ const tolerances = [
     description: 'CapabilityStatement/metadata responses differ by design between implementations',
     kind: 'equiv-autofix',
     adjudication: ['jm'],
+    selector: { urlContains: '/metadata' },
     match({ record }) {
       return /\/metadata/.test(record.url) ? 'skip' : null;
     },
@@ -83,6 +84,7 @@ const tolerances = [
     description: 'Root page (/) differs by design between implementations',
     kind: 'equiv-autofix',
     adjudication: ['jm'],
+    selector: { op: 'other' },
     match({ record }) {
       return /^\/r[345]\/$/.test(record.url) ? 'skip' : null;
     },
@@ -92,6 +94,7 @@ const tolerances = [
     description: 'Static asset requests like icons differ by design',
     kind: 'equiv-autofix',
     adjudication: ['jm'],
+    selector: { urlContains: ['.png', '.ico', '.css', '.js'] },
     match({ record }) {
       return /\.(png|ico|css|js)$/.test(record.url) ? 'skip' : null;
     },
@@ -112,6 +115,7 @@ const tolerances = [
     kind: 'temp-tolerance',
     bugId: '44d1916',
     tags: ['skip', 'expand', 'too-costly', 'status-mismatch'],
+    selector: { urlContains: '$expand', status: [422, 200] },
     match({ record, prod, dev }) {
       if (!record.url.includes('$expand')) return null;
       if (record.prod.status !== 422 || record.dev.status !== 200) return null;
@@ -370,6 +374,7 @@ const tolerances = [
     adjudication: ['gg'],
     adjudicationText: 'Won\'t fix — Dev is correct',
     tags: ['normalize', 'message-format', 'batch-validate-code', 'invalid-display'],
+    selector: { urlContains: 'batch-validate-code' },
     match({ record, prod, dev }) {
       if (!record.url.includes('batch-validate-code')) return null;
       if (!prod?.parameter || !dev?.parameter) return null;
@@ -594,6 +599,7 @@ const tolerances = [
     adjudication: ['gg'],
     adjudicationText: 'Fixed — but won\'t achieve consistency with prod, since prod has the same bug (random which it chooses)',
     tags: ['normalize', 'display-text', 'snomed', 'batch-validate-code'],
+    selector: { urlContains: '$batch-validate-code' },
     match({ record, prod, dev }) {
       if (!record.url.includes('$batch-validate-code')) return null;
       if (!isParameters(prod) || !isParameters(dev)) return null;
@@ -1730,6 +1736,7 @@ const tolerances = [
     kind: 'equiv-autofix',
     adjudication: ['jm'],
     tags: ['normalize', 'expand', 'ordering'],
+    selector: { urlContains: '/ValueSet/$expand' },
     match({ record, prod, dev }) {
       if (!/\/ValueSet\/\$expand/.test(record.url)) return null;
       if (!prod?.expansion?.contains || !dev?.expansion?.contains) return null;
@@ -1800,6 +1807,7 @@ const tolerances = [
     kind: 'temp-tolerance',
     bugId: 'd45bc62',
     tags: ['skip', 'validate-code', 'status-mismatch', 'no-valueset'],
+    selector: { method: 'POST', urlContains: 'ValueSet/$validate-code', status: [200, 400] },
     match({ record, prod, dev }) {
       if (record.method !== 'POST') return null;
       if (!record.url.includes('ValueSet/$validate-code')) return null;
@@ -0,0 +1,346 @@
+#!/usr/bin/env bash
+set -uo pipefail
+
+# Parallel triage: N agent workers, each in its own git worktree, landing
+# their results on the main worktree through a serialized merge queue.
+# Implements plan-for-parallel-triage.md.
+#
+# Usage:
+#   ./prompts/parallel-triage.sh jobs/<job-name> [N]
+#
+# Environment:
+#   AGENT_CMD      command run (via bash -c) in the worker's worktree instead
+#                  of the Claude agent, e.g. a stub for local testing. It gets
+#                  TRIAGE_PROMPT, JOB_REL, ISSUE_DIR (relative to the worktree),
+#                  WORKER and BODY_STORE in its environment, and must write
+#                  $ISSUE_DIR/analysis.md to count as done.
+#   AGENT_TIMEOUT  seconds per agent run (default 1200)
+#   MAX_ATTEMPTS   agent runs per record before it is parked (default 2)
+#   BODY_STORE     body store for packed comparison files (default
+#                  jobs/.bodies of this checkout); exported to every worker
+#                  and agent, since worktrees do not have the untracked
+#                  jobs/.bodies of their own
+#
+# Each worker loops:
+#   1. claim   next-record.js --claim agent-<i> on the main worktree
+#   2. run     reset its branch agent-<i> to main, copy in the issue dir,
+#              run the agent there (comparison data is symlinked, read-only)
+#   3. land    fold the agent's work into one commit on agent-<i> containing
+#              only tolerances.js and issues/<id> (other edits, like its own
+#              compare.js output, are dropped), rebase onto main, fast-forward
+#              main, rerun compare.js --incremental and cluster-deltas.js,
+#              commit summary/progress
+#
+# Once main has fast-forwarded, the record is landed: if compare.js then
+# fails (and fails again on a full rerun), the record is not parked -- its
+# tolerance and analysis are on main -- but logged as landed-stale, and
+# deltas.ndjson stays behind until the next landing regenerates it.
+#
+# Every step that touches the main worktree (claim and land) holds one flock,
+# so merges and compare.js regenerations happen one at a time. When another
+# agent landed tolerances at the same spot, the append/append conflict in
+# tolerances.js is resolved by engine/merge-tolerances.js (keep both, verify
+# the ids); any other conflict keeps the work on branch conflict/<id> and the
+# record is parked. Parked records keep a claim owned by "parked" so no
+# picker hands them out again; release them with next-record.js --release.
+#
+# Per-record outcomes and timings go to <job>/triage-logs/parallel-stats.ndjson;
+# records/hour per worker is printed as records land and at the end.
+#
+# engine/check-parallel-triage.sh runs this script with a stub AGENT_CMD on a
+# synthetic job, covering claims, tolerance merges, conflicts and parking.
+
+TRIAGE_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+
+if [[ $# -lt 1 ]]; then
+  echo "Usage: $0 <job-directory> [num-agents]"
+  echo "Example: $0 jobs/2026-02-round-2 3"
+  exit 1
+fi
+
+JOB_REL="${1%/}"
+NUM_AGENTS="${2:-2}"
+JOB_DIR="$TRIAGE_DIR/$JOB_REL"
+AGENT_TIMEOUT="${AGENT_TIMEOUT:-1200}"
+MAX_ATTEMPTS="${MAX_ATTEMPTS:-2}"
+# body-store.js / body_store.py default to jobs/.bodies next to the engine,
+# which in a worktree is empty; point everything at this checkout's store
+export BODY_STORE="${BODY_STORE:-$TRIAGE_DIR/jobs/.bodies}"
+[[ "$BODY_STORE" == /* ]] || BODY_STORE="$PWD/$BODY_STORE"
+
+if [[ ! -d "$JOB_DIR" ]]; then
+  echo "Error: job directory not found: $JOB_DIR"
+  exit 1
+fi
+if ! command -v flock >/dev/null; then
+  echo "Error: flock(1) is required"
+  exit 1
+fi
+
+LOG_DIR="$JOB_DIR/triage-logs"
+ERROR_LOG="$JOB_DIR/triage-errors.log"
+STATS_LOG="$LOG_DIR/parallel-stats.ndjson"
+STATE_DIR="$JOB_DIR/.picker/parallel"
+MERGE_LOCK="$STATE_DIR/merge.lock"
+
+mkdir -p "$LOG_DIR" "$STATE_DIR"
+cd "$TRIAGE_DIR"
+MAIN_BRANCH="$(git rev-parse --abbrev-ref HEAD)"
+
+# Same single-instance lock as triage-loop.sh: the two must not run together
+LOCKFILE="$TRIAGE_DIR/.triage.lock"
+if [ -f "$LOCKFILE" ]; then
+  OTHER_PID=$(cat "$LOCKFILE")
+  if kill -0 "$OTHER_PID" 2>/dev/null; then
+    echo "Another loop is running (PID $OTHER_PID). Exiting."
+    exit 1
+  fi
+fi
+echo $$ > "$LOCKFILE"
+cleanup() { rm -f "$LOCKFILE"; }
+trap cleanup EXIT
+trap 'kill $(jobs -p) 2>/dev/null; exit 130' INT TERM
+
+log() {
+  echo "$(date -Is) $*" | tee -a "$ERROR_LOG"
+}
+
+# Run "$@" while holding the merge-queue lock
+locked() {
+  (
+    flock 9
+    "$@"
+  ) 9>"$MERGE_LOCK"
+}
+
+worktree_for() {
+  echo "$TRIAGE_DIR/../triage-agent-$1"
+}
+
+setup_worktree() {
+  local i=$1
+  local wt
+  wt="$(worktree_for "$i")"
+  if [[ ! -d "$wt" ]]; then
+    git worktree add -q -f "$wt" -B "agent-$i" "$MAIN_BRANCH" || return 1
+  fi
+  # Whichever forms of the comparison data the job has (plain, seekable
+  # gzip, packed); compare.js picks the same one as on the main worktree.
+  # Packed bodies are read from the main checkout's store via BODY_STORE
+  local f
+  for f in comparison.ndjson comparison.ndjson.gz comparison.packed.ndjson comparison.packed.ndjson.gz; do
+    [[ -e "$JOB_DIR/$f" ]] && ln -sfn "$JOB_DIR/$f" "$wt/$JOB_REL/$f"
+  done
+  return 0
+}
+
+park() {
+  local id=$1 reason=$2
+  # Same claim file next-record.js writes; an unknown owner is never handed out
+  printf '{"worker":"parked","reason":"%s","claimedAt":"%s"}' "$reason" "$(date -Is)" \
+    > "$JOB_DIR/.picker/claims/$id"
+}
+
+record_stat() {
+  local worker=$1 id=$2 outcome=$3 seconds=$4
+  printf '{"at":"%s","worker":"%s","recordId":"%s","outcome":"%s","seconds":%d}\n' \
+    "$(date -Is)" "$worker" "$id" "$outcome" "$seconds" >> "$STATS_LOG"
+}
+
+# records/hour for a worker since it started
+rate() {
+  local landed=$1 started=$2
+  awk -v n="$landed" -v s="$(( $(date +%s) - started ))" 'BEGIN { printf "%.1f", (s > 0 ? n * 3600 / s : 0) }'
+}
+
+# --- main-worktree steps (always called under the lock) ---
+
+claim_record() {
+  local i=$1
+  node engine/next-record.js --job "$JOB_REL" --claim "agent-$i" 2>&1
+}
+
+release_record() {
+  local id=$1
+  rm -rf "$JOB_DIR/issues/$id"
+  node engine/next-record.js --job "$JOB_REL" --release "$id" >/dev/null
+}
+
+# During a stopped rebase in worktree $1: resolve a tolerances.js conflict
+# in which main and the agent both only appended tolerances, then continue
+resolve_tolerances() {
+  local wt=$1
+  local file="$JOB_REL/tolerances.js"
+  local tmp="$STATE_DIR/merge-$$"
+  [[ "$(git -C "$wt" diff --name-only --diff-filter=U)" == "$file" ]] || return 1
+  git -C "$wt" show "REBASE_HEAD~1:$file" > "$tmp.base" &&
+    git -C "$wt" show "HEAD:$file" > "$tmp.ours" &&
+    git -C "$wt" show "REBASE_HEAD:$file" > "$tmp.theirs" &&
+    node engine/merge-tolerances.js "$wt/$file" "$tmp.base" "$tmp.ours" "$tmp.theirs" >>"$ERROR_LOG" 2>&1
+  local status=$?
+  rm -f "$tmp.base" "$tmp.ours" "$tmp.theirs"
+  [[ $status -eq 0 ]] || return 1
+  git -C "$wt" add -- "$file" && GIT_EDITOR=true git -C "$wt" rebase --continue >/dev/null 2>&1
+}
+
+land_record() {
+  local i=$1 id=$2 base=$3
+  local wt
+  wt="$(worktree_for "$i")"
+
+  # One commit with only the agent's tolerance and analysis
+  git -C "$wt" reset -q --soft "$base" && git -C "$wt" reset -q
+  git -C "$wt" add -- "$JOB_REL/tolerances.js" "$JOB_REL/issues/$id"
+  git -C "$wt" commit -q -m "Triage $id (agent-$i)" || return 1
+  git -C "$wt" checkout -q -- .
+
+  if ! git -C "$wt" -c merge.conflictStyle=diff3 rebase -q "$MAIN_BRANCH" >/dev/null 2>&1; then
+    resolve_tolerances "$wt" || { git -C "$wt" rebase --abort 2>/dev/null; return 2; }
+  fi
+
+  # The picker's untracked copy of the issue dir is in the branch now, and
+  # would block the fast-forward; keep it aside until main has the branch
+  local prepared="$STATE_DIR/landing-$i"
+  rm -rf "$prepared"
+  if [[ -e "$JOB_DIR/issues/$id" ]]; then
+    mv "$JOB_DIR/issues/$id" "$prepared" || return 1
+  fi
+  if ! git merge -q --ff-only "agent-$i"; then
+    [[ -e "$prepared" ]] && mv "$prepared" "$JOB_DIR/issues/$id"
+    return 2
+  fi
+  rm -rf "$prepared"
+  node engine/next-record.js --job "$JOB_REL" --analyzed "$id" >/dev/null
+
+  if ! node engine/compare.js --job "$JOB_REL" --incremental > "$LOG_DIR/compare-agent-$i.log" 2>&1; then
+    # One full rerun, in case the incremental cache is at fault; after that
+    # the deltas stay stale until the next landing
+    node engine/compare.js --job "$JOB_REL" >> "$LOG_DIR/compare-agent-$i.log" 2>&1 || {
+      touch "$STATE_DIR/deltas-stale"
+      return 3
+    }
+  fi
+  rm -f "$STATE_DIR/deltas-stale"
+  # Regroup once here, so the next claims do not each find clusters.json stale
+  node engine/cluster-deltas.js --job "$JOB_REL" --top 0 >> "$LOG_DIR/compare-agent-$i.log" 2>&1
+  git add -- "$JOB_REL/results/summary.json" "$JOB_REL/progress.ndjson"
+  git commit -q -m "Parallel triage: land $id (agent-$i), $(wc -l < "$JOB_DIR/results/deltas/deltas.ndjson") deltas" \
+    2>/dev/null || true
+}
+
+# --- worker loop ---
+
+run_agent() {
+  local i=$1 issue_rel=$2 log_file=$3
+  local wt prompt
+  wt="$(worktree_for "$i")"
+  prompt="$(cat "$TRIAGE_DIR/prompts/triage-prompt.md")
+
+Job directory: $JOB_REL. Issue directory: $wt/$issue_rel"
+  if [[ -n "${AGENT_CMD:-}" ]]; then
+    (cd "$wt" && TRIAGE_PROMPT="$prompt" JOB_REL="$JOB_REL" ISSUE_DIR="$issue_rel" WORKER="agent-$i" \
+      BODY_STORE="$BODY_STORE" timeout "$AGENT_TIMEOUT" bash -c "$AGENT_CMD") > "$log_file" 2>&1
+  else
+    (cd "$wt" && BODY_STORE="$BODY_STORE" timeout "$AGENT_TIMEOUT" claude -p --dangerously-skip-permissions --model opus \
+      "$prompt") > "$log_file" 2>&1
+  fi
+}
+
+worker_loop() {
+  local i=$1
+  local wt started landed=0 failed=0 round=0
+  wt="$(worktree_for "$i")"
+  started=$(date +%s)
+
+  while true; do
+    local output id issue_rel base t0 exit_code attempts
+    output=$(locked claim_record "$i") || {
+      log "agent-$i: no more records ($(echo "$output" | tail -1))"
+      break
+    }
+    id=$(echo "$output" | grep '^Record ID:' | sed 's/^Record ID: //')
+    issue_rel="$JOB_REL/issues/$id"
+    round=$((round + 1))
+    t0=$(date +%s)
+    log "agent-$i round $round: $id ($(echo "$output" | head -1))"
+
+    # Fresh branch from main with the prepared issue dir copied in
+    base=$(git rev-parse "$MAIN_BRANCH")
+    git -C "$wt" checkout -q -f -B "agent-$i" "$base"
+    git -C "$wt" clean -qfd -- "$JOB_REL/issues"
+    mkdir -p "$wt/$JOB_REL/issues"
+    cp -r "$JOB_DIR/issues/$id" "$wt/$JOB_REL/issues/"
+
+    run_agent "$i" "$issue_rel" "$LOG_DIR/agent-$i-round-$(printf '%04d' "$round").log"
+    exit_code=$?
+
+    if [[ ! -f "$wt/$issue_rel/analysis.md" ]]; then
+      failed=$((failed + 1))
+      attempts=$(( $(cat "$STATE_DIR/attempts-$id" 2>/dev/null || echo 0) + 1 ))
+      echo "$attempts" > "$STATE_DIR/attempts-$id"
+      record_stat "agent-$i" "$id" "failed" $(( $(date +%s) - t0 ))
+      if [[ "$attempts" -ge "$MAX_ATTEMPTS" ]]; then
+        log "agent-$i failed on $id (exit=$exit_code, attempt $attempts), parking it"
+        park "$id" "failed $attempts times"
+      else
+        log "agent-$i failed on $id (exit=$exit_code, attempt $attempts), releasing it"
+        locked release_record "$id"
+      fi
+      continue
+    fi
+
+    locked land_record "$i" "$id" "$base"
+    case $? in
+      0)
+        landed=$((landed + 1))
+        record_stat "agent-$i" "$id" "landed" $(( $(date +%s) - t0 ))
+        log "agent-$i landed $id in $(( $(date +%s) - t0 ))s ($landed landed, $(rate "$landed" "$started") records/h)"
+        ;;
+      2)
+        failed=$((failed + 1))
+        # Record ids contain ':', which git does not allow in branch names
+        git branch -f "conflict/${id//:/_}" "agent-$i" 2>/dev/null
+        park "$id" "merge conflict"
+        record_stat "agent-$i" "$id" "conflict" $(( $(date +%s) - t0 ))
+        log "agent-$i: $id does not merge cleanly with main; work kept on branch conflict/${id//:/_}, record parked"
+        ;;
+      3)
+        # On main already, so it must not be handed out again
+        landed=$((landed + 1))
+        record_stat "agent-$i" "$id" "landed-stale" $(( $(date +%s) - t0 ))
+        log "agent-$i landed $id, but compare.js failed afterwards (see $LOG_DIR/compare-agent-$i.log); deltas.ndjson is stale until the next landing"
+        ;;
+      *)
+        failed=$((failed + 1))
+        park "$id" "landing failed"
+        record_stat "agent-$i" "$id" "land-failed" $(( $(date +%s) - t0 ))
+        log "agent-$i: landing $id failed before it reached $MAIN_BRANCH, record parked"
+        ;;
+    esac
+  done
+
+  echo "agent-$i: $landed landed, $failed failed, $(rate "$landed" "$started") records/h" > "$STATE_DIR/summary-$i"
+}
+
+# --- main ---
+
+for i in $(seq 1 "$NUM_AGENTS"); do
+  setup_worktree "$i" || { echo "Could not set up worktree for agent-$i"; exit 1; }
+done
+log "parallel triage: $NUM_AGENTS agent(s) on $JOB_REL (main branch: $MAIN_BRANCH)"
+# next-record.js only reads clusters.json; build it once before any claim
+node engine/cluster-deltas.js --job "$JOB_REL" --top 0 --if-stale >> "$ERROR_LOG" 2>&1
+
+for i in $(seq 1 "$NUM_AGENTS"); do
+  rm -f "$STATE_DIR/summary-$i"
+  worker_loop "$i" &
+done
+wait
+
+echo "=== Parallel triage complete ==="
+for i in $(seq 1 "$NUM_AGENTS"); do
+  cat "$STATE_DIR/summary-$i" 2>/dev/null | tee -a "$ERROR_LOG"
+done
+if [[ -e "$STATE_DIR/deltas-stale" ]]; then
+  log "compare.js failed after the last landing; rerun node engine/compare.js --job $JOB_REL"
+fi
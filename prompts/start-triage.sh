@@ -14,8 +14,10 @@ set -euo pipefail
 #   2. Snapshot all git-bugs to the most recent previous job's bugs/ dir
 #   3. Create jobs/<job-name>/
 #   4. Copy baseline tolerances into the job dir
-#   5. Copy (or symlink) comparison.ndjson into the job dir
-#   6. Run compare.js to produce fresh deltas.ndjson
+#   5. Copy (or symlink) comparison.ndjson into the job dir (a seekable
+#      comparison.ndjson.gz from engine/seekable-gzip.js is copied as is)
+#   6. Run compare.js to produce fresh deltas.ndjson, and cluster-deltas.js
+#      to group it for the picker
 #   7. Commit the clean starting state
 #
 # Bugs are NEVER cleared between rounds. Each bug gets a round: label
@@ -96,7 +98,12 @@ cp baseline/tolerances.js "$JOB_DIR/tolerances.js"
 if [[ $# -ge 2 ]]; then
   INPUT_FILE="$2"
   echo "5. Copying comparison data from $INPUT_FILE..."
-  cp "$INPUT_FILE" "$JOB_DIR/comparison.ndjson"
+  if [[ "$INPUT_FILE" == *.gz ]]; then
+    # Seekable gzip (engine/seekable-gzip.js); every tool reads it in place
+    cp "$INPUT_FILE" "$JOB_DIR/comparison.ndjson.gz"
+  else
+    cp "$INPUT_FILE" "$JOB_DIR/comparison.ndjson"
+  fi
 elif [[ -f "$TRIAGE_DIR/comparison.ndjson" ]]; then
   echo "5. Copying comparison data from existing comparison.ndjson..."
   cp "$TRIAGE_DIR/comparison.ndjson" "$JOB_DIR/comparison.ndjson"
@@ -108,6 +115,7 @@ fi
 # 6. Run compare.js
 echo "6. Running compare.js..."
 node engine/compare.js --job "jobs/$JOB_NAME"
+node engine/cluster-deltas.js --job "jobs/$JOB_NAME" --top 0
 
 echo ""
 echo "7. Committing clean starting state..."
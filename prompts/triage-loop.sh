@@ -46,6 +46,10 @@ ROUND=${ROUND:-0}
 while true; do
   ROUND=$((ROUND + 1))
 
+  # The last round's compare.js run left clusters.json stale; the picker
+  # only reads it, so regroup the deltas first
+  node "$TRIAGE_DIR/engine/cluster-deltas.js" --job "$1" --top 0 --if-stale >/dev/null
+
   # Pick next un-analyzed record (creates issue dir)
   PICKER_OUTPUT=$(node "$TRIAGE_DIR/engine/next-record.js" --job "$1" 2>&1)
   PICKER_EXIT=$?
@@ -58,6 +62,7 @@ while true; do
   # Extract counts and issue dir from picker output
   COUNTS_LINE=$(echo "$PICKER_OUTPUT" | head -1)
   ISSUE_DIR=$(echo "$PICKER_OUTPUT" | grep '^Issue dir:' | sed 's/^Issue dir: //')
+  RECORD_ID=$(echo "$PICKER_OUTPUT" | grep '^Record ID:' | sed 's/^Record ID: //')
   echo "$(date -Is) round $ROUND: $COUNTS_LINE (dir: $ISSUE_DIR)" | tee -a "$ERROR_LOG"
 
   OUT_LOG="$LOG_DIR/round-$(printf '%04d' $ROUND).log"
@@ -79,6 +84,11 @@ Job directory: $1. Issue directory: $ISSUE_DIR" \
 
   echo "$(date -Is) round $ROUND finished, exit=$CLAUDE_EXIT" >> "$ERROR_LOG"
 
+  # The picker does not look for new analysis.md files itself
+  if [[ -f "$ISSUE_DIR/analysis.md" ]]; then
+    node "$TRIAGE_DIR/engine/next-record.js" --job "$1" --analyzed "$RECORD_ID" >/dev/null
+  fi
+
   # Commit any changes from this round
   cd "$TRIAGE_DIR"
   if ! git diff --quiet 2>/dev/null || ! git diff --cached --quiet 2>/dev/null; then
@@ -97,7 +107,7 @@ EOF
     BUG_COUNT=$(git-bug bug 2>/dev/null | wc -l || echo 0)
     if [[ "$BUG_COUNT" -gt 0 ]]; then
       bash "$TRIAGE_DIR/engine/dump-bugs.sh" "$BUGS_DIR/bugs.md" 2>/dev/null
-      python3 "$TRIAGE_DIR/engine/dump-bugs-html.py" "$BUGS_DIR/bugs.html" --job "$JOB_DIR" 2>/dev/null
+      python3 "$TRIAGE_DIR/engine/dump-bugs-html.py" "$BUGS_DIR/bugs.html" --job "$JOB_DIR" --if-changed 2>/dev/null
       git-bug bug -l tx-compare -f json > "$BUGS_DIR/bugs.json" 2>/dev/null || true
     fi
   fi